@@ -83,55 +83,64 @@ def join(ctrlr) -> str:
     # Note that pokemon_list contains preconfigured Pokemon objects with types,
     # abilities, stats, moves, et cetera.
     pokemon_list = ctrlr.read_selectable_pokemon('join')
-    pokemon_scores = []
+    name_ids = [pokemon.name_id for pokemon in pokemon_list]
 
     # Then, assign a score to each of the Pokemon based on how it is estimated
     # to perform against the minibosses (other rental Pokemon) and the final
     # boss.
-    for pokemon in pokemon_list:
-        name_id = pokemon.name_id
-        # Consider the amount of remaining minibosses when scoring each rental
-        # Pokemon, at the start of the run, there are 3 minibosses and 1 final
-        # boss. We weigh the boss more heavily because it is more difficult
-        # than the other bosses.
-        rental_weight = 3
-        boss_weight = 2
-        score = matchup_scoring.get_weighted_score(
-            run.rental_scores[name_id], rental_weight,
-            run.boss_matchups[name_id][ctrlr.boss], boss_weight
-        )
-        pokemon_scores.append(score)
+    # Consider the amount of remaining minibosses when scoring each rental
+    # Pokemon, at the start of the run, there are 3 minibosses and 1 final
+    # boss. We weigh the boss more heavily because it is more difficult than
+    # the other bosses.
+    rental_weight = 3
+    boss_weight = 2
+    pokemon_scores = run.boss_matchups.get_weighted_scores(
+        ctrlr.boss, run.rental_score_array, rental_weight, boss_weight,
+        name_ids
+    )
+    for name_id, score in zip(name_ids, pokemon_scores):
         ctrlr.log(f'Score for {name_id}: {score:.2f}', 'DEBUG')
-    selection_index = pokemon_scores.index(max(pokemon_scores))
+    selection_index = int(pokemon_scores.argmax())
     for __ in range(selection_index):
         ctrlr.push_button(b'v', 1)
     run.pokemon = pokemon_list[selection_index]
-    ctrlr.push_button(b'a', 22 + VIDEO_EXTRA_DELAY)
-
-    # Read the path.
-    ctrlr.read_path_information(1)
-    ctrlr.push_button(b'8', 2 + VIDEO_EXTRA_DELAY, 0.65)
-    ctrlr.read_path_information(2)
+    # Continue as soon as the path is shown, falling back on the old fixed
+    # delay. The icons are checked twice in case the screen is fading in.
+    ctrlr.push_button(b'a', 1)
+    ctrlr.wait_until(
+        ctrlr.is_path_screen_visible, 21 + VIDEO_EXTRA_DELAY, 0.5,
+        'path screen', confirmations=2)
+
+    # Read the path. The first two stages are identified in the background
+    # while the view scrolls to the next stage.
+    for stage_index in (1, 2):
+        path_task = ctrlr.submit_task(
+            ctrlr.identify_path_types, stage_index, ctrlr.get_frame())
+        ctrlr.push_button(b'8', 2 + VIDEO_EXTRA_DELAY, 0.65)
+        run.update_paths(
+            ctrlr.collect_task(path_task, f'path stage {stage_index}'),
+            stage_index)
     ctrlr.log(f'Path type identified as: {run.path_type}')
-    ctrlr.push_button(b'8', 2 + VIDEO_EXTRA_DELAY, 0.65)
     ctrlr.read_path_information(3)
     ctrlr.log(str(run), 'DEBUG')
     all_paths_str = run.get_paths(truncate=True, name_only=True)
     print(all_paths_str)
 
-    # Choose the best path out of the options.
-    # TODO: Improve path selection algorithm.
-    best_path_index, target_path_str, score_list = run.path_tree.get_best_path(
-        run.boss, all_paths_str
-    )
+    # Score the paths for reference, then choose the best path taking into
+    # account the Pokemon we could catch along the way. The path is re-planned
+    # at every fork.
+    __, __, score_list = run.path_tree.get_best_path(run.boss, all_paths_str)
     for i, path_str in enumerate(all_paths_str):
         ctrlr.log(
             f'Path at index {i} has score: {score_list[i]:.3f} and sequence: '
             f'{path_str}', 'DEBUG')
-    run.target_path = run.get_paths()[best_path_index]
+    win_probability = run.plan_path()
+    target_path_str = [
+        str(node) for node in run.target_path
+        if node.name not in ('START', run.boss)]
     ctrlr.log(
-        f'Target path at index {best_path_index} selected with score '
-        f'{score_list[best_path_index]:.3f}: {target_path_str}.')
+        f'Target path selected with estimated win probability '
+        f'{win_probability:.3f}: {target_path_str}.')
     ctrlr.log('Finished joining.', 'DEBUG')
     return 'path'
 
@@ -140,6 +149,12 @@ def path(ctrlr) -> str:
     """Choose a path to follow."""
     run = ctrlr.current_run
     ctrlr.log('Choosing a path to follow.', 'DEBUG')
+    # Re-plan the rest of the path since our Pokemon and lives may have
+    # changed since the last fork.
+    win_probability = run.plan_path()
+    ctrlr.log(
+        f'Estimated win probability from here: {win_probability:.3f}.',
+        'DEBUG')
     # Check what direction the target path is.
     offset = run.get_next_fork_offset()
     # Then, move the cursor onto that boss and select it.
@@ -147,6 +162,9 @@ def path(ctrlr) -> str:
         ctrlr.push_button(b'>', 1)
     ctrlr.push_button(b'a', 4 + VIDEO_EXTRA_DELAY)
     run.advance_node()
+    # Choose moves against the Pokemon that could be fought at this node
+    # while the bot walks to it.
+    ctrlr.start_opponent_precompute()
     ctrlr.log(
         f'Chose path with index {offset} from the left, towards type '
         f'{run.current_node.name}.', 'DEBUG')
@@ -175,7 +193,12 @@ def battle(ctrlr) -> str:
     """Choose moves during a battle and detect whether the battle has ended."""
     run = ctrlr.current_run
     ctrlr.log(f'Battle {run.num_caught+1} starting.')
-    ctrlr.push_button(None, 12)
+    ctrlr.move_cache.reset_stats()
+    if run.data.move_policy is not None:
+        run.data.move_policy.reset_stats()
+    # Wait for the first menu, since the black screen at the start of the
+    # battle would otherwise be mistaken for a loss.
+    ctrlr.wait_until(ctrlr.is_fight_menu_visible, 12, name='battle start')
     # Loop continuously until an event that ends the battle is detected.
     # The battle ends either in victory (signalled by the catch screen)
     # or in defeat (signalled by the screen going completely black).
@@ -188,6 +211,7 @@ def battle(ctrlr) -> str:
         # Check the text for key phrases that inform the bot what to do next.
         if battle_state == 'CATCH':
             ctrlr.log('Battle finished.', 'DEBUG')
+            log_move_cache_stats(ctrlr)
             run.reset_stage()
             return 'catch'
         elif battle_state == 'FAINT':
@@ -196,6 +220,7 @@ def battle(ctrlr) -> str:
             ctrlr.push_button(None, 4)
         elif battle_state == 'LOSS':
             ctrlr.log('You lose and the battle is finished.')
+            log_move_cache_stats(ctrlr)
             run.lives -= 1
             if run.lives != 0:
                 ctrlr.log('The lives counter was not 0.', 'WARNING')
@@ -215,8 +240,12 @@ def battle(ctrlr) -> str:
             # our current pokemon is, so check it first.
             if run.pokemon is None:
                 ctrlr.push_buttons((b'y', 1), (b'a', 1 + VIDEO_EXTRA_DELAY))
-                run.pokemon = ctrlr.read_selectable_pokemon('battle')[0]
+                # Read the Pokemon while backing out of the menu.
+                pokemon_task = ctrlr.submit_task(
+                    ctrlr.read_selectable_pokemon, 'battle',
+                    ctrlr.get_frame(), release_lock=False)
                 ctrlr.push_buttons((b'b', 1), (b'b', 1.5), (b'b', 2))
+                run.pokemon = ctrlr.collect_task(pokemon_task, 'pokemon')[0]
                 ctrlr.log(
                     f'Received {run.pokemon.name_id} from the scientist.')
 
@@ -226,15 +255,37 @@ def battle(ctrlr) -> str:
                 # If we have defeated three oppoenents already we know the
                 # opponent is the boss Pokemon.
                 if run.num_caught == 3:
-                    run.opponent = run.boss_pokemon[BOSS]
+                    run.opponent = run.get_boss_pokemon(BOSS)
 
-                # Otherwise, we identify the boss using its name and types.
+                # Otherwise, we identify the boss from its name plate if it
+                # was seen before. The type of the node narrows down which
+                # Pokemon it can be.
                 else:
-                    #
-                    ctrlr.push_buttons(
-                        (b'y', 1), (b'a', 1), (b'l', 3 + VIDEO_EXTRA_DELAY))
-                    run.opponent = ctrlr.read_selectable_pokemon('battle')[0]
-                    ctrlr.push_buttons((b'b', 1), (b'b', 1.5), (b'b', 2))
+                    candidates = run.get_opponent_candidates()
+                    plate_frame = ctrlr.get_frame()
+                    run.opponent = ctrlr.identify_opponent_by_name_plate(
+                        plate_frame, candidates)
+                    if run.opponent is not None:
+                        ctrlr.log(
+                            f'Identified {run.opponent.name_id} from its '
+                            'name plate.', 'DEBUG')
+                    # If it wasn't, identify it using its name and types.
+                    else:
+                        ctrlr.push_buttons(
+                            (b'y', 1), (b'a', 1),
+                            (b'l', 3 + VIDEO_EXTRA_DELAY))
+                        # Read the opponent while backing out of the menu.
+                        summary_frame = ctrlr.get_frame()
+                        opponent_task = ctrlr.submit_task(
+                            ctrlr.read_selectable_pokemon, 'battle',
+                            summary_frame, release_lock=False,
+                            candidates=candidates)
+                        ctrlr.push_buttons((b'b', 1), (b'b', 1.5), (b'b', 2))
+                        run.opponent = ctrlr.collect_task(
+                            opponent_task, 'opponent')[0]
+                        ctrlr.learn_name_plate(
+                            plate_frame, summary_frame, run.opponent)
+                    ctrlr.finish_opponent_precompute()
 
                     if run.opponent.name_id == 'ditto':
                         if run.current_node.name != 'normal':
@@ -284,15 +335,13 @@ def battle(ctrlr) -> str:
             # TODO: use the actual teammates instead of the average of all
             # rental Pokemon.
             best_move_index, __, best_move_score = (
-                matchup_scoring.select_best_move(
-                    run.pokemon, run.opponent, teammates=run.rental_pokemon)
+                ctrlr.select_best_move(run.pokemon, run.opponent)
             )
             if run.dynamax_available:
                 default_score = best_move_score
                 run.pokemon.dynamax = True  # Temporary
                 best_max_move_index, __, best_dmax_move_score = (
-                    matchup_scoring.select_best_move(
-                        run.pokemon, run.opponent, run.rental_pokemon)
+                    ctrlr.select_best_move(run.pokemon, run.opponent)
                 )
                 if best_dmax_move_score > default_score:
                     best_move_index = best_max_move_index
@@ -337,6 +386,91 @@ def battle(ctrlr) -> str:
             ctrlr.push_button(b'b', 0.1)
 
 
+def log_move_cache_stats(ctrlr) -> None:
+    """Log how often move decisions were reused during the last battle."""
+    move_policy = ctrlr.current_run.data.move_policy
+    if move_policy is not None:
+        ctrlr.log(
+            f'Move decisions looked up {move_policy.hits} times and not '
+            f'found {move_policy.misses} times.', 'DEBUG')
+    stats = ctrlr.move_cache.get_stats()
+    ctrlr.log(
+        f'Move decisions reused {stats["hits"]} times and computed '
+        f'{stats["misses"]} times (hit rate {stats["hit_rate"]:.0%}, about '
+        f'{stats["time_saved"] * 1000:.1f} ms saved).', 'DEBUG')
+
+
+def log_wait_stats(ctrlr) -> None:
+    """Log how much time waiting for screens saved during the last run, then
+    clear the statistics.
+    """
+
+    total_saved = 0.0
+    for name, stats in ctrlr.get_wait_stats().items():
+        total_saved += stats['saved']
+        ctrlr.log(
+            f'Waited for {name} {stats["count"]} times ({stats["timeouts"]} '
+            f'timed out) for {stats["waited"]:.1f} s in total, saving '
+            f'{stats["saved"]:.1f} s.', 'DEBUG')
+    ctrlr.log(f'Waiting for screens saved {total_saved:.1f} s this run.')
+    ctrlr.reset_wait_stats()
+
+
+def log_task_stats(ctrlr) -> None:
+    """Log how much time background tasks saved in each stage during the
+    last run, then clear the statistics.
+    """
+
+    for stage, stats in ctrlr.get_task_stats().items():
+        ctrlr.log(
+            f'Background tasks in stage {stage} ran {stats["count"]} times '
+            f'for {stats["run_time"]:.2f} s, saving {stats["saved"]:.2f} s.',
+            'DEBUG')
+    ctrlr.reset_task_stats()
+
+
+def log_change_detector_stats(ctrlr) -> None:
+    """Log how many checks were skipped because the screen hadn't changed
+    during the last run, then clear the statistics.
+    """
+
+    for key, (evaluated, skipped) in ctrlr.change_detector.get_stats().items():
+        total = evaluated + skipped
+        ctrlr.log(
+            f'Checked {key} {evaluated} times and skipped it {skipped} times '
+            f'because the screen was unchanged ({skipped / total:.0%} '
+            'skipped).', 'DEBUG')
+    ctrlr.change_detector.reset_stats()
+
+
+def log_ocr_cache_stats(ctrlr) -> None:
+    """Log how often cached text was reused during the last run."""
+    stats = ctrlr.ocr_cache.get_stats()
+    ctrlr.log(
+        f'Reused cached text {stats["hits"]} times and read new text '
+        f'{stats["misses"]} times (hit rate {stats["hit_rate"]:.0%}, '
+        f'{stats["size"]} cached entries).', 'DEBUG')
+    ctrlr.ocr_cache.reset_stats()
+
+
+def score_current_pokemon(
+    ctrlr, rental_weight: float, boss_weight: float = 2
+) -> float:
+    """Return the weighted score of the current Pokemon against the
+    remaining minibosses and the final boss.
+    """
+
+    run = ctrlr.current_run
+    # TODO: actually read the current Pokemon's health so the bot can
+    # decide to switch if it's low.
+    return matchup_scoring.get_weighted_score(
+        run.rental_scores[run.pokemon.name_id], rental_weight,
+        matchup_scoring.evaluate_matchup(
+            run.pokemon, run.get_boss_pokemon(ctrlr.boss), run.teammates
+        ), boss_weight
+    ) * run.HP
+
+
 def catch(ctrlr) -> str:
     """Catch each boss after defeating it."""
     run = ctrlr.current_run
@@ -361,7 +495,23 @@ def catch(ctrlr) -> str:
            and ctrlr.get_target_ball() not in ctrlr.check_ball()
            ):
         ctrlr.push_button(b'<', 2 + VIDEO_EXTRA_DELAY)
-    ctrlr.push_button(b'a', 30)
+    # Check the ball count shown in the bag if it can be read without
+    # Tesseract.
+    if ctrlr.digit_recognizer is not None:
+        ctrlr.verify_ball_count()
+    if run.num_caught < 3:
+        # Score the current Pokemon while the ball is thrown, since its score
+        # doesn't depend on the catch. One fewer miniboss will remain.
+        existing_score_task = ctrlr.submit_task(
+            score_current_pokemon, ctrlr, 3 - (run.num_caught + 1))
+        # Continue as soon as the caught Pokemon's summary can be read. The
+        # name read by the predicate confirms the summary, so a single
+        # passing frame is enough.
+        ctrlr.push_button(b'a', 1)
+        ctrlr.wait_until(
+            ctrlr.is_caught_pokemon_visible, 29, 0.5, 'caught Pokemon')
+    else:
+        ctrlr.push_button(b'a', 30)
     ctrlr.record_ball_use()
 
     # If the caught Pokemon was not the final boss, check out the Pokemon and
@@ -379,18 +529,12 @@ def catch(ctrlr) -> str:
         rental_weight = 3 - run.num_caught
         boss_weight = 2
         # Calculate scores for the new and existing Pokemon.
-        # TODO: actually read the current Pokemon's health so the bot can
-        # decide to switch if it's low.
-        score = matchup_scoring.get_weighted_score(
-            run.rental_scores[pokemon.name_id], rental_weight,
-            run.boss_matchups[pokemon.name_id][ctrlr.boss], boss_weight
-        )
-        existing_score = matchup_scoring.get_weighted_score(
-            run.rental_scores[run.pokemon.name_id], rental_weight,
-            matchup_scoring.evaluate_matchup(
-                run.pokemon, run.boss_pokemon[ctrlr.boss], run.rental_pokemon
-            ), boss_weight
-        ) * run.HP
+        score = float(run.boss_matchups.get_weighted_scores(
+            ctrlr.boss, run.rental_score_array, rental_weight, boss_weight,
+            [pokemon.name_id]
+        )[0])
+        existing_score = ctrlr.collect_task(
+            existing_score_task, 'existing score')
         ctrlr.log(f'Score for {pokemon.name_id}: {score:.2f}', 'DEBUG')
         ctrlr.log(
             f'Score for {run.pokemon.name_id}: {existing_score:.2f}', 'DEBUG'
@@ -430,16 +574,15 @@ def backpacker(ctrlr) -> str:
 
     ctrlr.log("Reading the backpacker's items.")
 
-    items = []
     frame = ctrlr.get_frame()
-    for rect in (
-        ctrlr.item_rect_1, ctrlr.item_rect_2, ctrlr.item_rect_3,
-        ctrlr.item_rect_4, ctrlr.item_rect_5
-    ):
-        item = ctrlr.read_text(
-            frame, rect, threshold=False, invert=False,
-            segmentation_mode='--psm 7').strip()
-        items.append(item)
+    items = ctrlr.read_texts(frame, [
+        (rect, {
+            'threshold': False, 'invert': False,
+            'segmentation_mode': '--psm 7'})
+        for rect in (
+            ctrlr.item_rect_1, ctrlr.item_rect_2, ctrlr.item_rect_3,
+            ctrlr.item_rect_4, ctrlr.item_rect_5)], stack=True)
+    for item in items:
         ctrlr.log(f'Detected item: {item}', 'DEBUG')
 
     # Note: a long delay is required here so the bot doesn't think a battle
@@ -465,23 +608,14 @@ def scientist(ctrlr) -> str:
         boss_weight = 2
 
         # Calculate scores for an average and existing Pokemon.
-        pokemon_scores = []
-        for name_id in run.rental_pokemon:
-            score = matchup_scoring.get_weighted_score(
-                run.rental_scores[name_id], rental_weight,
-                run.boss_matchups[name_id][ctrlr.boss], boss_weight
-            )
-            pokemon_scores.append(score)
-        average_score = sum(pokemon_scores) / len(pokemon_scores)
-
-        # TODO: actually read the current Pokemon's health so the bot can
-        # decide to switch if it's low.
-        existing_score = matchup_scoring.get_weighted_score(
-            run.rental_scores[run.pokemon.name_id], rental_weight,
-            matchup_scoring.evaluate_matchup(
-                run.pokemon, run.boss_pokemon[ctrlr.boss], run.rental_pokemon
-            ), boss_weight
-        ) * run.HP
+        pokemon_scores = run.boss_matchups.get_weighted_scores(
+            ctrlr.boss, run.rental_score_array, rental_weight, boss_weight,
+            list(run.rental_pokemon)
+        )
+        average_score = float(pokemon_scores.mean())
+
+        existing_score = score_current_pokemon(
+            ctrlr, rental_weight, boss_weight)
         ctrlr.log(f'Score for average pokemon: {average_score:.2f}', 'DEBUG')
         ctrlr.log(
             f'Score for {run.pokemon.name_id}: {existing_score:.2f}', 'DEBUG')
@@ -511,6 +645,10 @@ def select_pokemon(ctrlr) -> str:
     """
 
     run = ctrlr.current_run
+    log_wait_stats(ctrlr)
+    log_task_stats(ctrlr)
+    log_change_detector_stats(ctrlr)
+    log_ocr_cache_stats(ctrlr)
     # If the bot lost against the first boss, skip the checking process since
     # there are no Pokemon to check.
     if run.num_caught == 0:
@@ -0,0 +1,362 @@
+"""Compact binary storage for the precalculated Pokemon data.
+
+The jsonpickle files in `data` are slow to decode because they describe full
+object graphs. `scripts/export_binary_data.py` flattens them into a single
+uncompressed NumPy archive laid out as a struct of arrays: numeric fields
+(stats, type codes, move parameters, matchup matrices) are stored as arrays
+and all text is stored once in a shared UTF-8 string table. The archive is
+memory-mapped rather than read, and `Pokemon` and `Move` objects are only
+built when they are first accessed.
+"""
+
+import hashlib
+import math
+import mmap
+import struct
+import zipfile
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from automaxlair.matchup_scoring import TYPE_CODES, TYPE_IDS
+from automaxlair.matchup_table import MatchupTable
+from automaxlair.pokemon_classes import Move, Pokemon
+
+FORMAT_VERSION = 3
+CATEGORIES = ('physical', 'special', 'status')
+# Order of the jsonpickle source files, matching the data paths in the config.
+# The path tree is already stored as arrays, so it is loaded from its own file.
+SOURCE_NAMES = (
+    'boss_pokemon', 'rental_pokemon', 'boss_matchups', 'rental_matchups',
+    'rental_scores')
+
+
+def hash_source_file(file_path: str) -> str:
+    """Return a hash of a source file that ignores line ending changes."""
+    with open(file_path, 'rb') as file:
+        contents = file.read().replace(b'\r\n', b'\n')
+    return hashlib.sha1(contents).hexdigest()
+
+
+def map_npz(file_path: str) -> Dict[str, np.ndarray]:
+    """Return read-only arrays backed by a memory map of an uncompressed .npz
+    file, the equivalent of np.load(mmap_mode='r') for a single .npy file.
+    Pages of the file are only read when the arrays are accessed.
+    """
+
+    arrays = {}
+    with open(file_path, 'rb') as file, zipfile.ZipFile(file) as archive:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(
+                    f'{info.filename} is compressed in {file_path}.')
+            # The array starts after the local file header, whose name and
+            # extra fields can differ in length from the central directory.
+            file.seek(info.header_offset)
+            name_length, extra_length = struct.unpack(
+                '<HH', file.read(30)[26:30])
+            file.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(file)
+            else:
+                header = np.lib.format.read_array_header_2_0(file)
+            shape, fortran_order, dtype = header
+            if dtype.hasobject:
+                raise ValueError(
+                    f'{info.filename} in {file_path} contains objects.')
+            arrays[info.filename[:-len('.npy')]] = np.ndarray(
+                shape, dtype, buffer, file.tell(),
+                order='F' if fortran_order else 'C')
+    return arrays
+
+
+class BinaryDataWriter:
+    """Flatten decoded Pokemon data into arrays and save them to disk."""
+
+    def __init__(self) -> None:
+        self.strings: List[str] = []
+        self.string_indices: Dict[str, int] = {}
+        self.languages: List[str] = []
+        self.translations: List[Dict[str, str]] = []
+        self.moves: List[tuple] = []
+        self.move_indices: Dict[tuple, int] = {}
+        self.arrays: Dict[str, np.ndarray] = {}
+
+    def add_string(self, text: Optional[str]) -> int:
+        """Return the index of a string in the string table."""
+        if text is None:
+            return -1
+        if text not in self.string_indices:
+            self.string_indices[text] = len(self.strings)
+            self.strings.append(text)
+        return self.string_indices[text]
+
+    def add_translation(self, names: Dict[str, str]) -> int:
+        """Return the row of a dict of translations in the translation
+        table.
+        """
+
+        for language in names:
+            if language not in self.languages:
+                self.languages.append(language)
+        self.translations.append(names)
+        return len(self.translations) - 1
+
+    def add_move(self, move: Move) -> int:
+        """Return the row of a move in the move table, adding it if an
+        identical move was not already stored.
+        """
+
+        key = (
+            move.id_num, move.name_id, tuple(move.names.items()),
+            move.type_id, move.category, move.base_power, move.accuracy,
+            move.PP, move.effect, move.probability, move.is_spread,
+            move.correction_factor)
+        if key not in self.move_indices:
+            self.move_indices[key] = len(self.moves)
+            self.moves.append((
+                move.id_num, self.add_string(move.name_id),
+                self.add_translation(move.names), TYPE_CODES[move.type_id],
+                CATEGORIES.index(move.category), move.base_power,
+                move.accuracy, move.PP, self.add_string(move.effect),
+                math.nan if move.probability is None else move.probability,
+                move.is_spread, move.correction_factor))
+        return self.move_indices[key]
+
+    def add_pokemon(self, prefix: str, pokemon: Dict[str, Pokemon]) -> None:
+        """Store a group of Pokemon as arrays whose names start with the
+        supplied prefix.
+        """
+
+        members = list(pokemon.values())
+        num_pokemon = len(members)
+        num_moves = max((len(member.moves) for member in members), default=0)
+        int_fields = {
+            'id_num': np.zeros(num_pokemon, dtype=np.int32),
+            'name_id': np.zeros(num_pokemon, dtype=np.int32),
+            'names': np.zeros(num_pokemon, dtype=np.int32),
+            'ability_name_id': np.zeros(num_pokemon, dtype=np.int32),
+            'abilities': np.zeros(num_pokemon, dtype=np.int32),
+            'level': np.zeros(num_pokemon, dtype=np.int32),
+            'type_ids': np.full((num_pokemon, 2), -1, dtype=np.int32),
+            'types': np.full((num_pokemon, 2), -1, dtype=np.int32),
+            'moves': np.full((num_pokemon, num_moves), -1, dtype=np.int32),
+            'max_moves': np.full((num_pokemon, num_moves), -1, dtype=np.int32),
+            'base_stats': np.zeros((num_pokemon, 6), dtype=np.int32),
+            'ivs': np.zeros((num_pokemon, 6), dtype=np.int32),
+            'evs': np.zeros((num_pokemon, 6), dtype=np.int32)
+        }
+        nature = np.ones((num_pokemon, 6))
+        for i, member in enumerate(members):
+            int_fields['id_num'][i] = member.id_num
+            int_fields['name_id'][i] = self.add_string(member.name_id)
+            int_fields['names'][i] = self.add_translation(member.names)
+            int_fields['ability_name_id'][i] = self.add_string(
+                member.ability_name_id)
+            int_fields['abilities'][i] = self.add_translation(
+                member.abilities)
+            int_fields['level'][i] = member.level
+            for j, type_id in enumerate(member.type_ids):
+                int_fields['type_ids'][i, j] = TYPE_CODES[type_id]
+                int_fields['types'][i, j] = self.add_translation(
+                    member.types[j])
+            for j, move in enumerate(member.moves):
+                int_fields['moves'][i, j] = self.add_move(move)
+            for j, move in enumerate(member.max_moves):
+                int_fields['max_moves'][i, j] = self.add_move(move)
+            int_fields['base_stats'][i] = member.base_stats
+            int_fields['ivs'][i] = member.ivs
+            int_fields['evs'][i] = member.evs
+            nature[i] = member.nature
+        for field, values in int_fields.items():
+            self.arrays[f'{prefix}_{field}'] = values
+        self.arrays[f'{prefix}_nature'] = nature
+
+    def add_matchups(
+        self, name: str, matchups: Dict[str, Dict[str, float]]
+    ) -> None:
+        """Store a nested dict of matchup scores as a dense matrix along with
+        its row and column names. Missing entries are stored as NaN.
+        """
+
+        row_names = list(matchups)
+        column_names = []
+        for row in matchups.values():
+            for column_name in row:
+                if column_name not in column_names:
+                    column_names.append(column_name)
+        column_indices = {
+            name_id: j for j, name_id in enumerate(column_names)}
+        matrix = np.full((len(row_names), len(column_names)), np.nan)
+        for i, row in enumerate(matchups.values()):
+            for column_name, score in row.items():
+                matrix[i, column_indices[column_name]] = score
+        self.arrays[name] = matrix
+        self.arrays[f'{name}_rows'] = np.array(
+            [self.add_string(name_id) for name_id in row_names],
+            dtype=np.int32)
+        self.arrays[f'{name}_columns'] = np.array(
+            [self.add_string(name_id) for name_id in column_names],
+            dtype=np.int32)
+
+    def add_scores(self, name: str, scores: Dict[str, float]) -> None:
+        """Store a dict of scores as an array along with its names."""
+        self.arrays[name] = np.array(list(scores.values()), dtype=np.float64)
+        self.arrays[f'{name}_names'] = np.array(
+            [self.add_string(name_id) for name_id in scores], dtype=np.int32)
+
+    def save(self, file_path: str, source_hashes: Sequence[str]) -> None:
+        """Write the string, translation, and move tables together with the
+        stored arrays to an uncompressed .npz file, which can be
+        memory-mapped by map_npz.
+        """
+
+        translations = np.full(
+            (len(self.translations), len(self.languages)), -1, dtype=np.int32)
+        for i, names in enumerate(self.translations):
+            for language, text in names.items():
+                translations[i, self.languages.index(language)] = (
+                    self.add_string(text))
+        languages = np.array(
+            [self.add_string(language) for language in self.languages],
+            dtype=np.int32)
+
+        # Encode the string table last since the steps above can add to it.
+        encoded = [text.encode('utf8') for text in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(text) for text in encoded])
+
+        np.savez(
+            file_path,
+            format_version=np.array(FORMAT_VERSION),
+            source_hashes=np.array(source_hashes),
+            string_data=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            string_offsets=offsets,
+            languages=languages,
+            translations=translations,
+            moves=np.array(self.moves, dtype=np.float64).reshape(-1, 12),
+            **self.arrays)
+
+
+class LazyPokemonDict(Mapping):
+    """Read-only mapping of name identifiers to Pokemon that are built from
+    the binary arrays the first time they are accessed.
+    """
+
+    def __init__(self, data: 'BinaryPokemonData', prefix: str) -> None:
+        self.data = data
+        self.prefix = prefix
+        self.name_ids = data.get_names(f'{prefix}_name_id')
+        self.indices = {
+            name_id: i for i, name_id in enumerate(self.name_ids)}
+        self.cache: Dict[str, Pokemon] = {}
+
+    def __getitem__(self, name_id: str) -> Pokemon:
+        if name_id not in self.cache:
+            self.cache[name_id] = self.data.build_pokemon(
+                self.prefix, self.indices[name_id])
+        return self.cache[name_id]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.name_ids)
+
+    def __len__(self) -> int:
+        return len(self.name_ids)
+
+    def __contains__(self, name_id: object) -> bool:
+        return name_id in self.indices
+
+
+class BinaryPokemonData:
+    """Reader for the binary data file written by BinaryDataWriter."""
+
+    def __init__(self, file_path: str) -> None:
+        self.arrays = map_npz(file_path)
+        if int(self.arrays['format_version']) != FORMAT_VERSION:
+            raise ValueError(
+                f'Unsupported binary data format in {file_path}.')
+        self.source_hashes = [
+            str(value) for value in self.arrays['source_hashes']]
+        self.string_data = self.arrays['string_data'].tobytes()
+        self.string_offsets = self.arrays['string_offsets']
+        self.languages = [
+            self.get_string(index) for index in self.arrays['languages']]
+        self.move_cache: Dict[int, Move] = {}
+
+        self.boss_pokemon = LazyPokemonDict(self, 'boss')
+        self.rental_pokemon = LazyPokemonDict(self, 'rental')
+
+    def get_string(self, index: int) -> Optional[str]:
+        """Return a string from the string table."""
+        if index < 0:
+            return None
+        return self.string_data[
+            self.string_offsets[index]:self.string_offsets[index + 1]
+        ].decode('utf8')
+
+    def get_translation(self, row: int) -> Dict[str, str]:
+        """Return a dict of translations from the translation table."""
+        return {
+            language: self.get_string(index) for language, index in zip(
+                self.languages, self.arrays['translations'][row])
+            if index >= 0}
+
+    def get_move(self, row: int) -> Move:
+        """Return the Move stored in a row of the move table. Identical moves
+        are shared between Pokemon, as in the jsonpickle files.
+        """
+
+        if row not in self.move_cache:
+            (
+                id_num, name_id, names, type_code, category, base_power,
+                accuracy, PP, effect, probability, is_spread,
+                correction_factor
+            ) = self.arrays['moves'][row]
+            self.move_cache[row] = Move(
+                int(id_num), self.get_string(int(name_id)),
+                self.get_translation(int(names)), TYPE_IDS[int(type_code)],
+                CATEGORIES[int(category)], float(base_power), float(accuracy),
+                int(PP), self.get_string(int(effect)),
+                None if math.isnan(probability) else float(probability),
+                bool(is_spread), float(correction_factor))
+        return self.move_cache[row]
+
+    def build_pokemon(self, prefix: str, i: int) -> Pokemon:
+        """Construct a Pokemon from row i of a group of arrays."""
+        def field(name):
+            return self.arrays[f'{prefix}_{name}'][i]
+
+        type_codes = [code for code in field('type_ids') if code >= 0]
+        return Pokemon(
+            int(field('id_num')), self.get_string(field('name_id')),
+            self.get_translation(field('names')),
+            self.get_string(field('ability_name_id')),
+            self.get_translation(field('abilities')),
+            [TYPE_IDS[code] for code in type_codes],
+            [self.get_translation(row) for row in field('types')[
+                :len(type_codes)]],
+            tuple(int(stat) for stat in field('base_stats')),
+            [self.get_move(row) for row in field('moves') if row >= 0],
+            [self.get_move(row) for row in field('max_moves') if row >= 0],
+            int(field('level')),
+            tuple(int(value) for value in field('ivs')),
+            tuple(int(value) for value in field('evs')),
+            tuple(float(value) for value in field('nature')))
+
+    def get_names(self, name: str) -> List[str]:
+        """Return a stored list of name identifiers."""
+        return [self.get_string(index) for index in self.arrays[name]]
+
+    def get_matchup_table(self, name: str) -> MatchupTable:
+        """Return a stored matchup matrix as a MatchupTable."""
+        return MatchupTable(
+            self.arrays[name], self.get_names(f'{name}_rows'),
+            self.get_names(f'{name}_columns'))
+
+    def get_scores(self, name: str) -> Dict[str, float]:
+        """Return a stored dict of scores."""
+        return dict(zip(
+            self.get_names(f'{name}_names'), self.arrays[name].tolist()))
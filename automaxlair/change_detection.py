@@ -0,0 +1,105 @@
+"""Detection of changes in regions of the screen between polls.
+
+Much of the time the bot spends polling for a state, the screen is showing
+the same thing it showed on the last poll (e.g., a text box while an
+animation plays). A change detector keeps a small grayscale signature of
+each region it is asked about and reports whether the region changed since
+it was last evaluated, so checks of an unchanged region can reuse their
+previous result instead of being repeated.
+"""
+
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Union
+
+import numpy as np
+
+from automaxlair.image_processing import (
+    FULL_RECT, SIGNATURE_WIDTH, Frame, Image, Rectangle, as_frame)
+
+# Largest difference (0 to 255) in any signature pixel between two frames
+# that is still considered noise.
+DEFAULT_THRESHOLD = 6
+
+
+class ChangeDetector:
+    """Keep the signature of regions of the screen, by name, and reuse the
+    results of checks on regions that haven't changed.
+
+    A region is compared with its signature from the last time it was
+    evaluated rather than the last time it was polled, so slow changes
+    still add up to a change.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        width: int = SIGNATURE_WIDTH
+    ) -> None:
+        self.threshold = threshold
+        self.width = width
+        self.signatures: Dict[Hashable, Image] = {}
+        self.results: Dict[Hashable, Any] = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset the counts of evaluated and skipped checks."""
+        self.evaluated: Dict[Hashable, int] = {}
+        self.skipped: Dict[Hashable, int] = {}
+
+    def reset(self, key: Optional[Hashable] = None) -> None:
+        """Forget the signature and result of a region, or of every region
+        if no key is given, so it is evaluated at the next check.
+        """
+
+        if key is None:
+            self.signatures.clear()
+            self.results.clear()
+        else:
+            self.signatures.pop(key, None)
+            self.results.pop(key, None)
+
+    def has_changed(
+        self,
+        key: Hashable,
+        img: Union[Frame, Image],
+        rect: Rectangle = FULL_RECT
+    ) -> bool:
+        """Return whether a region changed since it was last evaluated. If it
+        did, its signature is updated.
+        """
+
+        signature = as_frame(img).get_signature(rect, self.width)
+        previous = self.signatures.get(key)
+        if previous is not None and previous.shape == signature.shape and (
+            np.abs(signature.astype(np.int16) - previous).max()
+            <= self.threshold
+        ):
+            return False
+        self.signatures[key] = signature
+        return True
+
+    def evaluate(
+        self,
+        key: Hashable,
+        img: Union[Frame, Image],
+        rect: Rectangle,
+        func: Callable[[], Any]
+    ) -> Any:
+        """Return the result of a check of a region, calling `func` only if
+        the region changed since the check was last made.
+        """
+
+        if not self.has_changed(key, img, rect) and key in self.results:
+            self.skipped[key] = self.skipped.get(key, 0) + 1
+            return self.results[key]
+        self.evaluated[key] = self.evaluated.get(key, 0) + 1
+        # Drop the old result first in case the check fails.
+        self.results.pop(key, None)
+        result = func()
+        self.results[key] = result
+        return result
+
+    def get_stats(self) -> Dict[Hashable, Tuple[int, int]]:
+        """Return the number of times each check was evaluated and skipped."""
+        return {
+            key: (self.evaluated.get(key, 0), self.skipped.get(key, 0))
+            for key in {**self.evaluated, **self.skipped}}
@@ -9,17 +9,29 @@ den.
 #       Last updated 2021-01-08
 #       Created 2020-11-20
 
+import os
 import re
 import pickle
+import sys
+import time
 
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Tuple, TypeVar, Callable, Dict, Optional
+from typing import (
+    Any, List, Tuple, TypeVar, Callable, Dict, Optional, Union)
 
 import cv2
-import enchant
 
+from . import matchup_scoring
+from .change_detection import ChangeDetector
+from .digit_recognition import DigitRecognizer
 from .pokemon_classes import Pokemon
-from .max_lair_instance import MaxLairInstance
+from .image_processing import FULL_RECT, Frame, as_frame
+from .name_plate_index import MIN_MARGIN, load_name_plates, save_name_plates
+from .path_icons import PathIconMatcher
+from .max_lair_instance import Field, MaxLairInstance
+from .pokemon_data_store import PokemonDataStore
+from .state_detection import RegionCheck, StateDetector
 from .switch_controller import SwitchController
 from configparser import ConfigParser
 Image = TypeVar('cv2 image')
@@ -61,6 +73,22 @@ class DAController(SwitchController):
             config['pokemon_data_paths']['Rental_Pokemon_Scores'],
             config['pokemon_data_paths']['path_tree_path']
         )
+        # Optional binary copy of the data above, which loads much faster.
+        self.binary_data_path = config['pokemon_data_paths'].get(
+            'binary_data_path')
+        # Optional table of precalculated move decisions.
+        self.move_policy_path = config['pokemon_data_paths'].get(
+            'move_policy_path')
+        # Decisions from select_best_move, shared between runs.
+        self.move_cache = matchup_scoring.MoveDecisionCache()
+        # Worker threads that read and score Pokemon in the background while
+        # buttons are pushed, and the time they saved, by stage.
+        self.task_pool = ThreadPoolExecutor(
+            max_workers=max(1, config['advanced'].get('TASK_WORKERS', 2)))
+        self.task_stats: Dict[str, Dict[str, float]] = {}
+        # Background task choosing moves against the possible opponents at
+        # the current node.
+        self.precompute_task: Optional[Future] = None
 
         self.check_attack_stat = config['stats']['CHECK_ATTACK_STAT']
         self.expected_attack_stats = config['stats']['ATTACK_STATS']
@@ -103,6 +131,7 @@ class DAController(SwitchController):
         self.sel_rect_4 = ((0.485, 0.59), (0.60, 0.645))
         # In-battle rectangles.
         self.sel_rect_5 = ((0.195, 0.11), (0.39, 0.165))
+        self.name_plate_rect = ((0.03, 0.025), (0.25, 0.075))
         self.type_rect_1 = ((0.24, 0.175), (0.31, 0.21))
         self.type_rect_2 = ((0.35, 0.175), (0.425, 0.21))
         self.menu_rect_1 = ((0.84, 0.685), (0.91, 0.695))
@@ -144,11 +173,60 @@ class DAController(SwitchController):
         self.speed_stat_rect = ((0.22, 0.54), (0.26, 0.58))
         self.speed_label_rect = ((0.20, 0.58), (0.28, 0.63))
 
+        # Tables of the states that are detected from the colours of the
+        # screen, in order of priority. States named "text" need to be read.
+        black_screen = RegionCheck(
+            ((0, 0), (1, 1)), (0, 0, 0), (180, 255, 10), 250)
+        menu_open = RegionCheck(
+            self.menu_rect_1, (0, 0, 0), (180, 10, 10), 240)
+        self.den_state_detector = StateDetector((
+            ('battle', (black_screen,)),
+            ('text', (RegionCheck(
+                self.den_text_rect, (0, 0, 0), (180, 55, 255), 220),)),
+        ))
+        self.battle_state_detector = StateDetector((
+            ('LOSS', (black_screen,)),
+            ('FIGHT', (menu_open, RegionCheck(
+                self.menu_rect_2, (170, 120, 0), (180, 255, 255), 20))),
+            ('CHEER', (menu_open, RegionCheck(
+                self.menu_rect_2, (95, 220, 120), (105, 255, 255), 20))),
+            ('CATCH', (
+                RegionCheck(self.menu_rect_3, (0, 0, 0), (180, 5, 10), 180),
+                RegionCheck(
+                    self.menu_rect_4, (0, 0, 250), (180, 5, 255), 20))),
+            ('text', (RegionCheck(
+                self.battle_text_rect, (0, 0, 0), (180, 60, 255), 240),)),
+        ))
+        # Reuses the states and text detected in regions of the screen that
+        # haven't changed since they were last checked.
+        self.change_detector = ChangeDetector()
+
         # Load image assets.
         with open(
             self.config['pokemon_data_paths']['type_icon_path'], 'rb'
         ) as image_file:
             self.type_icons = pickle.load(image_file)
+        self.path_icon_matcher = PathIconMatcher(self.type_icons)
+        # Optional glyph atlas for reading numbers without Tesseract.
+        self.digit_recognizer: Optional[DigitRecognizer] = None
+        digit_atlas_path = self.config['pokemon_data_paths'].get(
+            'digit_atlas_path')
+        if digit_atlas_path is not None and os.path.exists(digit_atlas_path):
+            self.digit_recognizer = DigitRecognizer.load(digit_atlas_path)
+        self.digit_match_threshold = self.config['advanced'].get(
+            'DIGIT_MATCH_THRESHOLD', 0.7)
+        # Optional name plates of opponents seen before. If enabled, plates
+        # are added as opponents are identified from their summary.
+        self.name_plate_path = self.config['pokemon_data_paths'].get(
+            'name_plate_path')
+        self.name_plate_index = None
+        if self.name_plate_path is not None:
+            self.name_plate_index = load_name_plates(
+                self.name_plate_path, self.lang)
+        self.name_plate_threshold = self.config['advanced'].get(
+            'NAME_PLATE_MATCH_THRESHOLD', 0.9)
+        self.learn_name_plates = self.config['advanced'].get(
+            'LEARN_NAME_PLATES', False)
 
         # Validate starting values.
         if self.mode not in (
@@ -164,23 +242,157 @@ class DAController(SwitchController):
                 'supplied in Config.ini'
             )
 
+    def __del__(self):
+        """On destruction, stop the background task threads."""
+        self.task_pool.shutdown()
+        super().__del__()
+
     def reset_run(self) -> None:
         """Reset in preparation for a new Dynamax Adventure."""
-        self.current_run = MaxLairInstance(self.boss, self.data_paths)
+        # The static data is only read from disk for the first run.
+        self.current_run = MaxLairInstance(
+            self.boss,
+            PokemonDataStore.load(
+                self.data_paths, self.binary_data_path,
+                self.move_policy_path))
+        # Build the index used to identify Pokemon before it is needed.
+        self.current_run.data.get_name_index(self.lang)
 
     def reset_stage(self) -> None:
         """Reset after a battle."""
         self.current_run.reset_stage()
 
+    def select_best_move(
+        self, pokemon: Pokemon, opponent: Pokemon
+    ) -> Tuple[int, str, float]:
+        """Return the index, name, and score of the best move for the current
+        Pokemon, looking it up in the move policy table if possible and
+        scoring the moves otherwise (e.g., for a transformed Ditto).
+        """
+
+        run = self.current_run
+        if run.data.move_policy is not None:
+            decision = run.data.move_policy.select_best_move(pokemon, opponent)
+            if decision is not None:
+                return decision
+        return self.move_cache.select_best_move(
+            pokemon, opponent, run.teammates, run.field)
+
+    def start_opponent_precompute(self) -> None:
+        """Start choosing the current Pokemon's moves against every possible
+        opponent at the current node in the background, so the decision is
+        already cached when the opponent is identified.
+        """
+
+        self.precompute_task = self.submit_task(
+            self.current_run.precompute_opponent_moves,
+            self.prefill_best_move)
+
+    def finish_opponent_precompute(self) -> None:
+        """Collect the opponent precompute if it has finished. Otherwise it
+        is left running, since its decisions are cached as they are made.
+        """
+
+        if self.precompute_task is None:
+            return
+        if self.precompute_task.done():
+            num_computed = self.collect_task(
+                self.precompute_task, 'opponent precompute')
+            self.log(
+                f'Precomputed {num_computed} move decisions for possible '
+                'opponents.', 'DEBUG')
+        else:
+            self.log(
+                'The opponent precompute is still running.', 'DEBUG')
+        self.precompute_task = None
+
+    def prefill_best_move(self, attacker: Pokemon, defender: Pokemon) -> bool:
+        """Cache the decision that select_best_move will make at the start
+        of a battle, unless it can be looked up in the move policy table.
+        Return whether a decision was computed. Safe to call from a
+        background task.
+        """
+
+        run = self.current_run
+        if run.data.move_policy is not None and run.data.move_policy.covers(
+            attacker, defender
+        ):
+            return False
+        # The field is cleared at the start of every battle.
+        return self.move_cache.prefill(
+            attacker, defender, run.teammates, Field())
+
+    def submit_task(self, func: Callable, *args, **kwargs) -> Future:
+        """Start running a function on a background thread, so that it can
+        overlap with button pushes and their delays. The result is fetched
+        with `collect_task`.
+
+        Tasks must not push buttons, and must pass release_lock=False when
+        reading text since they don't hold the lock.
+        """
+
+        def timed_func():
+            start_time = time.perf_counter()
+            result = func(*args, **kwargs)
+            return result, time.perf_counter() - start_time
+
+        return self.task_pool.submit(timed_func)
+
+    def collect_task(self, future: Future, name: str) -> Any:
+        """Return the result of a background task, waiting for it to finish
+        if necessary. The part of the task's run time that overlapped with
+        other work is recorded as time saved by the current stage.
+        """
+
+        if self.exit_flag.is_set():
+            sys.exit()
+        start_time = time.perf_counter()
+        # Release the lock so the display thread can run while waiting.
+        self.lock.release()
+        try:
+            result, run_time = future.result()
+        finally:
+            self.lock.acquire()
+        wait_time = time.perf_counter() - start_time
+        saved = max(0.0, run_time - wait_time)
+
+        stats = self.task_stats.setdefault(
+            str(self.stage),
+            {'count': 0, 'run_time': 0.0, 'wait_time': 0.0, 'saved': 0.0})
+        stats['count'] += 1
+        stats['run_time'] += run_time
+        stats['wait_time'] += wait_time
+        stats['saved'] += saved
+        self.log(
+            f'Background task {name} took {run_time * 1000:.1f} ms, '
+            f'{saved * 1000:.1f} ms of which overlapped with other work.',
+            'DEBUG')
+        return result
+
+    def get_task_stats(self) -> Dict[str, Dict[str, float]]:
+        """Return the number of background tasks collected, their total run
+        time, the time spent waiting for them, and the time saved, by stage.
+        """
+
+        return {stage: dict(stats) for stage, stats in self.task_stats.items()}
+
+    def reset_task_stats(self) -> None:
+        """Clear the statistics kept by collect_task."""
+        self.task_stats = {}
+
     def get_frame(
         self,
         rectangle_set: Optional[str] = None,
         resize: bool = False
-    ) -> Image:
+    ) -> Frame:
         """Get an annotated image of the current Switch output."""
 
         # Get the base image from the base class method.
         img = super().get_frame(resize=resize)
+        if self.enable_debug_logs and rectangle_set is not None and not resize:
+            # Full size frames are shared with other callers, so draw the
+            # rectangles on a copy.
+            img = Frame(img.image.copy(), img.timestamp, img.index)
 
         # Draw rectangles around detection areas if debug logs are on.
         if not self.enable_debug_logs or rectangle_set is None:
@@ -210,7 +422,8 @@ class DAController(SwitchController):
             self.outline_regions(
                 img, (self.ball_rect, self.ball_num_rect), (0, 0, 255))
         elif rectangle_set == 'battle':
-            self.outline_region(img, self.sel_rect_5, (0, 255, 0))
+            self.outline_regions(
+                img, (self.sel_rect_5, self.name_plate_rect), (0, 255, 0))
             self.outline_regions(
                 img, (
                     self.type_rect_1, self.type_rect_2, self.menu_rect_1,
@@ -233,7 +446,19 @@ class DAController(SwitchController):
         be called three times, once at each of the three stages of bosses.
         """
 
-        img = self.get_frame(resize=False)
+        self.current_run.update_paths(
+            self.identify_path_types(stage_index), stage_index)
+
+    def identify_path_types(
+        self,
+        stage_index: int,
+        frame: Optional[Frame] = None
+    ) -> List[Tuple[str, Tuple[float, Tuple[int, int]]]]:
+        """Identify the type icons of one stage of bosses on the path
+        screen, without storing them.
+        """
+
+        img = self.get_frame(resize=False) if frame is None else frame
 
         # Get a subset of images relevant to the stage index
         images = []
@@ -251,83 +476,49 @@ class DAController(SwitchController):
         type_data = []
         for img in images:
             type_data.append(self.identify_path_pokemon(img))
-
-        # Finally, update the path information with the matched types.
-        self.current_run.update_paths(type_data, stage_index)
+        return type_data
 
     def identify_path_pokemon(
         self,
         img: Image
     ) -> Tuple[str, Tuple[float, Tuple[int, int]]]:
         """Read type symbols to idenfity path shape and potential bosses."""
-        # Threshold the image the same as the stored type icons.
-        img_thresholded = cv2.inRange(
-            cv2.cvtColor(img, cv2.COLOR_BGR2HSV), (0, 0, 200), (180, 50, 255))
-
-        # Check every type image for a match within the image
         # TODO: try to look at the shadow of the Pokemon for more hints
-        best_match_value = 0
-        for type_id in (
-            'normal', 'fire', 'water', 'electric', 'grass', 'ice', 'fighting',
-            'poison', 'ground', 'flying', 'psychic', 'bug', 'rock', 'ghost',
-            'dragon', 'steel', 'dark', 'fairy'
-        ):
-            result = self.match_template(
-                img_thresholded, self.type_icons[type_id])
-            # If the result is a better match than the previous type, store it.
-            if result[0] > best_match_value:
-                best_match_value = result[0]
-                match_result = (type_id, result)
-
-        return match_result
+        return self.path_icon_matcher.identify(img)
 
     def identify_pokemon(
         self,
         name: str,
         ability: str = '',
         types: str = '',
-        moves: str = ''
+        moves: str = '',
+        candidates: Optional[List[str]] = None
     ) -> Pokemon:
-        """Match OCRed Pokemon to a rental Pokemon."""
+        """Match OCRed Pokemon to a rental Pokemon. If the name_ids of the
+        expected Pokemon are given, they are searched first, and all rental
+        Pokemon are searched if none of them match well.
+        """
         # Strip line breaks from OCRed text and combine name, ability, and
         # types to make a composite identifying string.
         text = (name + ability + types + moves).replace('\n', '')
 
-        # Then, initialize the matched text variable in case it is somehow not
-        # assigned later.
-        matched_text = ''
-
-        # Thenn initialize values that will store the best match of the OCRed
-        # text.
-        match_value = 1000
-
-        # Then, loop through all the possible rental pokemon looking for the
-        # best match with the OCRed text.
-        for pokemon in self.current_run.rental_pokemon.values():
-            # Build the composite identifying string with the same format as
-            # the OCRed text.
-            # Note that some OCR strings omit the ability and others omit the
-            # types so don't include these identifiers in these cases.
-            string_to_match = pokemon.names[self.lang]
-            if ability != '':
-                string_to_match += pokemon.abilities[self.lang]
-            if types != '':
-                for type_name_dict in pokemon.types:
-                    string_to_match += type_name_dict[self.lang]
-            if moves != '':
-                for move in pokemon.moves:
-                    string_to_match += move.names.get(self.lang, move.name_id)
-
-            # After building the identifying string, calculate how different it
-            # is from the OCRed string.
-            distance = enchant.utils.levenshtein(text, string_to_match)
-
-            # Then, update the best match values if the match is better than
-            # the previous best match.
-            if distance < match_value:
-                match_value = distance
-                best_match = pokemon
-                matched_text = string_to_match
+        # Find the rental Pokemon whose identifying string (built with the
+        # same format as the OCRed text) is closest to the OCRed string.
+        # Note that some OCR strings omit the ability and others omit the
+        # types so these identifiers are only included when they were read.
+        start_time = time.perf_counter()
+        if not candidates:
+            candidates = None
+        name_index = self.current_run.data.get_name_index(self.lang)
+        best_match, matched_text, match_value = name_index.match(
+            name, ability, types, moves, candidates)
+        if candidates is not None and match_value > len(text) / 3:
+            self.log(
+                f'OCRed Pokemon {text} did not match an expected Pokemon; '
+                'searching all rental Pokemon.', 'DEBUG')
+            best_match, matched_text, match_value = name_index.match(
+                name, ability, types, moves)
+        elapsed_time = time.perf_counter() - start_time
 
         # Raise a warning if the OCRed text didn't closely match any stored
         # value.
@@ -338,16 +529,135 @@ class DAController(SwitchController):
 
         self.log(
             f'OCRed Pokemon {text} matched to rental Pokemon {matched_text} '
-            f'with distance of {match_value}', 'DEBUG'
+            f'with distance of {match_value} in '
+            f'{elapsed_time * 1000:.2f} ms', 'DEBUG'
         )
 
-        # finally, return the Pokemon that matched best with the OCRed text
-        return best_match
+        # finally, return a copy of the Pokemon that matched best with the
+        # OCRed text so that its state can be modified during the run.
+        return self.current_run.get_rental_pokemon(best_match.name_id)
+
+    def identify_opponent_by_name_plate(
+        self,
+        frame: Optional[Frame] = None,
+        candidates: Optional[List[str]] = None
+    ) -> Optional[Pokemon]:
+        """Identify the opponent from the name plate above its HP bar, or
+        return None if the plate doesn't match a known plate with enough
+        confidence. The name_ids of the expected Pokemon narrow the search
+        if they are given.
+        """
+
+        if self.name_plate_index is None:
+            return None
+        if frame is None:
+            frame = self.get_frame()
+        rental_pokemon = self.current_run.rental_pokemon
+        if not candidates:
+            candidates = list(rental_pokemon)
+        # Forms of a Pokemon share a name, so group the candidates by name.
+        name_ids: Dict[str, List[str]] = {}
+        for name_id in candidates:
+            name_ids.setdefault(
+                rental_pokemon[name_id].names[self.lang], []).append(name_id)
+        # A plate is only trusted if it beat the plate of another name, so at
+        # least two of the names need a plate.
+        if sum(name in self.name_plate_index for name in name_ids) < 2:
+            return None
+
+        start_time = time.perf_counter()
+        name, score, runner_up = self.name_plate_index.match(
+            frame.get_text_region(self.name_plate_rect), name_ids)
+        self.log(
+            f'Matched name plate to {name} with a score of {score:.2f} '
+            f'(next best {runner_up:.2f}) in '
+            f'{(time.perf_counter() - start_time) * 1000:.2f} ms', 'DEBUG')
+        if (
+            name is None or score < self.name_plate_threshold
+            or score - runner_up < MIN_MARGIN
+        ):
+            return None
+        if len(name_ids[name]) > 1:
+            self.log(
+                f'The name plate matched {name}, which could be any of '
+                f'{name_ids[name]}.', 'DEBUG')
+            return None
+        return self.current_run.get_rental_pokemon(name_ids[name][0])
+
+    def learn_name_plate(
+        self,
+        plate_frame: Frame,
+        summary_frame: Frame,
+        opponent: Pokemon
+    ) -> None:
+        """Add the name plate of an opponent identified from its summary to
+        the name plate file, so that it can be identified from the plate next
+        time. This is only done if LEARN_NAME_PLATES is enabled, and only if
+        the summary read closely matches the opponent among all rental
+        Pokemon, since a wrong plate would be kept for future runs.
+        """
+
+        if not self.learn_name_plates or self.name_plate_index is None:
+            return
+        name = opponent.names[self.lang]
+        mask = plate_frame.get_text_region(self.name_plate_rect)
+        if name in self.name_plate_index or cv2.countNonZero(mask) == 0:
+            return
+        # The summary text is usually cached from identifying the opponent.
+        summary_name, types = self.read_battle_summary(summary_frame)
+        best_match, __, match_value = self.current_run.data.get_name_index(
+            self.lang).match(summary_name, types=types)
+        # Accept half the distance that identify_pokemon tolerates.
+        if (
+            best_match.name_id != opponent.name_id
+            or match_value > len(summary_name + types) / 6
+        ):
+            self.log(
+                f'Not saving the name plate of {name}, since its summary '
+                'could not be read reliably.', 'DEBUG')
+            return
+        self.name_plate_index.add(name, mask)
+        save_name_plates(self.name_plate_path, self.name_plate_index)
+        self.log(
+            f'Saved the name plate of {name} ({len(self.name_plate_index)} '
+            'name plates are known).', 'DEBUG')
+
+    def read_battle_summary(
+        self,
+        frame: Frame,
+        release_lock: bool = True
+    ) -> Tuple[str, str]:
+        """Read the name and types of the opponent from its summary in
+        battle.
+        """
+
+        name, type_1, type_2 = self.read_texts(frame, (
+            (self.sel_rect_5, {
+                'threshold': False, 'invert': False,
+                'segmentation_mode': '--psm 8'}),
+            (self.type_rect_1, {
+                'threshold': False, 'invert': True,
+                'segmentation_mode': '--psm 8'}),
+            (self.type_rect_2, {
+                'threshold': False, 'invert': True,
+                'segmentation_mode': '--psm 8'}),
+        ), release_lock=release_lock)
+        return name, type_1.title() + type_2.title()
+
+    def read_selectable_pokemon(
+        self,
+        stage: str,
+        frame: Optional[Frame] = None,
+        release_lock: bool = True,
+        candidates: Optional[List[str]] = None
+    ) -> List[Pokemon]:
+        """Return a list of available Pokemon names. Pass release_lock=False
+        when calling this method from a background task, and the name_ids of
+        the expected Pokemon, if known, as candidates.
+        """
 
-    def read_selectable_pokemon(self, stage: str) -> List[Pokemon]:
-        """Return a list of available Pokemon names."""
         # Fetch the image from the Switch output.
-        image = self.get_frame()
+        image = self.get_frame() if frame is None else frame
 
         # Get a list of Pokemon names present, depending on stage.
         pokemon_names = []
@@ -355,74 +665,53 @@ class DAController(SwitchController):
         types = []
         moves = []
         if stage == 'join':
-            pokemon_names.append(
-                self.read_text(
-                    image, self.sel_rect_1, threshold=False,
-                    invert=True, segmentation_mode='--psm 8').strip()
-            )
-            pokemon_names.append(
-                self.read_text(
-                    image, self.sel_rect_2, threshold=False,
-                    segmentation_mode='--psm 8'
-                ).strip())
-            # This last name shifts around between runs necessitating a larger
+            # The last name shifts around between runs necessitating a larger
             # rectangle and different text segmentation mode.
-            pokemon_names.append(
-                self.read_text(
-                    image, self.sel_rect_3, threshold=False,
-                    segmentation_mode='--psm 3').strip())
-            abilities.append(
-                self.read_text(
-                    image, self.abil_rect_1, threshold=False, invert=True,
-                    segmentation_mode='--psm 8').strip())
-            abilities.append(
-                self.read_text(
-                    image, self.abil_rect_2, threshold=False,
-                    segmentation_mode='--psm 8').strip())
-            abilities.append(
-                self.read_text(
-                    image, self.abil_rect_3, threshold=False,
-                    segmentation_mode='--psm 3').strip())
+            texts = self.read_texts(image, (
+                (self.sel_rect_1, {
+                    'threshold': False, 'invert': True,
+                    'segmentation_mode': '--psm 8'}),
+                (self.sel_rect_2, {
+                    'threshold': False, 'segmentation_mode': '--psm 8'}),
+                (self.sel_rect_3, {
+                    'threshold': False, 'segmentation_mode': '--psm 3'}),
+                (self.abil_rect_1, {
+                    'threshold': False, 'invert': True,
+                    'segmentation_mode': '--psm 8'}),
+                (self.abil_rect_2, {
+                    'threshold': False, 'segmentation_mode': '--psm 8'}),
+                (self.abil_rect_3, {
+                    'threshold': False, 'segmentation_mode': '--psm 3'}),
+                (self.moves_rect_1, {
+                    'threshold': False, 'segmentation_mode': '--psm 4'}),
+                (self.moves_rect_2, {
+                    'threshold': False, 'segmentation_mode': '--psm 4'}),
+                (self.moves_rect_3, {
+                    'threshold': False, 'segmentation_mode': '--psm 4'}),
+            ), stack=True, release_lock=release_lock)
+            pokemon_names = texts[0:3]
+            abilities = texts[3:6]
             types = ['', '', '']
-            moves.append(
-                self.read_text(
-                    image, self.moves_rect_1, threshold=False,
-                    segmentation_mode='--psm 4').strip())
-            moves.append(
-                self.read_text(
-                    image, self.moves_rect_2, threshold=False,
-                    segmentation_mode='--psm 4').strip())
-            moves.append(
-                self.read_text(
-                    image, self.moves_rect_3, threshold=False,
-                    segmentation_mode='--psm 4').strip())
+            moves = texts[6:9]
         elif stage == 'catch':
-            pokemon_names.append(
-                self.read_text(
-                    image, self.sel_rect_4, threshold=False,
-                    segmentation_mode='--psm 3').strip().split('\n')[-1])
-            abilities.append(
-                self.read_text(
-                    image, self.abil_rect_4, threshold=False,
-                    segmentation_mode='--psm 3').strip())
+            name, ability, move_text = self.read_texts(image, (
+                (self.sel_rect_4, {
+                    'threshold': False, 'segmentation_mode': '--psm 3'}),
+                (self.abil_rect_4, {
+                    'threshold': False, 'segmentation_mode': '--psm 3'}),
+                (self.moves_rect_4, {
+                    'threshold': False, 'segmentation_mode': '--psm 4'}),
+            ), release_lock=release_lock)
+            pokemon_names.append(name.split('\n')[-1])
+            abilities.append(ability)
             types.append('')
-            moves.append(
-                self.read_text(
-                    image, self.moves_rect_4, threshold=False,
-                    segmentation_mode='--psm 4').strip())
+            moves.append(move_text)
         elif stage == 'battle':
-            pokemon_names.append(
-                self.read_text(
-                    image, self.sel_rect_5, threshold=False, invert=False,
-                    segmentation_mode='--psm 8').strip())
+            name, type_text = self.read_battle_summary(
+                image, release_lock)
+            pokemon_names.append(name)
             abilities.append('')
-            type_1 = self.read_text(
-                image, self.type_rect_1, threshold=False, invert=True,
-                segmentation_mode='--psm 8').strip().title()
-            type_2 = self.read_text(
-                image, self.type_rect_2, threshold=False, invert=True,
-                segmentation_mode='--psm 8').strip().title()
-            types.append(type_1 + type_2)
+            types.append(type_text)
             moves.append('')
 
         # Identify the Pokemon based on its name and ability/types, where
@@ -431,7 +720,8 @@ class DAController(SwitchController):
         for i in range(len(pokemon_names)):
             pokemon_list.append(
                 self.identify_pokemon(
-                    pokemon_names[i], abilities[i], types[i], moves[i]))
+                    pokemon_names[i], abilities[i], types[i], moves[i],
+                    candidates))
 
         # Return the list of Pokemon.
         return pokemon_list
@@ -445,20 +735,27 @@ class DAController(SwitchController):
         # Get a frame from the VideoCapture that we will check for the state.
         img = self.get_frame()
 
-        # First, check if a battle started.
-        if self.check_black_screen(img):
-            return 'battle'
-        # Otherwise, check for other text.
-        if self.check_rect_HSV_match(
-            self.den_text_rect, (0, 0, 0,), (180, 55, 255), 220, img
+        # The states and text are only checked again if the screen changed.
+        for state in self.change_detector.evaluate(
+            'den states', img, FULL_RECT,
+            lambda: self.den_state_detector.get_states(img)
         ):
-            text = self.read_text(img, self.den_text_rect, invert=True)
-            if re.search(self.phrases['BACKPACKER'], text):
-                return 'backpacker'
-            if re.search(self.phrases['SCIENTIST'], text):
-                return 'scientist'
-            if re.search(self.phrases['PATH'], text):
-                return 'path'
+            # First, check if a battle started.
+            if state == 'battle':
+                if self.confirm_black_screen():
+                    return 'battle'
+            # Otherwise, check for other text.
+            elif state == 'text':
+                text = self.change_detector.evaluate(
+                    'den text', img, self.den_text_rect,
+                    lambda: self.read_text(
+                        img, self.den_text_rect, invert=True))
+                if re.search(self.phrases['BACKPACKER'], text):
+                    return 'backpacker'
+                if re.search(self.phrases['SCIENTIST'], text):
+                    return 'scientist'
+                if re.search(self.phrases['PATH'], text):
+                    return 'path'
         # else
         return None
 
@@ -470,35 +767,25 @@ class DAController(SwitchController):
 
         # Get a frame from the VideoCapture that we will check for the state.
         img = self.get_frame()
-        img_hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-
-        # First, check if the player was defeated.
-        if self.check_black_screen(img):
-            return 'LOSS'
-        # Then, check for the presence of the Fight or Cheer menu.
-        if self.check_rect_HSV_match(
-            self.menu_rect_1, (0, 0, 0), (180, 10, 10), 240, img_hsv, already_HSV=True
-        ):
-            if self.check_rect_HSV_match(
-                self.menu_rect_2, (170, 120, 0), (180, 255, 255), 20, img_hsv, already_HSV=True
-            ):
-                return 'FIGHT'
-            elif self.check_rect_HSV_match(
-                self.menu_rect_2, (95, 220, 120), (105, 255, 255), 20, img_hsv, already_HSV=True
-            ):
-                return 'CHEER'
-        # Then, check for the presence of the Catch menu.
-        if self.check_rect_HSV_match(
-            self.menu_rect_3, (0, 0, 0), (180, 5, 10), 180, img_hsv, already_HSV=True
-        ) and self.check_rect_HSV_match(
-            self.menu_rect_4, (0, 0, 250), (180, 5, 255), 20, img_hsv, already_HSV=True
-        ):
-            return 'CATCH'
+
+        # The states and text are only checked again if the screen changed.
+        states = self.change_detector.evaluate(
+            'battle states', img, FULL_RECT,
+            lambda: self.battle_state_detector.get_states(img))
+        for state in states:
+            # First, check if the player was defeated.
+            if state == 'LOSS':
+                if self.confirm_black_screen():
+                    return 'LOSS'
+            # Then, check for the presence of the Fight, Cheer, or Catch menu.
+            elif state in ('FIGHT', 'CHEER', 'CATCH'):
+                return state
         # Finally, check for other text.
-        if self.check_rect_HSV_match(
-            self.battle_text_rect, (0, 0, 0,), (180, 60, 255), 240, img_hsv, already_HSV=True
-        ):
-            text = self.read_text(img, self.battle_text_rect, invert=True)
+        if 'text' in states:
+            text = self.change_detector.evaluate(
+                'battle text', img, self.battle_text_rect,
+                lambda: self.read_text(
+                    img, self.battle_text_rect, invert=True))
             if re.search(self.phrases['FAINT'], text):
                 return 'FAINT'
             elif re.search(self.phrases['WEATHER_CLEAR'], text):
@@ -533,26 +820,73 @@ class DAController(SwitchController):
                 self.log('TERRAIN_PSYCHIC has been detected.', 'DEBUG')
         return None
 
-    def check_shiny(self) -> bool:
+    def check_shiny(self, frame: Optional[Frame] = None) -> bool:
         """Detect whether a Pokemon is shiny by looking for the icon in the
         summary screen.
         """
 
         return self.check_rect_HSV_match(
-            self.shiny_rect, (0, 100, 20), (180, 255, 255), 10)
+            self.shiny_rect, (0, 100, 20), (180, 255, 255), 10, frame)
 
-    def check_stats(self) -> bool:
+    def read_numbers(
+        self,
+        img: Union[Frame, Image],
+        rects: List[Rectangle],
+        invert: bool = False
+    ) -> List[str]:
+        """Read numbers from several sections of an image, matching their
+        glyphs against the glyph atlas if one was loaded.
+
+        Sections whose glyphs don't all match the atlas with a score of at
+        least DIGIT_MATCH_THRESHOLD are read using Tesseract instead.
+        """
+
+        frame = as_frame(img)
+        texts: List[Optional[str]] = [None] * len(rects)
+        if self.digit_recognizer is not None:
+            for i, rect in enumerate(rects):
+                start_time = time.time()
+                text, confidence = self.digit_recognizer.read(
+                    frame.get_gray(rect))
+                if confidence >= self.digit_match_threshold:
+                    texts[i] = text
+                self.log(
+                    f'Matched glyphs on screen: {text} (confidence '
+                    f'{confidence:.2f}, frame {frame.index}, '
+                    f'{(time.time() - start_time) * 1000:.1f} ms'
+                    f'{"" if texts[i] is not None else ", rejected"})',
+                    'DEBUG')
+        fallback = [i for i, text in enumerate(texts) if text is None]
+        if len(fallback) > 0:
+            fallback_texts = self.read_texts(frame, [
+                (rects[i], {
+                    'threshold': False, 'invert': invert,
+                    'segmentation_mode': '--psm 8'})
+                for i in fallback])
+            for i, text in zip(fallback, fallback_texts):
+                texts[i] = text
+        return texts
+
+    def check_stats(self, frame: Optional[Frame] = None) -> bool:
         """Detect whether a Pokemon has perfect stats.
         """
 
+        if frame is None:
+            frame = self.get_frame()
+
+        # Read every stat that needs to be checked at once.
+        stat_rects = []
+        if self.check_attack_stat:
+            stat_rects.append(self.attack_stat_rect)
+        if self.check_speed_stat:
+            stat_rects.append(self.speed_stat_rect)
+        stat_texts = self.read_numbers(frame, stat_rects)
+
         # First check if the attack stat match one of the expected value
         is_attack_matching = True
         if self.check_attack_stat:
             is_attack_matching = False
-            read_attack = self.read_text(
-                self.get_frame(), self.attack_stat_rect, threshold=False,
-                segmentation_mode='--psm 8'
-            )
+            read_attack = stat_texts.pop(0)
             for nature_type, expected_attacks in self.expected_attack_stats.items():
                 nature_plus_expected = False if nature_type != 'positive' else True
                 nature_minus_expected = False if nature_type != 'negative' else True
@@ -565,10 +899,10 @@ class DAController(SwitchController):
                         if (
                             (nature_minus_expected and self.check_rect_HSV_match(
                                 self.attack_label_rect, (80, 30, 0),
-                                (110, 255, 255), 10)) or (
+                                (110, 255, 255), 10, frame)) or (
                                 nature_plus_expected and self.check_rect_HSV_match(
                                     self.attack_label_rect, (150, 30, 0),
-                                    (180, 255, 255), 10)
+                                    (180, 255, 255), 10, frame)
                             )
                             or (
                                 not nature_minus_expected
@@ -587,10 +921,7 @@ class DAController(SwitchController):
         is_speed_matching = True
         if self.check_speed_stat:
             is_speed_matching = False
-            read_speed = self.read_text(
-                self.get_frame(), self.speed_stat_rect, threshold=False,
-                segmentation_mode='--psm 8'
-            )
+            read_speed = stat_texts.pop(0)
             for nature_type, expected_speeds in self.expected_speed_stats.items():
                 nature_plus_expected = False if nature_type != 'positive' else True
                 nature_minus_expected = False if nature_type != 'negative' else True
@@ -601,10 +932,10 @@ class DAController(SwitchController):
                         if (
                             (nature_minus_expected and self.check_rect_HSV_match(
                                 self.speed_label_rect, (80, 30, 0),
-                                (110, 255, 255), 10))
+                                (110, 255, 255), 10, frame))
                             or (nature_plus_expected and self.check_rect_HSV_match(
                             self.speed_label_rect, (150, 30, 0),
-                            (180, 255, 255), 10))
+                            (180, 255, 255), 10, frame))
                             or (
                             not nature_minus_expected
                             and not nature_plus_expected)
@@ -620,22 +951,110 @@ class DAController(SwitchController):
 
         return is_attack_matching and is_speed_matching
 
-    def check_dynamax_available(self) -> bool:
+    def check_dynamax_available(self, frame: Optional[Frame] = None) -> bool:
         """Detect whether Dynamax is available for the player."""
         return self.check_rect_HSV_match(
-            self.dmax_symbol_rect, (0, 0, 200), (180, 50, 255), 10)
+            self.dmax_symbol_rect, (0, 0, 200), (180, 50, 255), 10, frame)
 
-    def check_black_screen(self, img: Image = None) -> bool:
+    def check_black_screen(self, img: Optional[Frame] = None) -> bool:
         """Detect the black screen that is characteristic of losing the run."""
-        if not self.check_rect_HSV_match(
-            ((0, 0), (1, 1)), (0, 0, 0), (180, 255, 10), 250, img
-        ):
+        if not self.is_black_screen(img):
             return False
+        return self.confirm_black_screen()
+
+    def confirm_black_screen(self) -> bool:
+        """Pause and check for the black screen a second time as a
+        rudimentary debounce filter.
+        """
 
-        # Pause and check a second time as a rudimentary debounce filter.
         self.push_button(None, 0.2)
+        return self.is_black_screen()
+
+    # The following predicates check a single frame for a screen, without any
+    # debouncing, so they can be passed to wait_until.
+
+    def is_black_screen(self, frame: Optional[Frame] = None) -> bool:
+        """Check whether the screen is completely black."""
         return self.check_rect_HSV_match(
-            ((0, 0), (1, 1)), (0, 0, 0), (180, 255, 10), 250)
+            ((0, 0), (1, 1)), (0, 0, 0), (180, 255, 10), 250, frame)
+
+    def is_dialog_box_visible(self, frame: Optional[Frame] = None) -> bool:
+        """Check whether a dialog box is shown, either in the den or in
+        battle.
+        """
+
+        if frame is None:
+            frame = self.get_frame()
+        return (
+            'text' in self.den_state_detector.get_states(frame)
+            or 'text' in self.battle_state_detector.get_states(frame))
+
+    def is_fight_menu_visible(self, frame: Optional[Frame] = None) -> bool:
+        """Check whether the Fight or Cheer menu is shown in battle."""
+        if frame is None:
+            frame = self.get_frame()
+        states = self.battle_state_detector.get_states(frame)
+        return 'FIGHT' in states or 'CHEER' in states
+
+    def is_catch_menu_visible(self, frame: Optional[Frame] = None) -> bool:
+        """Check whether the menu offering to catch a defeated boss is
+        shown.
+        """
+
+        if frame is None:
+            frame = self.get_frame()
+        return 'CATCH' in self.battle_state_detector.get_states(frame)
+
+    def is_path_screen_visible(
+        self, frame: Optional[Frame] = None, threshold: float = 0.85
+    ) -> bool:
+        """Check whether the first stage of the path through the den is shown
+        by looking for a type icon on each of its paths.
+
+        Only the blob search of the path icon matcher is used, which finds a
+        white blob of the size of an icon and requires it to clearly match
+        one type. Other screens can score up to about 0.7 when every
+        template is matched against them, so the threshold is well above
+        that.
+        """
+
+        if frame is None:
+            frame = self.get_frame()
+        for rect in (self.paths_2_1_rect, self.paths_2_2_rect):
+            match = self.path_icon_matcher.find_icon(
+                self.get_image_slice(frame, rect))
+            if match is None or match[1][0] < threshold:
+                return False
+        return True
+
+    def is_caught_pokemon_visible(
+        self, frame: Optional[Frame] = None
+    ) -> bool:
+        """Check whether the summary of a newly caught Pokemon is shown.
+
+        The name region must be a white card with dark text on it, which is
+        checked from its colours. Only then is the name read and checked to
+        closely match a rental Pokemon, so the name is usually read once per
+        catch rather than on every poll.
+        """
+
+        if frame is None:
+            frame = self.get_frame()
+        if not (
+            self.check_rect_HSV_match(
+                self.sel_rect_4, (0, 0, 180), (180, 40, 255), 127, frame)
+            and self.check_rect_HSV_match(
+                self.sel_rect_4, (0, 0, 0), (180, 255, 100), 5, frame)
+        ):
+            return False
+        name = self.read_text(
+            frame, self.sel_rect_4, threshold=False,
+            segmentation_mode='--psm 3').split('\n')[-1]
+        if name == '':
+            return False
+        __, __, match_value = self.current_run.data.get_name_index(
+            self.lang).match(name)
+        return match_value <= len(name) / 3
 
     def get_target_ball(self) -> str:
         """Return the name of the Poke Ball needed."""
@@ -643,15 +1062,42 @@ class DAController(SwitchController):
             self.base_ball if self.current_run.num_caught < 3
             else self.legendary_ball)
 
-    def check_ball(self) -> str:
+    def check_ball(self, frame: Optional[Frame] = None) -> str:
         """Detect the currently selected Poke Ball during the catch phase of the
         game.
         """
 
+        if frame is None:
+            frame = self.get_frame()
         return self.read_text(
-            self.get_frame(), self.ball_rect, threshold=False, invert=True,
+            frame, self.ball_rect, threshold=False, invert=True,
             segmentation_mode='--psm 7').strip()
 
+    def check_ball_count(self, frame: Optional[Frame] = None) -> Optional[int]:
+        """Read the number of the currently selected Poke Ball in the bag
+        during the catch phase of the game, or None if it can't be read.
+        """
+
+        if frame is None:
+            frame = self.get_frame()
+        digits = re.sub(r'\D', '', self.read_numbers(
+            frame, [self.ball_num_rect], invert=True)[0])
+        return int(digits) if digits != '' else None
+
+    def verify_ball_count(self, frame: Optional[Frame] = None) -> None:
+        """Compare the number of the selected Poke Ball shown in the bag with
+        the number the bot expects to have, warning if they differ.
+        """
+
+        count = self.check_ball_count(frame)
+        expected = (
+            self.base_balls if self.current_run.num_caught < 3
+            else self.legendary_balls)
+        if count is not None and count != expected:
+            self.log(
+                f'The bag contains {count} {self.get_target_ball()} but '
+                f'{expected} were expected.', 'WARNING')
+
     def record_ball_use(self) -> None:
         """Decrement the number of balls in the inventory and increment the
         number of pokemon caught.
@@ -752,6 +1198,7 @@ class DAController(SwitchController):
             'Opponent': self.current_run.opponent,
             'Win percentage': win_percent,
             'Time per run': time_per_run,
+            'FPS': f'{self.cap.get_fps():.1f}',
             'Shinies found': self.shinies_found
         }.items():
             self.info[key] = value
@@ -0,0 +1,186 @@
+"""Recognition of numbers drawn in the game's font by matching glyphs.
+
+Numeric fields such as stats and Poke Ball counts are short strings drawn in
+a single font, so instead of asking Tesseract to read them, each glyph is
+cut out of the region and compared with a template of every character
+captured from the game beforehand (see `scripts/build_digit_atlas.py`). The
+templates are stored in a glyph atlas.
+
+A field is only considered read if every glyph in it matches a template
+well; the lowest match score is returned as the confidence of the reading so
+that the caller can fall back to Tesseract when it is too low.
+"""
+
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from automaxlair.image_processing import Image
+
+FORMAT_VERSION = 1
+# Size of the box that each glyph is scaled into before it is matched.
+GLYPH_HEIGHT = 20
+GLYPH_WIDTH = 16
+# Glyphs shorter than this fraction of the tallest glyph in a region are
+# treated as noise.
+MIN_GLYPH_HEIGHT_FRACTION = 0.4
+
+
+def binarize(img: Image) -> Image:
+    """Return a binary image of a region with the text in white, whether the
+    text in the region is light or dark.
+    """
+
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    __, binary = cv2.threshold(
+        img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # The background is whichever colour covers most of the border.
+    border = np.concatenate(
+        (binary[0], binary[-1], binary[:, 0], binary[:, -1]))
+    if border.mean() > 127:
+        binary = cv2.bitwise_not(binary)
+    return binary
+
+
+def segment_glyphs(binary: Image) -> List[Image]:
+    """Split a binary image of one line of text into its glyphs, from left to
+    right, each cropped to its bounding box.
+
+    Glyphs are separated by columns without any text, so glyphs that touch
+    are returned as one glyph (which won't match any template well).
+    """
+
+    columns = np.flatnonzero(binary.any(axis=0))
+    if len(columns) == 0:
+        return []
+    # Split the columns that contain text into runs of adjacent columns.
+    breaks = np.flatnonzero(np.diff(columns) > 1) + 1
+    glyphs = []
+    for run in np.split(columns, breaks):
+        glyph = binary[:, run[0]:run[-1] + 1]
+        rows = np.flatnonzero(glyph.any(axis=1))
+        glyphs.append(glyph[rows[0]:rows[-1] + 1])
+    tallest = max(glyph.shape[0] for glyph in glyphs)
+    return [
+        glyph for glyph in glyphs
+        if glyph.shape[0] >= MIN_GLYPH_HEIGHT_FRACTION * tallest]
+
+
+def scale_glyph(glyph: Image) -> np.ndarray:
+    """Scale a glyph to the template height, keeping its aspect ratio, and
+    centre it in a box the size of a template.
+    """
+
+    height, width = glyph.shape
+    scaled_width = min(
+        GLYPH_WIDTH, max(1, int(round(width * GLYPH_HEIGHT / height))))
+    scaled = cv2.resize(
+        glyph, (scaled_width, GLYPH_HEIGHT), interpolation=cv2.INTER_AREA)
+    box = np.zeros((GLYPH_HEIGHT, GLYPH_WIDTH), np.float32)
+    left = (GLYPH_WIDTH - scaled_width) // 2
+    box[:, left:left + scaled_width] = scaled
+    return box
+
+
+def normalize_glyph(box: np.ndarray) -> np.ndarray:
+    """Blur a scaled glyph and return it flattened, with zero mean and unit
+    norm, so that the dot product of two normalized glyphs is their
+    normalized cross-correlation.
+    """
+
+    # Blur the glyph so that strokes one pixel thicker or shifted by a pixel
+    # still match.
+    box = cv2.GaussianBlur(box, (3, 3), 0).ravel()
+    box = box - box.mean()
+    norm = np.linalg.norm(box)
+    return box / norm if norm > 0 else box
+
+
+class DigitRecognizer:
+    """Read short strings by matching their glyphs against a glyph atlas.
+
+    The atlas can hold several templates for a character (e.g., from
+    different capture resolutions); a glyph is read as the character of the
+    template that matches it best.
+    """
+
+    def __init__(
+        self, characters: Sequence[str], glyphs: np.ndarray
+    ) -> None:
+        self.characters = list(characters)
+        # Scaled glyph of each character, and its normalized template.
+        self.glyphs = np.asarray(glyphs, np.float32)
+        self.templates = np.stack(
+            [normalize_glyph(glyph) for glyph in self.glyphs])
+
+    @classmethod
+    def load(cls, file_path: str) -> 'DigitRecognizer':
+        """Load a glyph atlas saved by `save`."""
+        with np.load(file_path, allow_pickle=False) as archive:
+            if int(archive['format_version']) != FORMAT_VERSION:
+                raise ValueError(
+                    f'Unsupported glyph atlas format in {file_path}.')
+            return cls(archive['characters'].tolist(), archive['glyphs'])
+
+    def save(self, file_path: str) -> None:
+        """Save the atlas as a compressed numpy archive."""
+        np.savez_compressed(
+            file_path,
+            format_version=np.array(FORMAT_VERSION),
+            characters=np.array(self.characters),
+            glyphs=self.glyphs)
+
+    def match_glyphs(
+        self, glyphs: Sequence[Image]
+    ) -> Tuple[str, np.ndarray]:
+        """Return the characters that best match each glyph and their match
+        scores (from -1 to 1).
+        """
+
+        if len(glyphs) == 0:
+            return '', np.zeros(0, np.float32)
+        scores = np.stack([
+            normalize_glyph(scale_glyph(glyph)) for glyph in glyphs
+        ]) @ self.templates.T
+        best = scores.argmax(axis=1)
+        text = ''.join(self.characters[i] for i in best)
+        return text, scores[np.arange(len(glyphs)), best]
+
+    def read(self, img: Image) -> Tuple[str, float]:
+        """Read the text in a region of a grayscale or BGR image. Returns the
+        text and the lowest match score of its glyphs, which is 0 if no
+        glyphs were found.
+        """
+
+        text, scores = self.match_glyphs(segment_glyphs(binarize(img)))
+        return text, float(scores.min()) if len(scores) > 0 else 0.0
+
+
+def build_atlas(
+    samples: Iterable[Tuple[Image, str]]
+) -> Tuple[DigitRecognizer, Dict[str, int]]:
+    """Build a glyph atlas from images of regions and the text they contain.
+
+    The glyph of each character is the average of every glyph of that
+    character once scaled. Samples whose number of glyphs doesn't match their
+    text are skipped. Returns the recognizer and the number of glyphs used
+    for each character.
+    """
+
+    sums: Dict[str, np.ndarray] = {}
+    counts: Dict[str, int] = {}
+    for img, text in samples:
+        glyphs = segment_glyphs(binarize(img))
+        if len(glyphs) != len(text):
+            continue
+        for character, glyph in zip(text, glyphs):
+            sums[character] = sums.get(character, 0) + scale_glyph(glyph)
+            counts[character] = counts.get(character, 0) + 1
+    if len(sums) == 0:
+        raise ValueError('No sample could be split into its characters.')
+    characters = sorted(sums)
+    return DigitRecognizer(characters, np.stack([
+        sums[character] / counts[character] for character in characters
+    ])), counts
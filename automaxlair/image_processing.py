@@ -0,0 +1,203 @@
+"""Helpers for processing regions of frames from the Switch.
+
+Rectangles are given as fractions of the frame size, ((x0, y0), (x1, y1)).
+Every operation here works pixel by pixel, so regions are cropped first and
+only the cropped pixels are converted or thresholded.
+"""
+
+import functools
+import time
+from typing import Any, Dict, Optional, Tuple, TypeVar, Union
+
+import cv2
+
+Image = TypeVar('cv2 image')
+Rectangle = Tuple[Tuple[float, float], Tuple[float, float]]
+
+# Rectangle covering an entire frame.
+FULL_RECT = ((0, 0), (1, 1))
+# HSV range of the white text that is read when thresholding.
+TEXT_LOWER_HSV = (0, 0, 160)
+TEXT_UPPER_HSV = (180, 15, 255)
+# Width of the grayscale signatures used to tell whether a region changed,
+# and the number of pixels sampled along each side of a signature pixel.
+SIGNATURE_WIDTH = 64
+SIGNATURE_SAMPLES = 4
+
+
+@functools.lru_cache(maxsize=None)
+def get_pixel_bounds(
+    rect: Rectangle, height: int, width: int
+) -> Tuple[int, int, int, int]:
+    """Return the pixel bounds (top, bottom, left, right) of a rectangle in a
+    frame of the given size. Results are cached, so each named rectangle is
+    only converted once per resolution.
+    """
+
+    return (
+        round(rect[0][1] * height), round(rect[1][1] * height),
+        round(rect[0][0] * width), round(rect[1][0] * width))
+
+
+def crop(img: Image, rect: Rectangle) -> Image:
+    """Return the portion of an image inside a rectangle."""
+    top, bottom, left, right = get_pixel_bounds(rect, *img.shape[:2])
+    return img[top:bottom, left:right]
+
+
+def preprocess_text_region(
+    img: Image, rect: Rectangle, threshold: bool = True, invert: bool = False
+) -> Image:
+    """Crop a region of a BGR image and prepare it for OCR, optionally
+    isolating white text and inverting the result.
+    """
+
+    img = crop(img, rect)
+    if threshold:
+        img = cv2.inRange(
+            cv2.cvtColor(img, cv2.COLOR_BGR2HSV), TEXT_LOWER_HSV,
+            TEXT_UPPER_HSV)
+    if invert:
+        img = cv2.bitwise_not(img)
+    return img
+
+
+def get_HSV_mask_mean(
+    img: Image,
+    rect: Rectangle,
+    lower_threshold: Tuple[int, int, int],
+    upper_threshold: Tuple[int, int, int],
+    already_HSV: bool = False
+) -> float:
+    """Return the mean value (0 to 255) of the mask of the pixels in a
+    region that are within an HSV range.
+    """
+
+    img = crop(img, rect)
+    if not already_HSV:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    return cv2.inRange(img, lower_threshold, upper_threshold).mean()
+
+
+def get_signature(
+    img: Image, rect: Rectangle, width: int = SIGNATURE_WIDTH
+) -> Image:
+    """Return a small grayscale image summarizing a region of a BGR image,
+    keeping the aspect ratio of the region.
+
+    The region is first sampled with nearest-neighbour interpolation, which
+    is much faster than averaging every pixel, and then averaged down so
+    that each signature pixel is the mean of a few samples.
+    """
+
+    img = crop(img, rect)
+    height = max(1, round(width * img.shape[0] / max(1, img.shape[1])))
+    sampled = cv2.resize(
+        img, (width * SIGNATURE_SAMPLES, height * SIGNATURE_SAMPLES),
+        interpolation=cv2.INTER_NEAREST)
+    return cv2.resize(
+        cv2.cvtColor(sampled, cv2.COLOR_BGR2GRAY), (width, height),
+        interpolation=cv2.INTER_AREA)
+
+
+class Frame:
+    """A frame from the Switch along with its capture time and the results
+    of processing it.
+
+    Conversions to HSV and grayscale, processed text regions, and the means
+    of HSV masks are computed the first time they are needed and reused by
+    every later check on the same frame. The cached results assume that the
+    image is not modified after the frame is created.
+    """
+
+    def __init__(
+        self, image: Image, timestamp: Optional[float] = None, index: int = -1
+    ) -> None:
+        self.image = image
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.index = index
+        self._cache: Dict[Tuple, Any] = {}
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.image.shape
+
+    def crop(self, rect: Rectangle) -> Image:
+        """Return the portion of the BGR image inside a rectangle."""
+        return crop(self.image, rect)
+
+    def _convert(self, code: int, rect: Rectangle) -> Image:
+        key = ('convert', code, rect)
+        if key not in self._cache:
+            full_key = ('convert', code, FULL_RECT)
+            if full_key in self._cache:
+                # Reuse a conversion of the whole frame if one exists.
+                self._cache[key] = crop(self._cache[full_key], rect)
+            else:
+                self._cache[key] = cv2.cvtColor(self.crop(rect), code)
+        return self._cache[key]
+
+    def get_HSV(self, rect: Rectangle = FULL_RECT) -> Image:
+        """Return a region of the frame converted to HSV."""
+        return self._convert(cv2.COLOR_BGR2HSV, rect)
+
+    def get_gray(self, rect: Rectangle = FULL_RECT) -> Image:
+        """Return a region of the frame converted to grayscale."""
+        return self._convert(cv2.COLOR_BGR2GRAY, rect)
+
+    def get_text_region(
+        self, rect: Rectangle, threshold: bool = True, invert: bool = False
+    ) -> Image:
+        """Return a region of the frame prepared for OCR (see
+        `preprocess_text_region`).
+        """
+
+        key = ('text', rect, threshold, invert)
+        if key not in self._cache:
+            img = self.crop(rect)
+            if threshold:
+                img = cv2.inRange(
+                    self.get_HSV(rect), TEXT_LOWER_HSV, TEXT_UPPER_HSV)
+            if invert:
+                img = cv2.bitwise_not(img)
+            self._cache[key] = img
+        return self._cache[key]
+
+    def get_HSV_mask_mean(
+        self,
+        rect: Rectangle,
+        lower_threshold: Tuple[int, int, int],
+        upper_threshold: Tuple[int, int, int]
+    ) -> float:
+        """Return the mean value (0 to 255) of the mask of the pixels in a
+        region that are within an HSV range.
+        """
+
+        key = ('in_range_mean', rect, tuple(lower_threshold),
+               tuple(upper_threshold))
+        if key not in self._cache:
+            self._cache[key] = cv2.inRange(
+                self.get_HSV(rect), lower_threshold, upper_threshold).mean()
+        return self._cache[key]
+
+    def get_signature(
+        self, rect: Rectangle = FULL_RECT, width: int = SIGNATURE_WIDTH
+    ) -> Image:
+        """Return the grayscale signature of a region (see
+        `get_signature`).
+        """
+
+        key = ('signature', rect, width)
+        if key not in self._cache:
+            self._cache[key] = get_signature(self.image, rect, width)
+        return self._cache[key]
+
+
+def as_frame(img: Union[Frame, Image]) -> Frame:
+    """Return an image as a Frame, wrapping it if necessary."""
+    return img if isinstance(img, Frame) else Frame(img)
+
+
+def as_image(img: Union[Frame, Image]) -> Image:
+    """Return the image of a Frame, or the image itself."""
+    return img.image if isinstance(img, Frame) else img
@@ -5,37 +5,84 @@
 #   2020-11-27
 
 import copy
-from typing import Dict, List, Tuple
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union)
+
+import numpy as np
+
 from automaxlair.pokemon_classes import Pokemon
 
 
+# Integer codes for each type, used to index the type chart.
+TYPE_IDS = (
+    'normal', 'fire', 'water', 'electric', 'grass', 'ice', 'fighting',
+    'poison', 'ground', 'flying', 'psychic', 'bug', 'rock', 'ghost',
+    'dragon', 'dark', 'steel', 'fairy')
+TYPE_CODES = {type_id: code for code, type_id in enumerate(TYPE_IDS)}
+
+# Damage multipliers indexed by [attack type code, target type code].
+TYPE_CHART = np.array((
+    (1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0.5, 0, 1, 1, 0.5, 1),
+    (1, 0.5, 0.5, 1, 2, 2, 1, 1, 1, 1, 1, 2, 0.5, 1, 0.5, 1, 2, 1),
+    (1, 2, 0.5, 1, 0.5, 1, 1, 1, 2, 1, 1, 1, 2, 1, 0.5, 1, 1, 1),
+    (1, 1, 2, 0.5, 0.5, 1, 1, 1, 0, 2, 1, 1, 1, 1, 0.5, 1, 1, 1),
+    (1, 0.5, 2, 1, 0.5, 1, 1, 0.5, 2, 0.5, 1, 0.5, 2, 1, 0.5, 1, 0.5, 1),
+    (1, 0.5, 0.5, 1, 2, 0.5, 1, 1, 2, 2, 1, 1, 1, 1, 2, 1, 0.5, 1),
+    (2, 1, 1, 1, 1, 2, 1, 0.5, 1, 0.5, 0.5, 0.5, 2, 0, 1, 2, 2, 0.5),
+    (1, 1, 1, 1, 2, 1, 1, 0.5, 0.5, 1, 1, 1, 0.5, 0.5, 1, 1, 0, 2),
+    (1, 2, 1, 2, 0.5, 1, 1, 2, 1, 0, 1, 0.5, 2, 1, 1, 1, 2, 1),
+    (1, 1, 1, 0.5, 2, 1, 2, 1, 1, 1, 1, 2, 0.5, 1, 1, 1, 0.5, 1),
+    (1, 1, 1, 1, 1, 1, 2, 2, 1, 1, 0.5, 1, 1, 1, 1, 0, 0.5, 1),
+    (1, 0.5, 1, 1, 2, 1, 0.5, 0.5, 1, 0.5, 2, 1, 1, 0.5, 1, 2, 0.5, 0.5),
+    (1, 2, 1, 1, 1, 2, 0.5, 1, 0.5, 2, 1, 2, 1, 1, 1, 1, 0.5, 1),
+    (0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 2, 1, 1, 2, 1, 0.5, 1, 1),
+    (1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 2, 1, 0.5, 0),
+    (1, 1, 1, 1, 1, 1, 0.5, 1, 1, 1, 2, 1, 1, 2, 1, 0.5, 1, 0.5),
+    (1, 0.5, 0.5, 0.5, 1, 2, 1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 0.5, 2),
+    (1, 0.5, 1, 1, 1, 1, 2, 0.5, 1, 1, 1, 1, 1, 1, 2, 2, 0.5, 1)
+), dtype=np.float64)
+TYPE_CHART.setflags(write=False)
+
+# Abilities that let the attacker ignore the defender's ability.
+MOLD_BREAKER_ABILITIES = ('mold-breaker', 'turboblaze', 'teravolt')
+# Abilities that convert Normal-type moves into another type.
+TYPE_CHANGING_ABILITIES = {
+    'refrigerate': 'ice', 'aerilate': 'flying', 'galvanize': 'electric',
+    'pixilate': 'fairy'}
+# Moves boosted by Iron Fist and Strong Jaw respectively.
+PUNCHING_MOVES = (
+    'bullet-punch', 'comet-punch', 'dizzy-punch', 'double-iron-bash',
+    'drain-punch', 'dynamic-punch', 'fire-punch', 'focus-punch',
+    'hammer-arm', 'ice-hammer', 'ice-punch', 'mach-punch', 'mega-punch',
+    'meteor-mash', 'plasma-fists', 'power-up-punch', 'shadow-punch',
+    'sky-uppercut', 'surging-strikes', 'thunder-punch', 'wicked-blow')
+BITING_MOVES = (
+    'bite', 'crunch', 'fire-fang', 'fishious-rend', 'hyper-fang',
+    'ice-fang', 'jaw-lock', 'poison-fang', 'psychic-fangs', 'thunder-fang')
+# Multipliers that a defender's ability applies to incoming moves of certain
+# types. Mirrors the type-based section of ability_damage_multiplier.
+DEFENDER_ABILITY_MULTIPLIERS = {
+    'levitate': {'ground': 0.0},
+    'water-absorb': {'water': -1.0},
+    'storm-drain': {'water': -1.0},
+    'dry-skin': {'water': -1.0, 'fire': 2.0},
+    'flash-fire': {'fire': -1.0},
+    'fluffy': {'fire': 2.0},
+    'thick-fat': {'fire': 0.5, 'ice': 0.5},
+    'heatproof': {'fire': 0.5},
+    'sap-sipper': {'grass': -1.0},
+    'lightning-rod': {'electric': -1.0},
+    'motor-drive': {'electric': -1.0},
+    'volt-absorb': {'electric': -1.0}
+}
+
+
 def type_damage_multiplier_single(type1: str, type2: str) -> float:
     """Return a damage multiplier based on an attack type and target type."""
-
-    types = (
-        'normal', 'fire', 'water', 'electric', 'grass', 'ice', 'fighting',
-        'poison', 'ground', 'flying', 'psychic', 'bug', 'rock', 'ghost',
-        'dragon', 'dark', 'steel', 'fairy')
-    return (
-        (1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0.5, 0, 1, 1, 0.5, 1),
-        (1, 0.5, 0.5, 1, 2, 2, 1, 1, 1, 1, 1, 2, 0.5, 1, 0.5, 1, 2, 1),
-        (1, 2, 0.5, 1, 0.5, 1, 1, 1, 2, 1, 1, 1, 2, 1, 0.5, 1, 1, 1),
-        (1, 1, 2, 0.5, 0.5, 1, 1, 1, 0, 2, 1, 1, 1, 1, 0.5, 1, 1, 1),
-        (1, 0.5, 2, 1, 0.5, 1, 1, 0.5, 2, 0.5, 1, 0.5, 2, 1, 0.5, 1, 0.5, 1),
-        (1, 0.5, 0.5, 1, 2, 0.5, 1, 1, 2, 2, 1, 1, 1, 1, 2, 1, 0.5, 1),
-        (2, 1, 1, 1, 1, 2, 1, 0.5, 1, 0.5, 0.5, 0.5, 2, 0, 1, 2, 2, 0.5),
-        (1, 1, 1, 1, 2, 1, 1, 0.5, 0.5, 1, 1, 1, 0.5, 0.5, 1, 1, 0, 2),
-        (1, 2, 1, 2, 0.5, 1, 1, 2, 1, 0, 1, 0.5, 2, 1, 1, 1, 2, 1),
-        (1, 1, 1, 0.5, 2, 1, 2, 1, 1, 1, 1, 2, 0.5, 1, 1, 1, 0.5, 1),
-        (1, 1, 1, 1, 1, 1, 2, 2, 1, 1, 0.5, 1, 1, 1, 1, 0, 0.5, 1),
-        (1, 0.5, 1, 1, 2, 1, 0.5, 0.5, 1, 0.5, 2, 1, 1, 0.5, 1, 2, 0.5, 0.5),
-        (1, 2, 1, 1, 1, 2, 0.5, 1, 0.5, 2, 1, 2, 1, 1, 1, 1, 0.5, 1),
-        (0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 2, 1, 1, 2, 1, 0.5, 1, 1),
-        (1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 2, 1, 0.5, 0),
-        (1, 1, 1, 1, 1, 1, 0.5, 1, 1, 1, 2, 1, 1, 2, 1, 0.5, 1, 0.5),
-        (1, 0.5, 0.5, 0.5, 1, 2, 1, 1, 1, 1, 1, 1, 2, 1, 1, 1, 0.5, 2),
-        (1, 0.5, 1, 1, 1, 1, 2, 0.5, 1, 1, 1, 1, 1, 1, 2, 2, 0.5, 1)
-    )[types.index(type1)][types.index(type2)]
+    return float(TYPE_CHART[TYPE_CODES[type1], TYPE_CODES[type2]])
 
 
 def type_damage_multiplier(move_type: str, defender_types: List[str]) -> float:
@@ -58,9 +105,7 @@ def ability_damage_multiplier(
     return_val = 1.0
 
     # Account for abilities that affect the damage of certain move types.
-    if attacker.ability_name_id not in (
-        'mold-breaker', 'turboblaze', 'teravolt'
-    ):
+    if attacker.ability_name_id not in MOLD_BREAKER_ABILITIES:
         if move_type == 'ground' and defender.ability_name_id == 'levitate':
             if move_name_id == 'thousand-arrows':
                 return_val = 1.0
@@ -91,17 +136,14 @@ def ability_damage_multiplier(
         return_val *= 2
 
     # Account for abilities that affect the damage of specific moves.
-    if attacker.ability_name_id == 'iron-fist' and move_name_id in (
-        'bullet-punch', 'comet-punch', 'dizzy-punch', 'double-iron-bash',
-        'drain-punch', 'dynamic-punch', 'fire-punch', 'focus-punch',
-        'hammer-arm', 'ice-hammer', 'ice-punch', 'mach-punch', 'mega-punch',
-        'meteor-mash', 'plasma-fists', 'power-up-punch', 'shadow-punch',
-        'sky-uppercut', 'surging-strikes', 'thunder-punch', 'wicked-blow'
+    if (
+        attacker.ability_name_id == 'iron-fist'
+        and move_name_id in PUNCHING_MOVES
     ):
         return_val *= 1.2
-    elif attacker.ability_name_id == 'strong-jaw' and move_name_id in (
-        'bite', 'crunch', 'fire-fang', 'fishious-rend', 'hyper-fang',
-        'ice-fang', 'jaw-lock', 'poison-fang', 'psychic-fangs', 'thunder-fang'
+    elif (
+        attacker.ability_name_id == 'strong-jaw'
+        and move_name_id in BITING_MOVES
     ):
         return_val *= 1.5
     if attacker.ability_name_id == (
@@ -132,43 +174,36 @@ def calculate_damage(
     # Ignore weather for now
     # Ignore crits
 
-    # It needs to be before STAB
-    if move.type_id == 'normal':
-        if attacker.ability_name_id == 'refrigerate':
-            move.type_id = 'ice'
-            modifier *= 1.2
-        elif attacker.ability_name_id == 'aerilate':
-            move.type_id = 'fly'
-            modifier *= 1.2
-        elif attacker.ability_name_id == 'galvanize':
-            move.type_id = 'fly'
-            modifier *= 1.2
-        elif attacker.ability_name_id == 'aerilate':
-            move.type_id = 'fly'
+    # It needs to be before STAB. Note that the converted type is kept in a
+    # local variable because the Move objects are shared between Pokemon.
+    move_type = move.type_id
+    if move_type == 'normal':
+        if attacker.ability_name_id in TYPE_CHANGING_ABILITIES:
+            move_type = TYPE_CHANGING_ABILITIES[attacker.ability_name_id]
             modifier *= 1.2
     else:
         if attacker.ability_name_id == 'normalize':
-            move.type_id = 'normal'
+            move_type = 'normal'
             modifier *= 1.2
 
-    if move.type_id in attacker.type_ids:  # Apply STAB
+    if move_type in attacker.type_ids:  # Apply STAB
         # Note that Adaptability is handled elsewhere.
         modifier *= 1.5
     # Apply type effectiveness
     if move.name_id != 'thousand-arrows' or 'flying' not in defender.type_ids:
-        modifier *= type_damage_multiplier(move.type_id, defender.type_ids)
+        modifier *= type_damage_multiplier(move_type, defender.type_ids)
     # Apply status effects
     if move.category == 'physical' and attacker.status == 'burn':
         modifier *= 0.5
     # Apply modifiers from abilities
     modifier *= ability_damage_multiplier(attacker, move_index, defender)
     # Apply boosts from auras
-    if move.type_id == 'fairy' and (
+    if move_type == 'fairy' and (
         attacker.ability_name_id == 'fairy-aura'
         or defender.ability_name_id == 'fairy-aura'
     ):
         modifier *= 1.33
-    if move.type_id == 'dark' and (
+    if move_type == 'dark' and (
         attacker.ability_name_id == 'dark-aura'
         or defender.ability_name_id == 'dark-aura'
     ):
@@ -194,6 +229,161 @@ def calculate_damage(
         / 50 + 2) * modifier / defender.stats[0])
 
 
+class PokemonBatch():
+    """Struct-of-arrays representation of a group of Pokemon, used by the
+    vectorized damage kernel.
+
+    Move arrays have the shape (number of Pokemon, maximum number of moves)
+    and are padded for Pokemon with fewer moves, with `move_mask` flagging the
+    real entries. Like calculate_damage, the Max Moves are used for any Pokemon
+    that is Dynamaxed when the batch is built, so a new batch is needed if the
+    state of the underlying Pokemon changes.
+    """
+
+    def __init__(self, pokemon: Iterable[Pokemon]) -> None:
+        self.pokemon = list(pokemon)
+        self.name_ids = [member.name_id for member in self.pokemon]
+        num_pokemon = len(self.pokemon)
+        num_moves = max(
+            (len(member.moves) for member in self.pokemon), default=0)
+        move_shape = (num_pokemon, num_moves)
+
+        self.level = np.zeros(num_pokemon)
+        self.stats = np.ones((num_pokemon, 6))
+        self.type_mask = np.zeros((num_pokemon, len(TYPE_IDS)), dtype=bool)
+        self.ability_name_ids = np.empty(num_pokemon, dtype=object)
+        self.burned = np.zeros(num_pokemon, dtype=bool)
+
+        self.move_mask = np.zeros(move_shape, dtype=bool)
+        self.move_name_ids = np.full(move_shape, '', dtype=object)
+        self.move_types = np.zeros(move_shape, dtype=np.intp)
+        self.base_move_types = np.zeros(move_shape, dtype=np.intp)
+        self.power = np.zeros(move_shape)
+        self.accuracy = np.zeros(move_shape)
+        self.is_spread = np.zeros(move_shape, dtype=bool)
+        self.is_physical = np.zeros(move_shape, dtype=bool)
+
+        # Lookups used when the Pokemon are defending: the combined type
+        # multiplier and the ability multiplier for a move of each type.
+        self.type_multipliers = np.ones((num_pokemon, len(TYPE_IDS)))
+        self.ability_multipliers = np.ones((num_pokemon, len(TYPE_IDS)))
+
+        for i, member in enumerate(self.pokemon):
+            self.level[i] = member.level
+            self.stats[i] = member.stats
+            self.ability_name_ids[i] = member.ability_name_id
+            self.burned[i] = member.status == 'burn'
+            for type_id in member.type_ids:
+                self.type_mask[i, TYPE_CODES[type_id]] = True
+                self.type_multipliers[i] *= TYPE_CHART[:, TYPE_CODES[type_id]]
+            for type_id, factor in DEFENDER_ABILITY_MULTIPLIERS.get(
+                member.ability_name_id, {}
+            ).items():
+                self.ability_multipliers[i, TYPE_CODES[type_id]] = factor
+
+            moves = member.max_moves if member.dynamax else member.moves
+            for j in range(len(member.moves)):
+                move = moves[j]
+                self.move_mask[i, j] = True
+                self.move_name_ids[i, j] = move.name_id
+                self.move_types[i, j] = TYPE_CODES[move.type_id]
+                self.base_move_types[i, j] = TYPE_CODES[
+                    member.moves[j].type_id]
+                self.power[i, j] = move.power
+                self.accuracy[i, j] = move.accuracy
+                self.is_spread[i, j] = move.is_spread
+                self.is_physical[i, j] = move.category == 'physical'
+
+    def __len__(self) -> int:
+        return len(self.pokemon)
+
+
+def calculate_damage_batch(
+    attackers: PokemonBatch, defenders: PokemonBatch,
+    multiple_targets: bool = False
+) -> np.ndarray:
+    """Return the damage (default %) of every move of every attacker against
+    every defender as an array with the shape (attackers, moves, defenders).
+
+    This is a vectorized equivalent of calculate_damage, which remains the
+    reference implementation. Padded move slots are filled with NaN.
+    """
+
+    atk = attackers
+    dfn = defenders
+
+    modifier = 0.925 * atk.accuracy
+    if multiple_targets:
+        modifier = np.where(atk.is_spread, modifier * 0.75, modifier)
+
+    # Convert move types from abilities before applying STAB.
+    is_normal = atk.move_types == TYPE_CODES['normal']
+    move_types = atk.move_types.copy()
+    for ability, type_id in TYPE_CHANGING_ABILITIES.items():
+        converted = is_normal & (atk.ability_name_ids == ability)[:, None]
+        move_types[converted] = TYPE_CODES[type_id]
+        modifier = np.where(converted, modifier * 1.2, modifier)
+    converted = ~is_normal & (atk.ability_name_ids == 'normalize')[:, None]
+    move_types[converted] = TYPE_CODES['normal']
+    modifier = np.where(converted, modifier * 1.2, modifier)
+
+    # Apply STAB, status effects, and move-specific attacker abilities.
+    stab = np.take_along_axis(atk.type_mask, move_types, axis=1)
+    modifier = np.where(stab, modifier * 1.5, modifier)
+    modifier = np.where(
+        atk.is_physical & atk.burned[:, None], modifier * 0.5, modifier)
+    modifier = np.where(
+        (atk.ability_name_ids == 'iron-fist')[:, None]
+        & np.isin(atk.move_name_ids, PUNCHING_MOVES), modifier * 1.2, modifier)
+    modifier = np.where(
+        (atk.ability_name_ids == 'strong-jaw')[:, None]
+        & np.isin(atk.move_name_ids, BITING_MOVES), modifier * 1.5, modifier)
+
+    # Apply type effectiveness, broadcasting to (attackers, moves, defenders).
+    thousand_arrows = (atk.move_name_ids == 'thousand-arrows')[:, :, None]
+    type_factor = dfn.type_multipliers.T[move_types]
+    type_factor = np.where(
+        thousand_arrows & dfn.type_mask[:, TYPE_CODES['flying']],
+        1.0, type_factor)
+
+    # Apply defender abilities, which use the type of the regular move.
+    ability_factor = dfn.ability_multipliers.T[atk.base_move_types]
+    ability_factor = np.where(
+        thousand_arrows
+        & (atk.base_move_types == TYPE_CODES['ground'])[:, :, None]
+        | np.isin(atk.ability_name_ids, MOLD_BREAKER_ABILITIES)[:, None, None],
+        1.0, ability_factor)
+    modifier = modifier[:, :, None] * type_factor * ability_factor
+
+    # Apply boosts from auras.
+    for aura, type_id in (('fairy-aura', 'fairy'), ('dark-aura', 'dark')):
+        boosted = (move_types == TYPE_CODES[type_id])[:, :, None] & (
+            (atk.ability_name_ids == aura)[:, None, None]
+            | (dfn.ability_name_ids == aura))
+        modifier = np.where(boosted, modifier * 1.33, modifier)
+
+    # Apply attacker and defender stats.
+    numerator = np.where(
+        atk.is_physical,
+        np.where(
+            atk.move_name_ids == 'body-press',
+            atk.stats[:, 2:3], atk.stats[:, 1:2]),
+        atk.stats[:, 3:4])[:, :, None]
+    numerator = np.where(
+        (atk.is_physical & (atk.move_name_ids == 'foul-play'))[:, :, None],
+        dfn.stats[:, 1], numerator)
+    denominator = np.where(
+        (atk.is_physical | np.isin(
+            atk.move_name_ids, ('psystrike', 'psyshock')))[:, :, None],
+        dfn.stats[:, 2], dfn.stats[:, 4])
+
+    damage = ((
+        (2 / 5 * atk.level[:, None, None] + 2) * atk.power[:, :, None]
+        * numerator / denominator / 50 + 2) * modifier / dfn.stats[:, 0])
+    damage[~atk.move_mask] = np.nan
+    return damage
+
+
 def calculate_average_damage(
     attackers: Dict[str, Pokemon], defenders: Dict[str, Pokemon],
     multiple_targets: bool = False
@@ -223,23 +413,143 @@ def calculate_average_damage(
         return total_damage / count
 
 
+def get_pokemon_key(pokemon: Pokemon) -> tuple:
+    """Return a hashable key describing everything about a Pokemon that
+    affects the damage it deals and receives, except for its PP.
+    """
+
+    return (
+        pokemon.name_id, pokemon.ability_name_id, tuple(pokemon.type_ids),
+        tuple(move.name_id for move in pokemon.moves), tuple(pokemon.stats),
+        pokemon.status, pokemon.dynamax)
+
+
+class TeammateAggregates():
+    """Cached average damage dealt by and to a pool of teammates.
+
+    For each defender (and each Dynamax state of that defender) the average
+    damage of every teammate is computed once with the vectorized kernel and
+    stored alongside its sum, so that excluding the attacker and defender from
+    the pool only requires subtracting their entries. The teammates are
+    snapshotted the first time an average is needed, so that creating the
+    object doesn't build every Pokemon of a lazily loaded mapping.
+    """
+
+    def __init__(self, teammates: Mapping[str, Pokemon]) -> None:
+        self.teammates = teammates
+        self.index = {name_id: i for i, name_id in enumerate(teammates)}
+        self._batch: Optional[PokemonBatch] = None
+        self.cache = {}
+
+    @property
+    def batch(self) -> PokemonBatch:
+        """Batch of the teammates, built the first time it is needed."""
+        if self._batch is None:
+            self._batch = PokemonBatch(
+                self.teammates[name_id] for name_id in self.index)
+        return self._batch
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get_damage_dealt(
+        self, defender: Pokemon, exclude: Iterable[str] = ()
+    ) -> float:
+        """Return the average damage of the teammates against the defender,
+        equivalent to calculate_average_damage(teammates, {defender}).
+        """
+
+        return self._get_average(defender, 'dealt', exclude)
+
+    def get_damage_received(
+        self, defender: Pokemon, exclude: Iterable[str] = (),
+        multiple_targets: bool = False
+    ) -> float:
+        """Return the average damage of the defender against the teammates,
+        equivalent to calculate_average_damage({defender}, teammates).
+        """
+
+        return self._get_average(
+            defender, 'spread' if multiple_targets else 'received', exclude)
+
+    def _get_average(
+        self, defender: Pokemon, kind: str, exclude: Iterable[str]
+    ) -> float:
+        """Return a cached average with some teammates left out."""
+        values, total = self._get_entry(defender)[kind]
+        count = len(self.index)
+        for name_id in set(exclude):
+            i = self.index.get(name_id)
+            if i is not None:
+                total -= values[i]
+                count -= 1
+        return total / count if count > 0 else 0
+
+    def _get_entry(self, defender: Pokemon) -> Dict[str, tuple]:
+        """Return the per-teammate damage arrays and their sums for the
+        defender, computing them if they are not cached yet.
+        """
+
+        key = get_pokemon_key(defender)
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = {}
+            defender_batch = PokemonBatch((defender,))
+            if len(self.index) > 0:
+                dealt = np.nanmean(calculate_damage_batch(
+                    self.batch, defender_batch)[:, :, 0], axis=1)
+                received = np.nanmean(calculate_damage_batch(
+                    defender_batch, self.batch)[0], axis=0)
+                spread = np.nanmean(calculate_damage_batch(
+                    defender_batch, self.batch, True)[0], axis=0)
+            else:
+                dealt = received = spread = np.zeros(0)
+            for kind, values in (
+                ('dealt', dealt), ('received', received), ('spread', spread)
+            ):
+                entry[kind] = (values, float(values.sum()))
+            self.cache[key] = entry
+        return entry
+
+
+# Teammates can be supplied either as a dict of Pokemon or as precomputed
+# aggregates.
+Teammates = Union[Dict[str, Pokemon], TeammateAggregates]
+
+
+def get_teammate_aggregates(teammates: Teammates) -> TeammateAggregates:
+    """Return the supplied teammates as a TeammateAggregates object, building
+    one if a dict of Pokemon was supplied.
+    """
+
+    if isinstance(teammates, TeammateAggregates):
+        return teammates
+    return TeammateAggregates(teammates)
+
+
 def calculate_move_score(
     attacker: Pokemon, move_index: int, defender: Pokemon,
-    teammates: Dict[str, Pokemon], team_contribution: float = None
+    teammates: Teammates, team_contribution: float = None
 ) -> float:
-    """Return a numerical score of an attacker's move against a defender."""
+    """Return a numerical score of an attacker's move against a defender.
+
+    Teammates can be supplied as a TeammateAggregates object, which should be
+    preferred when scoring many moves against the same pool of teammates.
+    """
+
+    teammates = get_teammate_aggregates(teammates)
+    # Don't count the attacker or defender as teammates.
+    exclude = (attacker.name_id, defender.name_id)
+
     # Calculate contribution of the move itself (assume Dynamaxed boss)
     dealt_damage = calculate_damage(attacker, move_index, defender, False) / 2
 
     # Estimate contributions by teammates (assume Dynamaxed boss).
-    # Don't count the attacker or defender as teammates.
-    popped_attacker = teammates.pop(attacker.name_id, None)
-    popped_defender = teammates.pop(defender.name_id, None)
     # The average damage of teammates is likely undercounted as some status
     # moves are helpful and the AI chooses better than random moves.
     fudge_factor = 1.5
-    dealt_damage += 3 * calculate_average_damage(
-        teammates, {defender.name_id: defender}) / 2 * fudge_factor
+    dealt_damage += 3 * teammates.get_damage_dealt(
+        defender, exclude) / 2 * fudge_factor
 
     # Estimate contributions from status moves.
     #   TODO: implement status moves besides Wide Guard.
@@ -262,9 +572,8 @@ def calculate_move_score(
                 received_regular_damage += calculate_damage(
                     defender, i, attacker, multiple_targets=True
                 ) / num_moves
-                received_regular_damage += 3 * calculate_average_damage(
-                    {defender.name_id: defender}, teammates,
-                    multiple_targets=True
+                received_regular_damage += 3 * teammates.get_damage_received(
+                    defender, exclude, multiple_targets=True
                 ) / num_moves
             else:
                 # print('Wide guard stops '+defender.moves[i].name) # DEBUG
@@ -275,8 +584,7 @@ def calculate_move_score(
                 / (2 if attacker.dynamax else 1)
             ) / num_moves
             received_regular_damage += (
-                0.75 * calculate_average_damage({defender.name_id: defender},
-                                                teammates)
+                0.75 * teammates.get_damage_received(defender, exclude)
             ) / num_moves
     # Calculate damage from Max Moves.
     # Note that bosses never seem to use Max Guard. It is assumed that the move
@@ -290,8 +598,7 @@ def calculate_move_score(
             / (2 if attacker.dynamax else 1)
         ) / num_max_moves
         received_max_move_damage += (
-            0.75 * calculate_average_damage({defender.name_id: defender},
-                                            teammates)
+            0.75 * teammates.get_damage_received(defender, exclude)
         ) / num_max_moves
     # Return the defender to its original dynamax state.
     defender.dynamax = original_dynamax_state
@@ -303,12 +610,6 @@ def calculate_move_score(
         + received_max_move_damage * max_move_probability
     )
 
-    # Re-add Pokemon temporaily removed from the dictionaries.
-    if popped_attacker is not None:
-        teammates[popped_attacker.name_id] = popped_attacker
-    if popped_defender is not None:
-        teammates[popped_defender.name_id] = popped_defender
-
     # Return the score
     try:
         return dealt_damage / received_damage
@@ -319,11 +620,12 @@ def calculate_move_score(
 
 
 def evaluate_matchup(
-    attacker: Pokemon, boss: Pokemon, teammates: Dict[str, Pokemon] = {}
+    attacker: Pokemon, boss: Pokemon, teammates: Teammates = {}
 ) -> float:
     """Return a matchup score between an attacker and defender, with the
     attacker using optimal moves and the defender using average moves.
     """
+    teammates = get_teammate_aggregates(teammates)
     if attacker.name_id == 'ditto':
         attacker = transform_ditto(attacker, boss)
     elif boss.name_id == 'ditto':
@@ -342,12 +644,14 @@ def evaluate_matchup(
 
 
 def select_best_move(attacker: Pokemon, defender: Pokemon,
-                     teammates: Dict[str, Pokemon] = {}
+                     teammates: Teammates = {}
                      ) -> Tuple[int, str, float]:
     """Return the index of the move that the attacker should use against the
     defender.
     """
 
+    teammates = get_teammate_aggregates(teammates)
+
     best_score = -100.0
     best_index = 0
     best_move_name_id = ''
@@ -362,9 +666,122 @@ def select_best_move(attacker: Pokemon, defender: Pokemon,
     return best_index, best_move_name_id, best_score
 
 
+class MoveDecisionCache():
+    """Bounded LRU cache of the decisions made by select_best_move.
+
+    The key is made from the state of the attacker and defender (including
+    their Dynamax state), which of the attacker's moves have PP remaining, and
+    the field conditions. Only whether PP is exhausted affects the decision, so
+    PP decrements that leave a move usable do not invalidate an entry. The
+    cache is cleared automatically if a different set of teammates is
+    supplied.
+
+    The cache can be filled from a background thread with `prefill` while
+    decisions are looked up.
+    """
+
+    def __init__(self, max_size: int = 256) -> None:
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.teammates = None
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset the hit and miss counters."""
+        self.hits = 0
+        self.misses = 0
+        self.miss_time = 0.0
+
+    def invalidate(self) -> None:
+        """Remove all cached decisions."""
+        with self.lock:
+            self.cache.clear()
+
+    def get_stats(self) -> Dict[str, float]:
+        """Return the hit and miss counters along with an estimate of the
+        time saved by cache hits.
+        """
+
+        lookups = self.hits + self.misses
+        average_miss_time = self.miss_time / self.misses if self.misses else 0
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0,
+            'time_saved': self.hits * average_miss_time
+        }
+
+    def select_best_move(
+        self, attacker: Pokemon, defender: Pokemon, teammates: Teammates = {},
+        field: Optional[Any] = None
+    ) -> Tuple[int, str, float]:
+        """Return the same result as select_best_move, reusing a previous
+        decision if one was made for an identical state.
+        """
+
+        key = self._get_key(attacker, defender, teammates, field)
+        with self.lock:
+            decision = self.cache.get(key)
+            if decision is not None:
+                self.hits += 1
+                self.cache.move_to_end(key)
+                return decision
+        start_time = time.perf_counter()
+        decision = select_best_move(attacker, defender, teammates)
+        self.miss_time += time.perf_counter() - start_time
+        self.misses += 1
+        self._store(key, decision)
+        return decision
+
+    def prefill(
+        self, attacker: Pokemon, defender: Pokemon, teammates: Teammates = {},
+        field: Optional[Any] = None
+    ) -> bool:
+        """Make and cache a decision ahead of time without counting it as a
+        hit or miss. Return False if the decision was already cached.
+        """
+
+        key = self._get_key(attacker, defender, teammates, field)
+        with self.lock:
+            if key in self.cache:
+                return False
+        self._store(key, select_best_move(attacker, defender, teammates))
+        return True
+
+    def _get_key(
+        self, attacker: Pokemon, defender: Pokemon, teammates: Teammates,
+        field: Optional[Any]
+    ) -> tuple:
+        """Return the cache key of a decision, clearing the cache first if
+        the teammates have changed.
+        """
+
+        with self.lock:
+            if teammates is not self.teammates:
+                self.cache.clear()
+                self.teammates = teammates
+        return (
+            get_pokemon_key(attacker), tuple(PP > 0 for PP in attacker.PP),
+            get_pokemon_key(defender),
+            None if field is None else (field.weather, field.terrain))
+
+    def _store(self, key: tuple, decision: Tuple[int, str, float]) -> None:
+        """Cache a decision, evicting the least recently used one if the
+        cache is full.
+        """
+
+        with self.lock:
+            self.cache[key] = decision
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+
 def print_matchup_summary(
-    attacker: Pokemon, defender: Pokemon, teammates: Dict[str, Pokemon] = {}
+    attacker: Pokemon, defender: Pokemon, teammates: Teammates = {}
 ) -> None:
+    teammates = get_teammate_aggregates(teammates)
     output = (
         f'Matchup between {attacker.name_id} and {defender.name_id}: '
         f'{evaluate_matchup(attacker, defender, teammates):.2f}')
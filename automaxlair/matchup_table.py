@@ -0,0 +1,178 @@
+"""Dense storage for precalculated matchup scores.
+
+The matchup LUTs map the name of an attacking rental Pokemon to a dict of
+scores against each defender. `MatchupTable` stores the same scores in a 2-D
+float32 array together with name-to-index maps so that scores for many
+Pokemon can be computed and compared with array operations.
+"""
+
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from automaxlair import matchup_scoring
+
+
+class MatchupTable(Mapping):
+    """Read-only matrix of matchup scores indexed by row and column names.
+
+    Rows are attackers and columns are defenders. For backwards
+    compatibility, `table[row_name][column_name]` returns the same score as
+    the nested dict the table was built from. Missing entries are NaN.
+    """
+
+    def __init__(
+        self, values: np.ndarray, row_names: Sequence[str],
+        column_names: Sequence[str]
+    ) -> None:
+        self.values = np.array(values, dtype=np.float32)
+        if self.values.shape != (len(row_names), len(column_names)):
+            raise ValueError(
+                f'Matchup matrix has shape {self.values.shape} but '
+                f'{len(row_names)} rows and {len(column_names)} columns were '
+                'named.')
+        self.values.flags.writeable = False
+        self.row_names = tuple(row_names)
+        self.column_names = tuple(column_names)
+        self.row_indices = {
+            name_id: i for i, name_id in enumerate(self.row_names)}
+        self.column_indices = {
+            name_id: i for i, name_id in enumerate(self.column_names)}
+
+    @classmethod
+    def from_dict(
+        cls, matchups: Dict[str, Dict[str, float]]
+    ) -> 'MatchupTable':
+        """Build a table from a nested dict of matchup scores."""
+        column_names = []
+        for row in matchups.values():
+            for column_name in row:
+                if column_name not in column_names:
+                    column_names.append(column_name)
+        column_indices = {
+            name_id: j for j, name_id in enumerate(column_names)}
+        values = np.full(
+            (len(matchups), len(column_names)), np.nan, dtype=np.float32)
+        for i, row in enumerate(matchups.values()):
+            for column_name, score in row.items():
+                values[i, column_indices[column_name]] = score
+        return cls(values, list(matchups), column_names)
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        """Return the scores as a nested dict, omitting missing entries."""
+        return {row_name: self[row_name] for row_name in self.row_names}
+
+    def save(self, file_path: str) -> None:
+        """Save the table to a single .npz file."""
+        np.savez(
+            file_path, values=self.values,
+            row_names=np.array(self.row_names),
+            column_names=np.array(self.column_names))
+
+    @classmethod
+    def load(cls, file_path: str) -> 'MatchupTable':
+        """Load a table saved with `save`."""
+        with np.load(file_path, allow_pickle=False) as archive:
+            return cls(
+                archive['values'], archive['row_names'].tolist(),
+                archive['column_names'].tolist())
+
+    def __getitem__(self, row_name: str) -> Dict[str, float]:
+        values = self.values[self.row_indices[row_name]].tolist()
+        return {
+            column_name: score for column_name, score in zip(
+                self.column_names, values) if score == score}
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.row_names)
+
+    def __len__(self) -> int:
+        return len(self.row_names)
+
+    def __contains__(self, row_name: object) -> bool:
+        return row_name in self.row_indices
+
+    def get(self, row_name: str, column_name: str) -> float:
+        """Return a single score."""
+        return float(self.values[
+            self.row_indices[row_name], self.column_indices[column_name]])
+
+    def get_row_indices(
+        self, row_names: Optional[Sequence[str]] = None
+    ) -> np.ndarray:
+        """Return the indices of the named rows (all rows by default)."""
+        if row_names is None:
+            return np.arange(len(self.row_names))
+        return np.array(
+            [self.row_indices[name_id] for name_id in row_names],
+            dtype=np.intp)
+
+    def get_row(
+        self, row_name: str, column_names: Optional[Sequence[str]] = None
+    ) -> np.ndarray:
+        """Return the scores of one attacker against the named defenders
+        (all defenders by default).
+        """
+
+        row = self.values[self.row_indices[row_name]]
+        if column_names is None:
+            return row
+        return row[[self.column_indices[name_id] for name_id in column_names]]
+
+    def get_column(
+        self, column_name: str, row_names: Optional[Sequence[str]] = None
+    ) -> np.ndarray:
+        """Return the scores of the named attackers (all attackers by
+        default) against one defender.
+        """
+
+        column = self.values[:, self.column_indices[column_name]]
+        if row_names is None:
+            return column
+        return column[self.get_row_indices(row_names)]
+
+    def align_row_scores(self, scores: Dict[str, float]) -> np.ndarray:
+        """Return an array of per-attacker scores in the order of the rows."""
+        return np.array(
+            [scores[name_id] for name_id in self.row_names], dtype=np.float32)
+
+    def get_weighted_scores(
+        self, column_name: str, row_scores: np.ndarray, row_weight: int,
+        column_weight: int, row_names: Optional[Sequence[str]] = None
+    ) -> np.ndarray:
+        """Return weighted scores of the named attackers (all attackers by
+        default), combining their overall scores (`row_scores`, aligned with
+        the rows) and their scores against the defender `column_name`.
+        """
+
+        indices = self.get_row_indices(row_names)
+        return matchup_scoring.get_weighted_score(
+            row_scores[indices], row_weight,
+            self.values[indices, self.column_indices[column_name]],
+            column_weight)
+
+    def top_k(
+        self, scores: np.ndarray, k: int,
+        row_names: Optional[Sequence[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """Return the k highest scores and their row names, best first.
+        `scores` is aligned with `row_names` (all rows by default).
+        """
+
+        if row_names is None:
+            row_names = self.row_names
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(row_names[i], float(scores[i])) for i in best]
+
+    def argmax(
+        self, scores: np.ndarray, row_names: Optional[Sequence[str]] = None
+    ) -> str:
+        """Return the row name with the highest score."""
+        if row_names is None:
+            row_names = self.row_names
+        return row_names[int(np.argmax(scores))]
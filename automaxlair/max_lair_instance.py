@@ -8,9 +8,13 @@ Adventure in Pokemon Sword and Shield: the Crown Tundra.
 #       Last updated 2021-01-08
 #       Created 2020-11-20
 
-from typing import List, Tuple
+import copy
+from typing import Callable, List, Tuple
 
-import jsonpickle
+from automaxlair import matchup_scoring
+from automaxlair.path_planner import PathPlanner
+from automaxlair.pokemon_classes import Pokemon
+from automaxlair.pokemon_data_store import PokemonDataStore
 
 
 class BossNode(object):
@@ -57,7 +61,7 @@ class MaxLairInstance:
     # pylint: disable=too-many-instance-attributes
     # This class is a storage container, so having many attributes is sensible.
 
-    def __init__(self, boss: str, data_paths: List[str]) -> None:
+    def __init__(self, boss: str, data: PokemonDataStore) -> None:
         self.boss = boss
         self.pokemon = None
         self.HP = 1  # 1 = 100%
@@ -75,19 +79,18 @@ class MaxLairInstance:
         self.current_node_index = 0
 
         self.reset_stage()
-        # Load precalculated resources for choosing Pokemon and moves
-        with open(data_paths[0], 'r', encoding='utf8') as file:
-            self.boss_pokemon = jsonpickle.decode(file.read())
-        with open(data_paths[1], 'r', encoding='utf8') as file:
-            self.rental_pokemon = jsonpickle.decode(file.read())
-        with open(data_paths[2], 'r', encoding='utf8') as file:
-            self.boss_matchups = jsonpickle.decode(file.read())
-        with open(data_paths[3], 'r', encoding='utf8') as file:
-            self.rental_matchups = jsonpickle.decode(file.read())
-        with open(data_paths[4], 'r', encoding='utf8') as file:
-            self.rental_scores = jsonpickle.decode(file.read())
-        with open(data_paths[5], 'r', encoding='utf8') as file:
-            self.path_tree = jsonpickle.decode(file.read())
+        # Reference the precalculated resources for choosing Pokemon and
+        # moves, which are loaded once and shared between runs.
+        self.data = data
+        self.boss_pokemon = data.boss_pokemon
+        self.rental_pokemon = data.rental_pokemon
+        self.boss_matchups = data.boss_matchups
+        self.rental_matchups = data.rental_matchups
+        self.rental_scores = data.rental_scores
+        self.rental_score_array = data.rental_score_array
+        self.path_tree = data.path_tree
+        self.teammates = data.teammates
+        self.planner = PathPlanner(self.boss, data)
 
     def __str__(self) -> str:
         """Print information about the current instance."""
@@ -137,9 +140,59 @@ class MaxLairInstance:
         self.field = Field()
         if self.pokemon is not None:
             if self.pokemon.name_id == 'ditto':
-                self.pokemon = self.rental_pokemon['ditto']
+                self.pokemon = self.get_rental_pokemon('ditto')
             self.pokemon.dynamax = False
 
+    def get_rental_pokemon(self, name_id: str) -> Pokemon:
+        """Return a rental Pokemon whose state can be modified during the run
+        without affecting the shared data.
+        """
+
+        return self.data.get_rental_pokemon(name_id)
+
+    def get_boss_pokemon(self, name_id: str) -> Pokemon:
+        """Return a boss Pokemon whose state can be modified during the run
+        without affecting the shared data.
+        """
+
+        return self.data.get_boss_pokemon(name_id)
+
+    def get_opponent_candidates(self) -> List[str]:
+        """Return the name_ids of the rental Pokemon that can be fought at
+        the current node, which are those with the node's type.
+        """
+
+        return [
+            name_id for name_id, pokemon in self.rental_pokemon.items()
+            if self.current_node.name in pokemon.type_ids]
+
+    def precompute_opponent_moves(
+        self, prefill: Callable[[Pokemon, Pokemon], bool]
+    ) -> int:
+        """Speculatively choose the current Pokemon's moves against every
+        possible opponent at the current node, with and without Dynamax, by
+        passing each matchup to a function that caches the decision. Return
+        the number of decisions that were computed.
+
+        This method is meant to run in the background after entering a
+        node, so it works on copies of the Pokemon.
+        """
+
+        if self.pokemon is None:
+            return 0
+        pokemon = copy.copy(self.pokemon)
+        num_computed = 0
+        for name_id in self.get_opponent_candidates():
+            opponent = self.get_rental_pokemon(name_id)
+            # A Ditto transforms into the opponent at the start of battle.
+            attacker = (
+                matchup_scoring.transform_ditto(pokemon, opponent)
+                if pokemon.name_id == 'ditto' else copy.copy(pokemon))
+            for dynamax in (False, True):
+                attacker.dynamax = dynamax
+                num_computed += 1 if prefill(attacker, opponent) else 0
+        return num_computed
+
     def get_paths(
         self,
         truncate: bool = False,
@@ -166,6 +219,17 @@ class MaxLairInstance:
 
         return paths
 
+    def plan_path(self) -> float:
+        """Re-plan the target path from the current node given the current
+        Pokemon and lives, and return the estimated probability of defeating
+        the boss.
+        """
+
+        path, value = self.planner.plan(
+            self.current_node, self.pokemon, self.lives)
+        self.target_path = self.target_path[:self.current_node_index] + path
+        return value
+
     def get_next_fork_offset(self) -> int:
         """Check how many times the bot should move the cursor over in order
         to navigate down the desired path.
@@ -0,0 +1,128 @@
+"""Precalculated move decisions for every rental Pokemon against every
+possible opponent.
+
+`scripts/build_move_policy.py` scores each move of every rental Pokemon
+against every boss and rental Pokemon, with and without Dynamax, using the
+whole rental pool as teammates. Instead of storing a decision for every
+combination of exhausted PP, the table stores the order of the moves from best
+to worst: the move that select_best_move would choose is the first move in
+that order that still has PP.
+"""
+
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from automaxlair.matchup_scoring import get_pokemon_key
+from automaxlair.pokemon_classes import Pokemon
+
+FORMAT_VERSION = 1
+
+
+def save_move_policy(
+    file_path: str, attacker_names: Sequence[str],
+    defender_names: Sequence[str], scores: np.ndarray,
+    source_hashes: Sequence[str]
+) -> None:
+    """Save move scores with shape (attacker, defender, dynamax, move) as a
+    move policy table. Unused move slots contain NaN.
+    """
+
+    # A stable sort keeps the lowest index first when scores are tied, which
+    # matches the choice made by select_best_move.
+    order = np.argsort(
+        np.where(np.isnan(scores), np.inf, -scores), axis=-1, kind='stable')
+    order[np.take_along_axis(np.isnan(scores), order, axis=-1)] = -1
+    np.savez_compressed(
+        file_path,
+        format_version=np.array(FORMAT_VERSION),
+        source_hashes=np.array(source_hashes),
+        attacker_names=np.array(attacker_names),
+        defender_names=np.array(defender_names),
+        order=order.astype(np.int8),
+        scores=scores.astype(np.float32))
+
+
+class MovePolicyTable:
+    """Lookup table of the best move for a rental Pokemon against an opponent.
+
+    Lookups only succeed if both Pokemon are unmodified copies of the
+    Pokemon the table was built from (apart from PP and Dynamax); otherwise
+    (e.g., for a transformed Ditto) `select_best_move` returns None and the
+    caller should score the moves itself.
+    """
+
+    def __init__(
+        self, file_path: str, rental_pokemon: Dict[str, Pokemon],
+        boss_pokemon: Dict[str, Pokemon]
+    ) -> None:
+        with np.load(file_path, allow_pickle=False) as archive:
+            if int(archive['format_version']) != FORMAT_VERSION:
+                raise ValueError(
+                    f'Unsupported move policy format in {file_path}.')
+            self.source_hashes = archive['source_hashes'].tolist()
+            attacker_names = archive['attacker_names'].tolist()
+            defender_names = archive['defender_names'].tolist()
+            self.order = archive['order']
+            self.scores = archive['scores']
+        self.attacker_indices = {
+            name_id: i for i, name_id in enumerate(attacker_names)}
+        self.defender_indices = {
+            name_id: i for i, name_id in enumerate(defender_names)}
+        self.rental_pokemon = rental_pokemon
+        self.boss_pokemon = boss_pokemon
+        self.reference_keys: Dict[str, tuple] = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset the hit and miss counters."""
+        self.hits = 0
+        self.misses = 0
+
+    def _matches_reference(self, pokemon: Pokemon) -> bool:
+        """Return True if a Pokemon is in the state the table was built for,
+        ignoring its PP and Dynamax state.
+        """
+
+        name_id = pokemon.name_id
+        if name_id not in self.reference_keys:
+            reference = self.rental_pokemon.get(name_id)
+            if reference is None:
+                reference = self.boss_pokemon.get(name_id)
+            self.reference_keys[name_id] = (
+                None if reference is None else get_pokemon_key(reference)[:-1])
+        return get_pokemon_key(pokemon)[:-1] == self.reference_keys[name_id]
+
+    def covers(self, attacker: Pokemon, defender: Pokemon) -> bool:
+        """Return True if the matchup is in the table, without counting a
+        hit or miss.
+        """
+
+        return (
+            attacker.name_id in self.attacker_indices
+            and defender.name_id in self.defender_indices
+            and self._matches_reference(attacker)
+            and self._matches_reference(defender))
+
+    def select_best_move(
+        self, attacker: Pokemon, defender: Pokemon
+    ) -> Optional[Tuple[int, str, float]]:
+        """Return the same result as select_best_move with the rental pool as
+        teammates, or None if the matchup is not in the table.
+        """
+
+        if not self.covers(attacker, defender):
+            self.misses += 1
+            return None
+        self.hits += 1
+        i = self.attacker_indices[attacker.name_id]
+        j = self.defender_indices[defender.name_id]
+        k = 1 if attacker.dynamax else 0
+        for move_index in self.order[i, j, k]:
+            if move_index < 0:
+                break
+            if attacker.PP[move_index] > 0:
+                return (
+                    int(move_index), attacker.moves[move_index].name_id,
+                    float(self.scores[i, j, k, move_index]))
+        return 0, '', -100.0
@@ -0,0 +1,134 @@
+"""Identification of opponents from the name plate shown during battles.
+
+The name of the opponent is drawn above its HP bar for the whole battle, in
+the same place and font every time. Instead of opening the opponent's
+summary from the battle menu and reading it, the name plate can be compared
+with the name plates of the rental Pokemon seen before, which are stored for
+each language in a name plate file (see `scripts/build_name_plates.py`).
+
+Each plate is stored as a small, blurred copy of the white text in the name
+region, so every plate of a language can be compared with a frame at once by
+a single matrix product of normalized images (normalized cross-correlation).
+Different forms of a Pokemon share a name and therefore a plate, so a plate
+identifies a name rather than a Pokemon.
+"""
+
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from automaxlair.digit_recognition import normalize_glyph
+from automaxlair.image_processing import Image
+
+FORMAT_VERSION = 1
+# Size that the name region is scaled to before it is compared.
+PLATE_WIDTH = 160
+PLATE_HEIGHT = 16
+# Smallest difference between the scores of the best and second best names
+# for a match to be trusted.
+MIN_MARGIN = 0.05
+
+
+def scale_plate(mask: Image) -> np.ndarray:
+    """Scale the text mask of a name region to the size of a plate."""
+    return cv2.resize(
+        mask, (PLATE_WIDTH, PLATE_HEIGHT),
+        interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+class NamePlateIndex:
+    """Name plates of the Pokemon names of one language."""
+
+    def __init__(
+        self, lang: str, names: Iterable[str] = (),
+        plates: Optional[np.ndarray] = None
+    ) -> None:
+        self.lang = lang
+        self.names: List[str] = list(names)
+        self.plates = np.zeros((0, PLATE_HEIGHT, PLATE_WIDTH), np.float32)
+        self.templates = np.zeros((0, PLATE_HEIGHT * PLATE_WIDTH), np.float32)
+        if plates is not None and len(plates) > 0:
+            self.plates = np.asarray(plates, np.float32)
+            self.templates = np.stack(
+                [normalize_glyph(plate) for plate in self.plates])
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, name: str, mask: Image) -> None:
+        """Add the plate of a name from the text mask of its name region."""
+        plate = scale_plate(mask)
+        self.names.append(name)
+        self.plates = np.concatenate((self.plates, plate[np.newaxis]))
+        self.templates = np.concatenate(
+            (self.templates, normalize_glyph(plate)[np.newaxis]))
+
+    def match(
+        self, mask: Image, names: Optional[Iterable[str]] = None
+    ) -> Tuple[Optional[str], float, float]:
+        """Return the name whose plate best matches the text mask of a name
+        region, its match score (from -1 to 1), and the best score of any
+        other name, optionally only considering some names.
+
+        The name is None if no plate could be compared.
+        """
+
+        if len(self.names) == 0:
+            return None, 0.0, 0.0
+        scores = self.templates @ normalize_glyph(scale_plate(mask))
+        if names is not None:
+            names = set(names)
+            scores = np.where(
+                [name in names for name in self.names], scores, -np.inf)
+        order = np.argsort(-scores)
+        best = order[0]
+        if not np.isfinite(scores[best]):
+            return None, 0.0, 0.0
+        runner_up = -1.0
+        for i in order[1:]:
+            if not np.isfinite(scores[i]):
+                break
+            if self.names[i] != self.names[best]:
+                runner_up = float(scores[i])
+                break
+        return self.names[best], float(scores[best]), runner_up
+
+
+def load_name_plates(file_path: str, lang: str) -> NamePlateIndex:
+    """Load the name plates of a language, which are empty if the file or
+    language doesn't exist yet.
+    """
+
+    if not os.path.exists(file_path):
+        return NamePlateIndex(lang)
+    with np.load(file_path, allow_pickle=False) as archive:
+        if int(archive['format_version']) != FORMAT_VERSION:
+            raise ValueError(f'Unsupported name plate format in {file_path}.')
+        if f'names_{lang}' not in archive.files:
+            return NamePlateIndex(lang)
+        return NamePlateIndex(
+            lang, archive[f'names_{lang}'].tolist(), archive[f'plates_{lang}'])
+
+
+def save_name_plates(file_path: str, index: NamePlateIndex) -> None:
+    """Save the name plates of a language, keeping those of the other
+    languages already in the file.
+    """
+
+    arrays: Dict[str, np.ndarray] = {}
+    if os.path.exists(file_path):
+        with np.load(file_path, allow_pickle=False) as archive:
+            arrays = {key: archive[key] for key in archive.files}
+    arrays['format_version'] = np.array(FORMAT_VERSION)
+    arrays[f'names_{index.lang}'] = np.array(index.names, dtype=str)
+    arrays[f'plates_{index.lang}'] = index.plates.astype(np.uint8)
+    # Write to a temporary file first so that the file is never left
+    # incomplete.
+    temp_path = file_path + '.tmp.npz'
+    np.savez_compressed(temp_path, **arrays)
+    os.replace(temp_path, file_path)
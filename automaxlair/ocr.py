@@ -0,0 +1,516 @@
+"""Backends for reading text with Tesseract.
+
+The subprocess backend uses pytesseract, which launches a new Tesseract
+process (and reloads the language model) for every call. The tesserocr
+backend keeps Tesseract API handles loaded in-process instead, one pool of
+handles per combination of language and page segmentation mode, which
+removes most of the fixed cost of each call. The subprocess backend is used
+if tesserocr is not installed and for any call that the tesserocr backend
+cannot handle.
+
+Several small regions can also be read with a single call by stacking them
+into one image (see `stack_images`) and splitting the words Tesseract finds
+back into their regions (see `split_stacked_words`).
+
+Results can be reused for images that look the same as an image read
+before with an `OCRCache`, which is keyed by a perceptual hash of the
+image.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple)
+
+import cv2
+import numpy as np
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Resolution assumed by the Tesseract executable for images without one.
+DEFAULT_RESOLUTION = 70
+# Padding (in pixels) around each image in a stack of images.
+STACK_MARGIN = 10
+# Page segmentation modes that only read one line or word. A stack of images
+# read in one of these modes is read as a block of text instead.
+SINGLE_LINE_MODES = (7, 8, 13)
+# Width of the perceptual hash of an image, and the number of grey levels
+# each of its pixels is quantized to.
+HASH_WIDTH = 128
+HASH_LEVELS = 4
+
+# A word read by Tesseract, with the keys 'text', 'left', 'top', 'width',
+# 'height', 'conf', and 'line' (the index of the line containing the word).
+Word = Dict[str, Any]
+
+
+def parse_segmentation_mode(config: str) -> Optional[int]:
+    """Return the page segmentation mode from a Tesseract config string such
+    as '--psm 8', or None if the string contains any other options.
+    """
+
+    options = config.split()
+    if len(options) == 0:
+        return 3  # Tesseract's default mode.
+    if len(options) != 2 or options[0] != '--psm' or not options[1].isdigit():
+        return None
+    return int(options[1])
+
+
+class OCRBackend:
+    """Base class for a way of running Tesseract on an image.
+
+    Subclasses implement `_image_to_string` and `_image_to_data`, which may
+    be called from several threads at once. Each call is timed, and running
+    totals are kept so they can be logged.
+    """
+
+    name = 'base'
+
+    def __init__(self) -> None:
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Zero the call count and total time."""
+        with self._stats_lock:
+            self.calls = 0
+            self.total_time = 0.0
+
+    def get_stats(self) -> Dict[str, float]:
+        """Return the number of calls and their total and mean latency."""
+        with self._stats_lock:
+            return {
+                'calls': self.calls,
+                'total_time': self.total_time,
+                'mean_latency': self.total_time / max(self.calls, 1)}
+
+    def _timed(self, func: Callable, *args) -> Tuple[Any, float]:
+        start_time = time.perf_counter()
+        result = func(*args)
+        latency = time.perf_counter() - start_time
+        with self._stats_lock:
+            self.calls += 1
+            self.total_time += latency
+        return result, latency
+
+    def image_to_string_timed(
+        self, image: np.ndarray, lang: str, config: str = ''
+    ) -> Tuple[str, float]:
+        """Return the text Tesseract reads from an image along with the time
+        the call took in seconds.
+        """
+
+        return self._timed(self._image_to_string, image, lang, config)
+
+    def image_to_string(
+        self, image: np.ndarray, lang: str, config: str = ''
+    ) -> str:
+        """Return the text Tesseract reads from an image."""
+        return self.image_to_string_timed(image, lang, config)[0]
+
+    def image_to_data_timed(
+        self, image: np.ndarray, lang: str, config: str = ''
+    ) -> Tuple[List[Word], float]:
+        """Return the words Tesseract reads from an image, in reading order,
+        along with the time the call took in seconds.
+        """
+
+        return self._timed(self._image_to_data, image, lang, config)
+
+    def _image_to_string(
+        self, image: np.ndarray, lang: str, config: str
+    ) -> str:
+        raise NotImplementedError
+
+    def _image_to_data(
+        self, image: np.ndarray, lang: str, config: str
+    ) -> List[Word]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any resources held by the backend."""
+
+
+class SubprocessOCRBackend(OCRBackend):
+    """Run the Tesseract executable through pytesseract for every call."""
+
+    name = 'subprocess'
+
+    def _image_to_string(
+        self, image: np.ndarray, lang: str, config: str
+    ) -> str:
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+    def _image_to_data(
+        self, image: np.ndarray, lang: str, config: str
+    ) -> List[Word]:
+        data = pytesseract.image_to_data(
+            image, lang=lang, config=config,
+            output_type=pytesseract.Output.DICT)
+        words = []
+        lines: Dict[Tuple[int, int, int], int] = {}
+        for i, text in enumerate(data['text']):
+            # Level 5 entries are words; the others are blocks and lines.
+            if int(data['level'][i]) != 5 or text.strip() == '':
+                continue
+            line_key = (
+                data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            words.append({
+                'text': text.strip(),
+                'left': int(data['left'][i]),
+                'top': int(data['top'][i]),
+                'width': int(data['width'][i]),
+                'height': int(data['height'][i]),
+                'conf': float(data['conf'][i]),
+                'line': lines.setdefault(line_key, len(lines))})
+        return words
+
+
+class TesserocrOCRBackend(OCRBackend):
+    """Keep warm Tesseract API handles in-process using tesserocr.
+
+    Handles are pooled by (language, page segmentation mode) so that every
+    call with the same settings reuses an initialized handle. A handle is
+    only used by one thread at a time; extra handles are created if several
+    threads read text concurrently.
+
+    Images are passed to Tesseract as raw pixel data exactly as pytesseract
+    passes them (without reordering the colour channels) so both backends
+    read the same text.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, tessdata_path: Optional[str] = None) -> None:
+        if tesserocr is None:
+            raise ImportError('The tesserocr package is not installed.')
+        super().__init__()
+        self.tessdata_path = tessdata_path
+        self.fallback = SubprocessOCRBackend()
+        self._pools: Dict[Tuple[str, int], queue.Queue] = {}
+        self._handles = []
+        # Settings for which a handle could not be created.
+        self._unavailable = set()
+        self._pools_lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def _get_pool(self, lang: str, psm: int) -> queue.Queue:
+        with self._pools_lock:
+            return self._pools.setdefault((lang, psm), queue.Queue())
+
+    def _create_handle(self, lang: str, psm: int):
+        kwargs = {'lang': lang, 'psm': psm}
+        if self.tessdata_path is not None:
+            kwargs['path'] = self.tessdata_path
+        handle = tesserocr.PyTessBaseAPI(**kwargs)
+        with self._pools_lock:
+            self._handles.append(handle)
+        return handle
+
+    def _image_to_string(
+        self, image: np.ndarray, lang: str, config: str
+    ) -> str:
+        return self._run(
+            image, lang, config, lambda handle: handle.GetUTF8Text(),
+            self.fallback._image_to_string)
+
+    def _image_to_data(
+        self, image: np.ndarray, lang: str, config: str
+    ) -> List[Word]:
+        return self._run(
+            image, lang, config, self._get_words,
+            self.fallback._image_to_data)
+
+    @staticmethod
+    def _get_words(handle) -> List[Word]:
+        handle.Recognize()
+        iterator = handle.GetIterator()
+        words = []
+        if iterator is None:
+            return words
+        level = tesserocr.RIL.WORD
+        line = -1
+        for result in tesserocr.iterate_level(iterator, level):
+            if result.Empty(level):
+                continue
+            if result.IsAtBeginningOf(tesserocr.RIL.TEXTLINE) or line < 0:
+                line += 1
+            text = result.GetUTF8Text(level)
+            box = result.BoundingBox(level)
+            if not text or not text.strip() or box is None:
+                continue
+            left, top, right, bottom = box
+            words.append({
+                'text': text.strip(), 'left': left, 'top': top,
+                'width': right - left, 'height': bottom - top,
+                'conf': result.Confidence(level), 'line': line})
+        return words
+
+    def _run(
+        self, image: np.ndarray, lang: str, config: str,
+        read: Callable, fallback: Callable
+    ) -> Any:
+        """Load an image into a warm handle and return the result of
+        `read(handle)`, or the result of `fallback` if the handle can't be
+        used.
+        """
+
+        psm = parse_segmentation_mode(config)
+        if (
+            psm is None or (lang, psm) in self._unavailable
+            or image.ndim not in (2, 3) or image.size == 0
+        ):
+            return fallback(image, lang, config)
+
+        pool = self._get_pool(lang, psm)
+        try:
+            handle = pool.get_nowait()
+        except queue.Empty:
+            try:
+                handle = self._create_handle(lang, psm)
+            except RuntimeError as e:
+                self._unavailable.add((lang, psm))
+                self.logger.warning(
+                    f'Could not start Tesseract in-process ({e}). Using the '
+                    'Tesseract executable instead.')
+                return fallback(image, lang, config)
+
+        try:
+            image = np.ascontiguousarray(image, dtype=np.uint8)
+            height, width = image.shape[:2]
+            channels = 1 if image.ndim == 2 else image.shape[2]
+            handle.SetImageBytes(
+                image.tobytes(), width, height, channels, width * channels)
+            handle.SetSourceResolution(DEFAULT_RESOLUTION)
+            return read(handle)
+        finally:
+            handle.Clear()
+            pool.put(handle)
+
+    def close(self) -> None:
+        with self._pools_lock:
+            for handle in self._handles:
+                handle.End()
+            self._handles = []
+            self._pools = {}
+
+
+def get_stacked_segmentation_mode(config: str) -> Optional[str]:
+    """Return the Tesseract config for reading a stack of images that would
+    each be read with the given config, or None if they can't be stacked.
+    """
+
+    psm = parse_segmentation_mode(config)
+    if psm is None:
+        return None
+    if psm in SINGLE_LINE_MODES:
+        return '--psm 6'
+    return config
+
+
+def get_background(image: np.ndarray) -> Tuple[int, ...]:
+    """Return the median colour of the edges of an image."""
+    edges = np.concatenate((
+        image[0], image[-1], image[:, 0], image[:, -1]))
+    median = np.median(edges.reshape(len(edges), -1), axis=0)
+    return tuple(int(value) for value in median)
+
+
+def stack_images(
+    images: Sequence[np.ndarray]
+) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+    """Stack images vertically so they can be read with a single call.
+
+    Each image is padded with its own background colour, which keeps the
+    images apart and gives Tesseract the margin it expects around text.
+    Returns the stacked image and the rows (top, bottom) each padded image
+    occupies.
+    """
+
+    width = max(image.shape[1] for image in images) + 2 * STACK_MARGIN
+    parts = []
+    bands = []
+    top = 0
+    for image in images:
+        part = cv2.copyMakeBorder(
+            image, STACK_MARGIN, STACK_MARGIN, STACK_MARGIN,
+            width - image.shape[1] - STACK_MARGIN, cv2.BORDER_CONSTANT,
+            value=get_background(image))
+        parts.append(part)
+        bands.append((top, top + part.shape[0]))
+        top += part.shape[0]
+    return np.vstack(parts), bands
+
+
+def split_stacked_words(
+    words: Sequence[Word], bands: Sequence[Tuple[int, int]]
+) -> List[Optional[str]]:
+    """Split the words read from a stack of images back into the text of
+    each image, formatted like the output of `image_to_string`.
+
+    The text of an image is None if the split is ambiguous: if a word or a
+    line of text crosses into another image, or if no words were found in
+    the image. Those images should be read individually instead.
+    """
+
+    lines: List[Dict[int, List[str]]] = [{} for __ in bands]
+    ambiguous = set()
+    line_bands: Dict[int, set] = {}
+    for word in words:
+        inside = [
+            i for i, (top, bottom) in enumerate(bands)
+            if word['top'] < bottom and word['top'] + word['height'] > top]
+        if len(inside) != 1:
+            ambiguous.update(inside)
+            continue
+        i = inside[0]
+        line_bands.setdefault(word['line'], set()).add(i)
+        lines[i].setdefault(word['line'], []).append(word['text'])
+    for band_indices in line_bands.values():
+        if len(band_indices) > 1:
+            ambiguous.update(band_indices)
+
+    return [
+        None if i in ambiguous or len(lines[i]) == 0 else '\n'.join(
+            ' '.join(line_words) for line_words in lines[i].values())
+        for i in range(len(bands))]
+
+
+def get_perceptual_hash(image: np.ndarray) -> np.ndarray:
+    """Return a perceptual hash of a processed image as packed bits.
+
+    The image is shrunk to HASH_WIDTH pixels wide, keeping its aspect ratio,
+    and each pixel is quantized to HASH_LEVELS grey levels stored as a
+    thermometer code. The Hamming distance between two hashes is then the
+    total difference in levels between the shrunk images.
+    """
+
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    height = max(1, round(HASH_WIDTH * image.shape[0] / image.shape[1]))
+    small = cv2.resize(
+        image, (HASH_WIDTH, height), interpolation=cv2.INTER_AREA)
+    levels = np.minimum(small.astype(np.int32) * HASH_LEVELS // 256,
+                        HASH_LEVELS - 1)
+    return np.packbits(np.stack(
+        [levels > level for level in range(HASH_LEVELS - 1)], axis=-1))
+
+
+class OCRCache:
+    """Least recently used cache of text read from processed images.
+
+    Entries are keyed by the language, the Tesseract config, and the
+    perceptual hash of the image. A lookup hits an entry for the same
+    language and config whose hash differs in at most `tolerance` bits,
+    which allows for noise in the video while still telling apart text
+    that differs by a single character. The cache may be used from several
+    threads.
+    """
+
+    def __init__(self, max_size: int = 256, tolerance: int = 2) -> None:
+        self.max_size = max_size
+        self.tolerance = tolerance
+        self.entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Zero the hit and miss counters."""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> Dict[str, float]:
+        """Return the hit and miss counters, the hit rate, and the number
+        of cached entries.
+        """
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'size': len(self.entries)
+            }
+
+    def lookup(
+        self, image: np.ndarray, lang: str, config: str
+    ) -> Tuple[Optional[str], Optional[Hashable]]:
+        """Return the cached text for an image (or None if there is none)
+        and the key to store the text under once it has been read.
+        """
+
+        if self.max_size <= 0 or image.size == 0:
+            return None, None
+        image_hash = get_perceptual_hash(image)
+        group = (lang, config, image_hash.size)
+        key = (group, image_hash.tobytes())
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None and self.tolerance > 0:
+                for other_key, other_entry in self.entries.items():
+                    if other_key[0] == group and np.unpackbits(
+                        other_entry[0] ^ image_hash
+                    ).sum() <= self.tolerance:
+                        key, entry = other_key, other_entry
+                        break
+            if entry is None:
+                self.misses += 1
+                return None, (group, image_hash)
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1], None
+
+    def store(self, key: Optional[Hashable], text: str) -> None:
+        """Cache text read from the image that returned the key from
+        `lookup`. Nothing is stored if the key is None.
+        """
+
+        if key is None:
+            return
+        group, image_hash = key
+        with self._lock:
+            self.entries[(group, image_hash.tobytes())] = (image_hash, text)
+            self.entries.move_to_end((group, image_hash.tobytes()))
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+def get_tessdata_path(tesseract_path: str) -> Optional[str]:
+    """Return the tessdata folder installed next to the Tesseract executable,
+    or None to use the folder tesserocr was built with.
+    """
+
+    tessdata_path = os.path.join(
+        os.path.dirname(os.path.abspath(tesseract_path)), 'tessdata')
+    if os.path.isdir(tessdata_path):
+        return tessdata_path + os.sep
+    return None
+
+
+def create_ocr_backend(
+    name: str = 'auto', tesseract_path: Optional[str] = None
+) -> OCRBackend:
+    """Return the OCR backend with the given name ('auto', 'tesserocr', or
+    'subprocess'). 'auto' uses tesserocr if it is installed.
+    """
+
+    name = name.lower()
+    if name not in ('auto', 'tesserocr', 'subprocess'):
+        raise ValueError(f'Unknown OCR backend: {name}')
+    if name == 'subprocess' or (name == 'auto' and tesserocr is None):
+        return SubprocessOCRBackend()
+    tessdata_path = None
+    if tesseract_path is not None:
+        tessdata_path = get_tessdata_path(tesseract_path)
+    return TesserocrOCRBackend(tessdata_path)
@@ -0,0 +1,257 @@
+"""Identification of the type icons shown on the path screen of the den.
+
+Each boss on the path screen is shown as a white type icon. The icons used
+to be found by matching all 18 type templates against every full-height
+slice of the screen, which takes most of the time spent reading the path.
+Since each slice contains a single icon, `PathIconMatcher` instead finds
+the icon first, as a blob of the right size in a reduced copy of the
+thresholded slice, and compares it with every template at once, as small
+normalized images stacked into a matrix. Only the most similar types are
+then matched at full resolution, in a window around the icon.
+
+The local search can miss the best match if the icon isn't found as a blob
+or its type isn't among the most similar coarse matches. The whole slice is
+therefore searched the old way unless the best local match scores well and
+clearly beats the runner-up, which is the case for a cleanly visible icon.
+`scripts/benchmark_path_icons.py` compares both searches on screenshots.
+
+Unlike the old search, the templates are scaled to the height of the frame,
+so icons are also found in frames that aren't 1080 pixels tall. Locations
+are returned in pixels of a 1080p frame either way.
+"""
+
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from automaxlair.image_processing import Image
+
+# Height of the frames the type icon templates were captured from. Match
+# locations are returned in pixels of a frame of this height.
+REFERENCE_HEIGHT = 1080
+# Frame heights whose scaled templates are prepared up front; the templates
+# for any other height are prepared the first time it is seen.
+PRECOMPUTED_HEIGHTS = (720, 1080)
+# Factor by which slices are reduced when searching for blobs.
+BLOB_SCALE = 4
+# Range of the size of an icon, in pixels of a reference frame.
+MIN_ICON_SIZE = 16
+MAX_ICON_SIZE = 56
+# Size of the images compared in the stacked batch.
+COARSE_SIZE = 12
+# Number of the most similar types that are matched at full resolution.
+NUM_REFINED = 3
+# Lowest full resolution score that is trusted without searching the whole
+# slice, and the lowest margin by which it must beat the next best type.
+MIN_LOCAL_SCORE = 0.5
+MIN_LOCAL_MARGIN = 0.1
+
+PathMatch = Tuple[str, Tuple[float, Tuple[int, int]]]
+
+
+def threshold_icons(img: Image) -> Image:
+    """Return a mask of the white pixels of an image, which is how the type
+    icon templates are stored.
+    """
+
+    return cv2.inRange(
+        cv2.cvtColor(img, cv2.COLOR_BGR2HSV), (0, 0, 200), (180, 50, 255))
+
+
+def get_coarse_descriptor(mask: Image) -> np.ndarray:
+    """Return a mask cropped to its white pixels, reduced to the coarse size,
+    and normalized to zero mean and unit norm.
+    """
+
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if len(rows) == 0:
+        return np.zeros(COARSE_SIZE * COARSE_SIZE, np.float32)
+    mask = mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    descriptor = cv2.resize(
+        mask.astype(np.float32), (COARSE_SIZE, COARSE_SIZE),
+        interpolation=cv2.INTER_AREA).ravel()
+    descriptor -= descriptor.mean()
+    norm = np.linalg.norm(descriptor)
+    return descriptor / norm if norm > 0 else descriptor
+
+
+class _ScaledTemplates:
+    """Type icon templates prepared for one frame height."""
+
+    def __init__(self, type_icons: Mapping[str, Image], height: int) -> None:
+        self.scale = height / REFERENCE_HEIGHT
+        self.templates: List[Image] = []
+        for template in type_icons.values():
+            if height != REFERENCE_HEIGHT:
+                size = (
+                    max(1, int(round(template.shape[1] * self.scale))),
+                    max(1, int(round(template.shape[0] * self.scale))))
+                template = cv2.resize(
+                    template, size, interpolation=cv2.INTER_AREA)
+            self.templates.append(template)
+        # Coarse descriptors of every template, one per row.
+        self.descriptors = np.stack(
+            [get_coarse_descriptor(template) for template in self.templates])
+        self.max_template_shape = (
+            max(template.shape[0] for template in self.templates),
+            max(template.shape[1] for template in self.templates))
+
+
+class PathIconMatcher:
+    """Identify the type icon in slices of the path screen.
+
+    The types are those of the supplied templates, in the order of the
+    mapping, which decides which type wins a tie.
+    """
+
+    def __init__(self, type_icons: Mapping[str, Image]) -> None:
+        self.type_icons = type_icons
+        self.type_ids = tuple(type_icons)
+        self.scaled: Dict[int, _ScaledTemplates] = {}
+        for height in PRECOMPUTED_HEIGHTS:
+            self.get_templates(height)
+
+    def get_templates(self, height: int) -> _ScaledTemplates:
+        """Return the templates prepared for a frame height."""
+        if height not in self.scaled:
+            self.scaled[height] = _ScaledTemplates(self.type_icons, height)
+        return self.scaled[height]
+
+    def find_icon_blobs(
+        self, mask: Image, templates: _ScaledTemplates
+    ) -> List[Tuple[int, int, int, int]]:
+        """Return the bounding boxes (x, y, width, height) of the groups of
+        white pixels in a mask that are the size of an icon.
+        """
+
+        small = cv2.resize(
+            mask, (max(1, mask.shape[1] // BLOB_SCALE),
+                   max(1, mask.shape[0] // BLOB_SCALE)),
+            interpolation=cv2.INTER_AREA)
+        # Join the separate parts of an icon into one blob.
+        small = cv2.dilate((small > 0).astype(np.uint8), np.ones((3, 3)))
+        num_labels, __, stats, __ = cv2.connectedComponentsWithStats(small)
+        min_size = MIN_ICON_SIZE * templates.scale
+        max_size = MAX_ICON_SIZE * templates.scale
+        blobs = []
+        for x, y, width, height, __ in stats[1:num_labels]:
+            x, y = int(x) * BLOB_SCALE, int(y) * BLOB_SCALE
+            width, height = int(width) * BLOB_SCALE, int(height) * BLOB_SCALE
+            if (
+                min_size <= width <= max_size + 2 * BLOB_SCALE
+                and min_size <= height <= max_size + 2 * BLOB_SCALE
+            ):
+                blobs.append((x, y, width, height))
+        return blobs
+
+    def match_locally(
+        self, mask: Image, templates: _ScaledTemplates
+    ) -> Tuple[int, float, Tuple[int, int], float]:
+        """Find the icon in a mask with a blob search and return the index of
+        its type, its match score, its location, and the score of the next
+        best type that was matched. Scores are -inf if no icon was found.
+        """
+
+        best = (0, float('-inf'), (0, 0))
+        runner_up = float('-inf')
+        blobs = self.find_icon_blobs(mask, templates)
+        if len(blobs) == 0:
+            return best + (runner_up,)
+        # Compare every blob with every template at once and keep the blob
+        # that is most similar to any template.
+        descriptors = np.stack([
+            get_coarse_descriptor(mask[y:y + height, x:x + width])
+            for x, y, width, height in blobs])
+        coarse_scores = descriptors @ templates.descriptors.T
+        blob_index = int(coarse_scores.max(axis=1).argmax())
+        x, y, width, height = blobs[blob_index]
+        # Match the most similar types in a window where the template can
+        # overlap the blob.
+        template_height, template_width = templates.max_template_shape
+        left = max(0, x - template_width)
+        top = max(0, y - template_height)
+        window = mask[
+            top:y + height + template_height,
+            left:x + width + template_width]
+        for type_index in sorted(
+            np.argsort(-coarse_scores[blob_index])[:NUM_REFINED]
+        ):
+            template = templates.templates[type_index]
+            if (
+                window.shape[0] < template.shape[0]
+                or window.shape[1] < template.shape[1]
+            ):
+                continue
+            result = cv2.matchTemplate(
+                window, template, cv2.TM_CCOEFF_NORMED)
+            __, max_val, __, max_loc = cv2.minMaxLoc(result)
+            if max_val > best[1]:
+                runner_up = best[1]
+                best = (
+                    int(type_index), max_val,
+                    (left + int(max_loc[0]), top + int(max_loc[1])))
+            else:
+                runner_up = max(runner_up, max_val)
+        return best + (runner_up,)
+
+    def match_exhaustively(
+        self, mask: Image, templates: _ScaledTemplates
+    ) -> Tuple[int, float, Tuple[int, int]]:
+        """Match every template against the whole mask and return the index
+        of the best type, its match score, and its location.
+        """
+
+        # Start below any possible match value so a result is always stored,
+        # even for a blank image.
+        best = (0, float('-inf'), (0, 0))
+        for type_index, template in enumerate(templates.templates):
+            result = cv2.matchTemplate(mask, template, cv2.TM_CCOEFF_NORMED)
+            __, max_val, __, max_loc = cv2.minMaxLoc(result)
+            if max_val > best[1]:
+                best = (type_index, max_val, max_loc)
+        return best
+
+    def find_icon(self, img: Image) -> Optional[PathMatch]:
+        """Identify the type icon in a full-height slice of the path screen
+        with the blob search alone, or return None if no icon was found that
+        clearly matches one type. The whole slice is never searched, so this
+        is cheap enough to check for the path screen on every frame.
+        """
+
+        templates = self.get_templates(img.shape[0])
+        type_index, score, loc, runner_up = self.match_locally(
+            threshold_icons(img), templates)
+        if score < MIN_LOCAL_SCORE or score - runner_up < MIN_LOCAL_MARGIN:
+            return None
+        return self.type_ids[type_index], (score, self._to_reference(
+            loc, templates))
+
+    def _to_reference(
+        self, loc: Tuple[int, int], templates: _ScaledTemplates
+    ) -> Tuple[int, int]:
+        """Convert a location to pixels of a reference frame."""
+        if templates.scale == 1:
+            return loc
+        return (
+            int(round(loc[0] / templates.scale)),
+            int(round(loc[1] / templates.scale)))
+
+    def identify(self, img: Image, exhaustive: bool = False) -> PathMatch:
+        """Identify the type icon in a full-height slice of the path screen.
+        Returns the type, the match score, and the location of the icon in
+        pixels of a reference frame.
+        """
+
+        mask = threshold_icons(img)
+        templates = self.get_templates(img.shape[0])
+        type_index, score, loc, runner_up = (
+            0, float('-inf'), (0, 0), float('-inf'))
+        if not exhaustive:
+            type_index, score, loc, runner_up = self.match_locally(
+                mask, templates)
+        if score < MIN_LOCAL_SCORE or score - runner_up < MIN_LOCAL_MARGIN:
+            type_index, score, loc = self.match_exhaustively(mask, templates)
+        return self.type_ids[type_index], (
+            score, self._to_reference(loc, templates))
@@ -0,0 +1,171 @@
+"""Path planning through the den, accounting for the Pokemon that are caught
+and the lives that are lost along the way.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from automaxlair.matchup_scoring import TYPE_CODES, TYPE_IDS
+from automaxlair.pokemon_classes import Pokemon
+from automaxlair.pokemon_data_store import PokemonDataStore
+
+# Index of the class representing the Pokemon the player currently has. The
+# other classes are rental Pokemon grouped by their primary type.
+CURRENT_CLASS = len(TYPE_IDS)
+
+
+def get_win_probability(score: np.ndarray) -> np.ndarray:
+    """Convert matchup scores into rough probabilities of winning a battle
+    without losing a life. A score of 1 (an even matchup) maps to 50%.
+    """
+
+    return score / (score + 1)
+
+
+class PathPlanner:
+    """Expectimax planner over the network of nodes in the den.
+
+    The state of a run is described by the node the player is at, the class
+    of their Pokemon (either its primary type or the exact Pokemon they
+    currently have), and their remaining lives. At each node, the player
+    fights a rental Pokemon of the node's type and loses a life if the
+    battle goes badly. They then catch a random rental Pokemon of that type,
+    keep whichever of the two Pokemon leads to the better outcome, and choose
+    the best node to go to next. The value of a state is the estimated
+    probability of defeating the boss.
+
+    Values are memoized by (node, lives) as arrays over the Pokemon classes,
+    so re-planning after every catch only requires a few hundred small array
+    operations.
+    """
+
+    def __init__(self, boss: str, data: PokemonDataStore) -> None:
+        self.boss = boss
+        rental_names = list(data.rental_pokemon)
+        self.rental_indices = {
+            name_id: i for i, name_id in enumerate(rental_names)}
+
+        # Type membership and primary types of the rental Pokemon.
+        num_types = len(TYPE_IDS)
+        has_type = np.zeros((len(rental_names), num_types))
+        primary_type = np.zeros((len(rental_names), num_types))
+        for i, pokemon in enumerate(data.rental_pokemon.values()):
+            for type_id in pokemon.type_ids:
+                has_type[i, TYPE_CODES[type_id]] = 1
+            primary_type[i, TYPE_CODES[pokemon.type_ids[0]]] = 1
+        # class_weights[k] averages over the rental Pokemon in class k.
+        class_weights = primary_type.T / np.maximum(
+            primary_type.sum(axis=0), 1)[:, None]
+        # catch_probabilities[t, k] is the chance that a Pokemon caught at a
+        # node of type t belongs to class k.
+        self.catch_probabilities = (
+            has_type.T @ primary_type) / has_type.sum(axis=0)[:, None]
+
+        # Scores of each rental Pokemon against the boss and against the
+        # average rental Pokemon of each type.
+        self.boss_scores = data.boss_matchups.get_column(
+            boss, rental_names).astype(np.float64)
+        rental_matchups = data.rental_matchups.values[
+            np.ix_(
+                data.rental_matchups.get_row_indices(rental_names),
+                [data.rental_matchups.column_indices[name_id]
+                 for name_id in rental_names])
+        ].astype(np.float64)
+        self.type_scores = (rental_matchups @ has_type) / np.maximum(
+            has_type.sum(axis=0), 1)
+
+        self.class_boss_scores = class_weights @ self.boss_scores
+        self.class_type_scores = class_weights @ self.type_scores
+        self.memo: Dict[Tuple[Tuple[int, int], int], np.ndarray] = {}
+
+    def _set_current_pokemon(self, pokemon: Optional[Pokemon]) -> None:
+        """Compute the win probabilities for every class, including the
+        Pokemon the player currently has (or the average rental Pokemon if it
+        is not known).
+        """
+
+        i = None if pokemon is None else self.rental_indices.get(
+            pokemon.name_id)
+        if i is None:
+            boss_score = self.boss_scores.mean()
+            type_scores = self.type_scores.mean(axis=0)
+        else:
+            boss_score = self.boss_scores[i]
+            type_scores = self.type_scores[i]
+        self.boss_win = get_win_probability(
+            np.append(self.class_boss_scores, boss_score))
+        self.battle_win = get_win_probability(
+            np.vstack((self.class_type_scores, type_scores)))
+        self.memo = {}
+
+    def _get_value(self, node, lives: int) -> np.ndarray:
+        """Return the value of arriving at a node with each class of Pokemon
+        and the given number of lives.
+        """
+
+        key = ((node.row, node.col), lives)
+        if key in self.memo:
+            return self.memo[key]
+        if lives <= 0:
+            value = np.zeros(CURRENT_CLASS + 1)
+        elif len(node.downstream_nodes) == 0:
+            # Each attempt at the boss costs a life if it fails.
+            value = 1 - (1 - self.boss_win) ** lives
+        else:
+            code = TYPE_CODES.get(node.name)
+            if code is None:
+                win = self.battle_win.mean(axis=1)
+                catch_probabilities = self.catch_probabilities.mean(axis=0)
+            else:
+                win = self.battle_win[:, code]
+                catch_probabilities = self.catch_probabilities[code]
+            value = (
+                win * self._get_value_after_catch(
+                    node, lives, catch_probabilities)
+                + (1 - win) * self._get_value_after_catch(
+                    node, lives - 1, catch_probabilities))
+        self.memo[key] = value
+        return value
+
+    def _get_value_after_catch(
+        self, node, lives: int, catch_probabilities: np.ndarray
+    ) -> np.ndarray:
+        """Return the value of leaving a node with each class of Pokemon,
+        after catching a random Pokemon there and keeping the better one.
+        """
+
+        # Nothing can be won after the last node.
+        if lives <= 0 or len(node.downstream_nodes) == 0:
+            return np.zeros(CURRENT_CLASS + 1)
+        next_value = np.max(
+            [self._get_value(next_node, lives)
+             for next_node in node.downstream_nodes], axis=0)
+        # A Pokemon of class k can be swapped for a caught Pokemon of any
+        # primary type class.
+        return np.maximum(
+            next_value[:, None], next_value[None, :CURRENT_CLASS]
+        ) @ catch_probabilities
+
+    def plan(
+        self, node, pokemon: Optional[Pokemon], lives: int
+    ) -> Tuple[List, float]:
+        """Return the best path from a node to the boss, assuming the current
+        Pokemon is kept, along with the estimated probability of defeating
+        the boss.
+        """
+
+        self._set_current_pokemon(pokemon)
+        path = [node]
+        while len(path[-1].downstream_nodes) > 0:
+            path.append(max(
+                path[-1].downstream_nodes,
+                key=lambda next_node: self._get_value(
+                    next_node, lives)[CURRENT_CLASS]))
+        # At the boss, the only chance left is the boss battle itself.
+        if len(node.downstream_nodes) == 0:
+            return path, float(self._get_value(node, lives)[CURRENT_CLASS])
+        value = float(np.max([
+            self._get_value(next_node, lives)[CURRENT_CLASS]
+            for next_node in node.downstream_nodes]))
+        return path, value
@@ -1,9 +1,11 @@
 import logging
-import pickle
 import sys
 import os
 
-from typing import List, Tuple
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
 # We need to import some things from the parent directory.
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(1, base_dir)
@@ -18,179 +20,155 @@ TYPE_LIST = [
     'poison', 'ground', 'flying', 'psychic', 'bug', 'rock', 'ghost',
     'dragon', 'dark', 'steel', 'fairy']
 
+# Weight of each node along a path. Later nodes are weighted more heavily
+# since you get a PP restore *and* type advantage from what you catch there.
+POSITION_WEIGHTS = (1.0, 1.1, 1.2)
+
 
 class PathTree():
-    """A basic tree object for determining a better path to follow
+    """Pre-calculated scores for every path through the den.
 
-    Upon initialization, it takes all of the available rental pokemon and boss
-    pokemon and builds up a tree that gives a score for each possible path
-    of three types (for example, 'fire', 'grass', 'water') for each boss
-    Pokemon available.
+    A path is a sequence of three types, one for each of the Pokemon that
+    are fought and caught before the boss. The scores for every boss and
+    every sequence of types are stored in a dense array with shape
+    (boss, type 1, type 2, type 3), indexed in the order of TYPE_LIST.
+
+    The score of a path is built from how well the Pokemon caught along it
+    are expected to fare against the boss. Each Pokemon caught is assumed to be
+    a random rental Pokemon of the node's type, and the bot is assumed to keep
+    the best Pokemon it has caught so far. The score adds up the expected boss
+    matchup of that best Pokemon after each node, weighted by
+    POSITION_WEIGHTS. This accounts for sequence effects: repeating a type
+    adds less than visiting a new type with good options.
 
     Do note that this tree does *not* take into account potential party
-    members! This is merely a basic tree that provides simple pre-calculated
-    scores to help determine a path that's potentially more likely than always
-    choosing the left-most path.
-
-    There is certainly room here to improve upon this algorithm by including
-    the current team, the chance that someone will take the pokemon, and more.
-    But for now, a simple tree structure that stores scores for each is better
-    than nothing.
-
-    As for using this tree, it should be trained automatically with a
-    distributed pickle file for loading in later. Once the pickle is loaded (or
-    the tree trained) it is just a matter of calling the `score_path` method
-    with a list that contains your path. Make sure the path is formatted in the
-    following way: ['boss', 'type1', 'type2', 'type3'] with strings identical
-    to those found in TYPE_LIST (shouldn't be a problem for the rest of the
-    script).
+    members, the chance that someone will take the Pokemon, or the
+    minibosses themselves. There is certainly room here to improve upon this
+    algorithm.
+
+    To build a tree, pass the matchup scores of every rental Pokemon against
+    every boss to `from_matchups`. Once the tree is built (or loaded with
+    `load`), call `score_path` with the boss and a path formatted as
+    ['type1', 'type2', 'type3'] with strings identical to those found in
+    TYPE_LIST.
     """
 
-    def __init__(
-        self,
-        load_tree_path=None,
-        rental_pokemon=None,
-        boss_pokemon=None
-    ) -> None:
-
-        # TREE DEPTH OVERRIDE
-        self.tree_depth = 1
-
-        # find all of the pokemon by type, both primary and secondary
-        if rental_pokemon is not None:
-            self.rental_by_type = {}
-            for type_name in TYPE_LIST:
-                pokemon_names_by_type = []
-                logging.info(f"Now finding Pokemon by {type_name} type!")
-                for pokemon_name, pokemon in rental_pokemon.items():
-                    if type_name in pokemon.type_ids:
-                        pokemon_names_by_type.append(pokemon_name)
-                self.rental_by_type[type_name] = pokemon_names_by_type
-        elif load_tree_path is None:
-            raise AttributeError(
-                "Either rental pokemon or load tree needs to be added!")
-
-        if load_tree_path is None:
-            self._build_tree(rental_pokemon, boss_pokemon)
-        else:
-            self.base_node = pickle.load(load_tree_path)
+    def __init__(self, boss_names: Sequence[str], scores: np.ndarray) -> None:
+        self.tree_depth = 3
+        self.boss_names = list(boss_names)
+        self.boss_indices = {
+            name_id: i for i, name_id in enumerate(self.boss_names)}
+        self.scores = np.asarray(scores, dtype=np.float32)
+        expected_shape = (len(self.boss_names),) + (len(TYPE_LIST),) * 3
+        if self.scores.shape != expected_shape:
+            raise ValueError(
+                f'Path scores have shape {self.scores.shape} instead of '
+                f'{expected_shape}.')
+
+    @classmethod
+    def from_matchups(
+        cls, boss_names: Sequence[str], matchups: np.ndarray,
+        rental_type_ids: Sequence[Sequence[str]]
+    ) -> 'PathTree':
+        """Build a tree from the matchup scores of every rental Pokemon (the
+        columns of `matchups`) against every boss (the rows).
+        """
 
-    def score_path(self, legendary: str, path: list) -> float:
-        """Return the pre-calculated score for a particular path
+        return cls(boss_names, np.stack([
+            calculate_path_scores(boss_matchups, rental_type_ids)
+            for boss_matchups in matchups]))
 
-        This method tells the stored tree to traverse its paths for
-        the current legendary, the first type in the path, the second
-        type in the path, and then the third type in the path.
+    def save(self, file_path: str) -> None:
+        """Save the tree to a .npz file."""
+        np.savez(
+            file_path, boss_names=np.array(self.boss_names),
+            scores=self.scores)
 
-        The results can then be combined
+    @classmethod
+    def load(cls, file_path: str) -> 'PathTree':
+        """Load a tree saved with `save`.
 
-        boss: 'articuno'
-        path: ['type1', 'type2', 'type3']
+        Configs written before the tree was stored as a .npz file point to
+        data/path_tree.json, which no longer exists. Such a path is mapped to
+        the .npz file next to it.
         """
 
-        if self.tree_depth == 1:
-            legendary_tree_node = self.base_node.get_node_for_key(legendary)
+        root, extension = os.path.splitext(file_path)
+        if extension.lower() == '.json':
+            file_path = root + '.npz'
+            logging.getLogger('automaxlair').warning(
+                f'The path tree is no longer stored as JSON; loading '
+                f'{file_path} instead. Update path_tree_path in Config.toml.')
+        with np.load(file_path, allow_pickle=False) as archive:
+            return cls(archive['boss_names'].tolist(), archive['scores'])
+
+    def _get_type_codes(self, path: Sequence[str]) -> Tuple[int, ...]:
+        if len(path) > self.tree_depth:
+            raise ValueError(f'Path {path} has more than three types.')
+        return tuple(matchup_scoring.TYPE_CODES[type_id] for type_id in path)
+
+    def score_path(self, legendary: str, path: Sequence[str]) -> float:
+        """Return the pre-calculated score for a particular path
 
-            # then build up the scores and scale them based on position
-            outscore = 0.0
-            for ii, type_name in enumerate(path):
-                base_score = legendary_tree_node.get_node_for_key(type_name)
-                # the formula for now helps weight the order you find
-                # the type in, so deeper paths might be more useful
-                # since you get a PP restore *and* type advantage
-                outscore += (1.0 + (ii * 0.1)) * base_score
+        boss: 'articuno'
+        path: ['type1', 'type2', 'type3']
 
-            return outscore
+        Paths with fewer than three types are scored as the average over
+        all possible remaining types.
+        """
 
-        else:
-            return self.base_node.traverse_node([legendary] + path, 0)
+        return float(self.scores[
+            (self.boss_indices[legendary],) + self._get_type_codes(path)
+        ].mean())
 
     def get_best_path(
         self, legendary: str, path_list: List[List[str]]
-    ) -> Tuple[float, List[str], List[float]]:
+    ) -> Tuple[int, List[str], List[float]]:
         """Choose the best path out of a list of paths."""
-        path_scores = []
-        for path in path_list:
-            path_scores.append(self.score_path(legendary, path))
+        if all(len(path) == self.tree_depth for path in path_list):
+            codes = np.array(
+                [self._get_type_codes(path) for path in path_list],
+                dtype=np.intp).reshape(-1, self.tree_depth)
+            path_scores = self.scores[
+                self.boss_indices[legendary],
+                codes[:, 0], codes[:, 1], codes[:, 2]].tolist()
+        else:
+            path_scores = [
+                self.score_path(legendary, path) for path in path_list]
         best_index = path_scores.index(max(path_scores))
         return best_index, path_list[best_index], path_scores
 
-    def _build_tree(self, rental_pokemon, boss_pokemon):
-        self.base_node = TreeNode(legendary=True)
-
-        for ii, (legendary_name, legendary) in enumerate(boss_pokemon.items()):
-            print(
-                f"{ii+1:02d}/{len(boss_pokemon)} : Calculating for {legendary_name}")
-            self.base_node.add_node(legendary_name, self._build_node_for_types(
-                current_score=0.0, legendary=legendary, rental_pokemon=rental_pokemon, path_num=0
-            ))
-
-    def _build_node_for_types(self, current_score, legendary, rental_pokemon, path_num=0):
-
-        current_node = TreeNode(legendary=False)
 
-        for type_name in TYPE_LIST:
-            # calculate the score
-            # if path_num == 2:
-            #     print(f"{type_name} ", end="" if type_name != 'fairy' else "\n")
-            # else:
-            #     print(f"{'  '*path_num} path {path_num+1} : {type_name}",
-            #           end="\n" if path_num < 1 else "\n      ")
-
-            possible_pokemon = []
-            for pokemon_name in self.rental_by_type[type_name]:
-                possible_pokemon.append(rental_pokemon[pokemon_name])
-
-            type_score = self.calculate_score(possible_pokemon, legendary)
-            # there are only a total of three paths, so we only add nodes to the tree
-            # if we're less than 2 (ex. 0 and 1 for first two paths)
-            # if path_num < 2:
-            #     # then pass through the tree to the next node through a recursive process to
-            #     # build up the tree
-            #     current_node.add_node(type_name, self._build_node_for_types(
-            #         current_score=current_score+type_score, legendary=legendary, rental_pokemon=rental_pokemon,
-            #         path_num=path_num+1
-            #     ))
-            # else:
-            #     current_node.add_node(type_name, current_score + type_score)
-
-            # FOR NOW, NO RECURSION - TODO: modify algorithm for this to make sense
-            current_node.add_node(type_name, type_score)
-
-        return current_node
-
-    def calculate_score(self, possible_pokemon, legendary):
-        # just pass things through some kind of algorithm that determines an average score
-        # *just* based on type
-
-        the_score = 0.0
-
-        for pokemon in possible_pokemon:
-            the_score += matchup_scoring.evaluate_matchup(pokemon, legendary)
-
-        the_score /= len(possible_pokemon)
-
-        return the_score
-
-
-class TreeNode:
-    def __init__(self, legendary=False):
-        if legendary:
-            self.hash_table = {}
-        else:
-            self.hash_table = {key: None for key in TYPE_LIST}
-
-    def add_node(self, key, value):
-        self.hash_table[key] = value
-
-    def traverse_node(self, list_of_decisions, current_idx=0):
-
-        if type(self.hash_table[list_of_decisions[current_idx]]) == TreeNode:
-            return self.hash_table[list_of_decisions[current_idx]].traverse_node(list_of_decisions, current_idx + 1)
-        else:
-            return self.hash_table[list_of_decisions[current_idx]]
+def calculate_path_scores(
+    boss_matchups: Sequence[float], rental_type_ids: Sequence[Sequence[str]]
+) -> np.ndarray:
+    """Return the scores of every path against a single boss as an array with
+    shape (type 1, type 2, type 3), given the matchup score of each rental
+    Pokemon against that boss and the types of each rental Pokemon.
+    """
 
-    def get_node_for_key(self, key):
-        # no matter what, this only returns what is assigned to the hash table
-        # for that particular key
-        return self.hash_table[key]
+    boss_matchups = np.asarray(boss_matchups, dtype=np.float64)
+    levels = np.unique(boss_matchups)
+    # cdf[t, k] is the probability that a random rental Pokemon of type t
+    # has a matchup score no greater than levels[k].
+    cdf = np.zeros((len(TYPE_LIST), len(levels)))
+    for t, type_id in enumerate(TYPE_LIST):
+        members = np.sort(np.array([
+            score for score, type_ids in zip(boss_matchups, rental_type_ids)
+            if type_id in type_ids]))
+        if len(members) == 0:
+            raise ValueError(f'No rental Pokemon have the {type_id} type.')
+        cdf[t] = np.searchsorted(members, levels, side='right') / len(members)
+
+    def expected_max(max_cdf):
+        # E[max] from the CDF of the maximum of independent draws.
+        probabilities = np.diff(max_cdf, axis=-1, prepend=0)
+        return probabilities @ levels
+
+    first = cdf[:, None, None, :]
+    second = first * cdf[None, :, None, :]
+    third = second * cdf[None, None, :, :]
+    return (
+        POSITION_WEIGHTS[0] * expected_max(first)
+        + POSITION_WEIGHTS[1] * expected_max(second)
+        + POSITION_WEIGHTS[2] * expected_max(third))
@@ -129,7 +129,7 @@ class Pokemon():
         copied_pokemon.PP = copy.deepcopy(self.PP)
         copied_pokemon.HP = copy.deepcopy(self.HP)
         copied_pokemon.status = self.status
-        copied_pokemon.stat_modifiers = self.stat_modifiers
+        copied_pokemon.stat_modifiers = copy.copy(self.stat_modifiers)
         copied_pokemon.dynamax = self.dynamax
         return copied_pokemon
 
@@ -0,0 +1,140 @@
+"""Process-wide storage for the static Pokemon data used by Dynamax
+Adventures.
+"""
+
+import copy
+import logging
+import os
+from types import MappingProxyType
+from typing import Dict, Optional, Sequence, Tuple
+
+import jsonpickle
+
+from automaxlair import matchup_scoring
+from automaxlair.binary_data import (
+    SOURCE_NAMES, BinaryPokemonData, hash_source_file)
+from automaxlair.matchup_table import MatchupTable
+from automaxlair.move_policy import MovePolicyTable
+from automaxlair.path_tree import PathTree
+from automaxlair.pokemon_classes import Pokemon
+from automaxlair.pokemon_name_index import PokemonNameIndex
+
+
+class PokemonDataStore:
+    """Read-only container for the precalculated Pokemon data.
+
+    The data files are only read once per process for each set of paths;
+    subsequent calls to `load` return the same object. Pokemon stored here
+    must not be mutated, so code that changes the state of a Pokemon (PP,
+    HP, Dynamax, et cetera) should work on the copies returned by
+    `get_rental_pokemon` and `get_boss_pokemon`.
+
+    If a binary data file exported by `scripts/export_binary_data.py` is
+    supplied and was generated from the current jsonpickle files, it is
+    loaded instead of the (much slower) jsonpickle files.
+    """
+
+    _instances: Dict[
+        Tuple[Tuple[str, ...], Optional[str], Optional[str]],
+        'PokemonDataStore'
+    ] = {}
+
+    def __init__(
+        self, data_paths: Sequence[str], binary_path: Optional[str] = None,
+        move_policy_path: Optional[str] = None
+    ) -> None:
+        binary_data = None
+        if binary_path is not None and os.path.exists(binary_path):
+            binary_data = BinaryPokemonData(binary_path)
+            if binary_data.source_hashes != [
+                hash_source_file(path)
+                for path in data_paths[:len(SOURCE_NAMES)]
+            ]:
+                logging.getLogger('automaxlair').warning(
+                    f'{binary_path} is out of date; loading the jsonpickle '
+                    'data files instead. Run scripts/export_binary_data.py '
+                    'to update it.')
+                binary_data = None
+
+        if binary_data is not None:
+            boss_pokemon = binary_data.boss_pokemon
+            rental_pokemon = binary_data.rental_pokemon
+            boss_matchups = binary_data.get_matchup_table('boss_matchups')
+            rental_matchups = binary_data.get_matchup_table(
+                'rental_matchups')
+            rental_scores = binary_data.get_scores('rental_scores')
+        else:
+            with open(data_paths[0], 'r', encoding='utf8') as file:
+                boss_pokemon = jsonpickle.decode(file.read())
+            with open(data_paths[1], 'r', encoding='utf8') as file:
+                rental_pokemon = jsonpickle.decode(file.read())
+            with open(data_paths[2], 'r', encoding='utf8') as file:
+                boss_matchups = MatchupTable.from_dict(
+                    jsonpickle.decode(file.read()))
+            with open(data_paths[3], 'r', encoding='utf8') as file:
+                rental_matchups = MatchupTable.from_dict(
+                    jsonpickle.decode(file.read()))
+            with open(data_paths[4], 'r', encoding='utf8') as file:
+                rental_scores = jsonpickle.decode(file.read())
+        self.path_tree = PathTree.load(data_paths[5])
+
+        self.boss_pokemon = MappingProxyType(boss_pokemon)
+        self.rental_pokemon = MappingProxyType(rental_pokemon)
+        self.boss_matchups = boss_matchups
+        self.rental_matchups = rental_matchups
+        self.rental_scores = MappingProxyType(rental_scores)
+        # Rental scores in the order of the rows of the matchup tables.
+        self.rental_score_array = boss_matchups.align_row_scores(
+            rental_scores)
+        # Average contributions of the rental pool, used as teammates when
+        # scoring moves. The cached values are reused by every run.
+        self.teammates = matchup_scoring.TeammateAggregates(rental_pokemon)
+        self.name_indices: Dict[str, PokemonNameIndex] = {}
+
+        # Precalculated move decisions, which are only valid for the Pokemon
+        # they were calculated from.
+        self.move_policy = None
+        if move_policy_path is not None and os.path.exists(move_policy_path):
+            move_policy = MovePolicyTable(
+                move_policy_path, self.rental_pokemon, self.boss_pokemon)
+            if move_policy.source_hashes == [
+                hash_source_file(data_paths[1]),
+                hash_source_file(data_paths[0])
+            ]:
+                self.move_policy = move_policy
+            else:
+                logging.getLogger('automaxlair').warning(
+                    f'{move_policy_path} is out of date and will not be used. '
+                    'Run scripts/build_move_policy.py to update it.')
+
+    @classmethod
+    def load(
+        cls, data_paths: Sequence[str], binary_path: Optional[str] = None,
+        move_policy_path: Optional[str] = None
+    ) -> 'PokemonDataStore':
+        """Return the data store for the supplied paths, reading the files
+        only if they have not been read before in this process.
+        """
+
+        key = (tuple(data_paths), binary_path, move_policy_path)
+        if key not in cls._instances:
+            cls._instances[key] = cls(*key)
+        return cls._instances[key]
+
+    def get_name_index(self, lang: str) -> PokemonNameIndex:
+        """Return the index used to identify rental Pokemon from OCRed text
+        in the supplied language, building it the first time it is needed.
+        """
+
+        if lang not in self.name_indices:
+            self.name_indices[lang] = PokemonNameIndex(
+                self.rental_pokemon, lang)
+        return self.name_indices[lang]
+
+    def get_rental_pokemon(self, name_id: str) -> Pokemon:
+        """Return a copy of a rental Pokemon that can be modified freely."""
+        return copy.copy(self.rental_pokemon[name_id])
+
+    def get_boss_pokemon(self, name_id: str) -> Pokemon:
+        """Return a copy of a boss Pokemon that can be modified freely."""
+        return copy.copy(self.boss_pokemon[name_id])
@@ -0,0 +1,228 @@
+"""Fast lookup of rental Pokemon from OCRed text."""
+
+from collections import Counter
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from automaxlair.pokemon_classes import Pokemon
+
+# Length of the substrings used to shortlist candidates.
+GRAM_LENGTH = 3
+
+
+def levenshtein(a: str, b: str, cutoff: Optional[int] = None) -> int:
+    """Return the edit distance between two strings.
+
+    If a cutoff is supplied, only the band of the distance matrix that can
+    lead to a distance within the cutoff is computed, and cutoff + 1 is
+    returned as soon as the distance is known to exceed the cutoff.
+    """
+
+    if len(a) < len(b):
+        a, b = b, a
+    if cutoff is None:
+        cutoff = len(a)
+    if len(a) - len(b) > cutoff:
+        return cutoff + 1
+    if len(b) == 0:
+        return len(a)
+
+    too_far = cutoff + 1
+    previous = [j if j <= cutoff else too_far for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        char = a[i - 1]
+        low = max(1, i - cutoff)
+        high = min(len(b), i + cutoff)
+        current = [too_far] * (len(b) + 1)
+        current[0] = i if i <= cutoff else too_far
+        row_min = current[0]
+        for j in range(low, high + 1):
+            value = min(
+                previous[j - 1] + (char != b[j - 1]),
+                previous[j] + 1,
+                current[j - 1] + 1)
+            if value > too_far:
+                value = too_far
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > cutoff:
+            return too_far
+        previous = current
+    return min(previous[len(b)], too_far)
+
+
+def normalize(text: str) -> str:
+    """Return a version of OCRed text that ignores case and whitespace."""
+    return ''.join(text.casefold().split())
+
+
+def get_grams(text: str) -> Counter:
+    """Return the counts of the substrings of length GRAM_LENGTH."""
+    return Counter(
+        text[i:i + GRAM_LENGTH] for i in range(len(text) - GRAM_LENGTH + 1))
+
+
+class _FieldIndex:
+    """Identifying strings of all rental Pokemon for one combination of
+    OCRed fields, with hash and n-gram lookups.
+    """
+
+    def __init__(self, strings: List[str]) -> None:
+        self.strings = strings
+        self.lengths = np.array([len(text) for text in strings])
+        self.exact: Dict[str, int] = {}
+        self.normalized: Dict[str, int] = {}
+        for i, text in enumerate(strings):
+            self.exact.setdefault(text, i)
+            self.normalized.setdefault(normalize(text), i)
+
+        # Matrix of the number of times each n-gram occurs in each string.
+        gram_counts = [get_grams(text) for text in strings]
+        self.gram_indices: Dict[str, int] = {}
+        for counts in gram_counts:
+            for gram in counts:
+                self.gram_indices.setdefault(gram, len(self.gram_indices))
+        self.gram_matrix = np.zeros(
+            (len(strings), len(self.gram_indices)), dtype=np.int16)
+        for i, counts in enumerate(gram_counts):
+            for gram, count in counts.items():
+                self.gram_matrix[i, self.gram_indices[gram]] = count
+
+    def get_lower_bounds(self, text: str) -> np.ndarray:
+        """Return a lower bound on the edit distance between the text and each
+        string, from their lengths and the n-grams they share.
+        """
+
+        query = [
+            (self.gram_indices[gram], count)
+            for gram, count in get_grams(text).items()
+            if gram in self.gram_indices]
+        if len(query) > 0:
+            columns, counts = zip(*query)
+            shared = np.minimum(
+                self.gram_matrix[:, columns], counts).sum(axis=1)
+        else:
+            shared = np.zeros(len(self.strings), dtype=np.int64)
+        # Each edit changes at most GRAM_LENGTH n-grams.
+        longest = np.maximum(self.lengths, len(text))
+        gram_bound = np.ceil(
+            (longest - GRAM_LENGTH + 1 - shared) / GRAM_LENGTH)
+        return np.maximum(gram_bound, np.abs(self.lengths - len(text)))
+
+    def search(
+        self, text: str, mask: Optional[np.ndarray] = None
+    ) -> Tuple[int, int]:
+        """Return the index of the closest string and its edit distance. Ties
+        are resolved in favour of the first string. If a boolean mask is
+        given, only the strings where it is True are considered.
+        """
+
+        best_index = self.exact.get(text)
+        if best_index is not None and (mask is None or mask[best_index]):
+            return best_index, 0
+        best_index = None
+        best_distance = len(text) + int(self.lengths.max(initial=0))
+        # A normalized match is likely to be the best, so check it first to
+        # tighten the cutoff.
+        normalized_index = self.normalized.get(normalize(text))
+        if normalized_index is not None and (
+            mask is None or mask[normalized_index]
+        ):
+            best_index = normalized_index
+            best_distance = levenshtein(text, self.strings[normalized_index])
+
+        bounds = self.get_lower_bounds(text)
+        if mask is not None:
+            # Excluded strings are never closer than the cutoff.
+            bounds = np.where(mask, bounds, np.inf)
+        for i in np.lexsort((np.arange(len(bounds)), bounds)).tolist():
+            if bounds[i] > best_distance:
+                break
+            if i == best_index:
+                continue
+            if best_index is not None and bounds[i] == best_distance and (
+                i > best_index
+            ):
+                continue
+            if best_index is None:
+                # Nothing to compare against yet, so widen the band until
+                # the distance to the most promising string is found.
+                cutoff = max(int(bounds[i]), 2)
+                distance = levenshtein(text, self.strings[i], cutoff)
+                while distance > cutoff and cutoff < best_distance:
+                    cutoff = min(2 * cutoff, best_distance)
+                    distance = levenshtein(text, self.strings[i], cutoff)
+            else:
+                distance = levenshtein(text, self.strings[i], best_distance)
+            if distance < best_distance or (
+                distance == best_distance
+                and (best_index is None or i < best_index)
+            ):
+                best_index = i
+                best_distance = distance
+        return best_index, best_distance
+
+
+class PokemonNameIndex:
+    """Index of the identifying strings of the rental Pokemon in one
+    language, used to match OCRed text to a rental Pokemon.
+
+    The identifying string of a Pokemon is its name followed by its ability,
+    types, and moves, where each of these is only included if it was OCRed.
+    The strings for every combination of fields are built up front.
+    """
+
+    def __init__(self, rental_pokemon: Mapping[str, Pokemon], lang: str) -> None:
+        self.lang = lang
+        self.pokemon = list(rental_pokemon.values())
+        self.indices = {
+            pokemon.name_id: i for i, pokemon in enumerate(self.pokemon)}
+        self.field_indices: Dict[Tuple[bool, bool, bool], _FieldIndex] = {}
+        for ability in (False, True):
+            for types in (False, True):
+                for moves in (False, True):
+                    self.field_indices[(ability, types, moves)] = _FieldIndex(
+                        [self._get_string(pokemon, ability, types, moves)
+                         for pokemon in self.pokemon])
+
+    def _get_string(
+        self, pokemon: Pokemon, ability: bool, types: bool, moves: bool
+    ) -> str:
+        """Return the identifying string of a Pokemon."""
+        string_to_match = pokemon.names[self.lang]
+        if ability:
+            string_to_match += pokemon.abilities[self.lang]
+        if types:
+            for type_name_dict in pokemon.types:
+                string_to_match += type_name_dict[self.lang]
+        if moves:
+            for move in pokemon.moves:
+                string_to_match += move.names.get(self.lang, move.name_id)
+        return string_to_match
+
+    def match(
+        self, name: str, ability: str = '', types: str = '', moves: str = '',
+        candidates: Optional[Iterable[str]] = None
+    ) -> Tuple[Pokemon, str, int]:
+        """Return the rental Pokemon whose identifying string is closest to
+        the OCRed text, along with that string and its edit distance from the
+        text. Fields that were not OCRed should be empty strings.
+
+        If the name_ids of candidate Pokemon are given, only they are
+        considered.
+        """
+
+        text = (name + ability + types + moves).replace('\n', '')
+        field_index = self.field_indices[
+            (ability != '', types != '', moves != '')]
+        mask = None
+        if candidates is not None:
+            mask = np.zeros(len(self.pokemon), dtype=bool)
+            mask[[self.indices[name_id] for name_id in candidates
+                  if name_id in self.indices]] = True
+            if not mask.any():
+                raise ValueError('None of the candidates are rental Pokemon.')
+        i, distance = field_index.search(text, mask)
+        return self.pokemon[i], field_index.strings[i], distance
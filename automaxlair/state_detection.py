@@ -0,0 +1,167 @@
+"""Detection of screen states from the colours of regions of a frame.
+
+A state detector is a table of states, each identified by a set of region
+checks that must all pass. A region check passes if the mean of the mask of
+the pixels in a rectangle that are within an HSV range is above a threshold,
+exactly like `SwitchController.check_rect_HSV_match`.
+
+All checks are evaluated together at full resolution, so every mean is the
+same as the one `check_rect_HSV_match` computes. Only the union of the
+checked rectangles is converted to HSV, and ranges that only restrict the
+value channel (such as black screen checks) are thresholded without any
+conversion. One mask and one integral image are computed per distinct HSV
+range, after which the mean of any rectangle costs four lookups.
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import cv2
+
+from automaxlair.image_processing import (
+    Frame, Image, Rectangle, as_image, get_pixel_bounds)
+
+Bounds = Tuple[Tuple[int, int, int], Tuple[int, int, int]]
+
+
+def is_value_range(
+    lower_threshold: Tuple[int, int, int],
+    upper_threshold: Tuple[int, int, int]
+) -> bool:
+    """Return whether an HSV range only restricts the value channel."""
+    return (
+        lower_threshold[0] <= 0 and upper_threshold[0] >= 179
+        and lower_threshold[1] <= 0 and upper_threshold[1] >= 255)
+
+
+def get_value_mask(img: Image, lower_value: int, upper_value: int) -> Image:
+    """Return the mask of the pixels of a BGR image whose HSV value is within
+    a range. The value of a pixel is its largest channel, so this gives the
+    same mask as converting to HSV for ranges accepted by `is_value_range`
+    without converting the image.
+    """
+
+    mask = cv2.inRange(img, (0, 0, 0), (upper_value,) * 3)
+    if lower_value > 0:
+        mask = cv2.bitwise_and(mask, cv2.bitwise_not(
+            cv2.inRange(img, (0, 0, 0), (lower_value - 1,) * 3)))
+    return mask
+
+
+class RegionCheck(NamedTuple):
+    """A check that enough of a rectangle is within an HSV range."""
+    rect: Rectangle
+    lower_threshold: Tuple[int, int, int]
+    upper_threshold: Tuple[int, int, int]
+    mean_value_threshold: float
+
+
+class StateDetector:
+    """Detect which of a table of screen states a frame is showing.
+
+    The table is a sequence of (state, checks) pairs in order of priority.
+    """
+
+    def __init__(
+        self, states: Sequence[Tuple[str, Sequence[RegionCheck]]]
+    ) -> None:
+        self.states = [(state, tuple(checks)) for state, checks in states]
+        self.checks = list(dict.fromkeys(
+            check for __, checks in self.states for check in checks))
+        self._layouts: Dict[Tuple[int, int], Tuple] = {}
+
+    def _get_layout(self, height: int, width: int) -> Tuple:
+        """Return the area of the frame that needs to be converted to HSV
+        and, for each HSV range, the area its mask covers and the pixel
+        bounds of its rectangles within that area.
+        """
+
+        layout = self._layouts.get((height, width))
+        if layout is not None:
+            return layout
+
+        def get_bounds(rect):
+            return get_pixel_bounds(rect, height, width)
+
+        def get_union(all_bounds):
+            tops, bottoms, lefts, rights = zip(*all_bounds)
+            return min(tops), max(bottoms), min(lefts), max(rights)
+
+        groups: Dict[Bounds, List[RegionCheck]] = {}
+        for check in self.checks:
+            groups.setdefault(
+                (check.lower_threshold, check.upper_threshold), []
+            ).append(check)
+        hsv_checks = [
+            check for check in self.checks if not is_value_range(
+                check.lower_threshold, check.upper_threshold)]
+        area = None
+        if len(hsv_checks) > 0:
+            area = get_union([get_bounds(check.rect) for check in hsv_checks])
+        masks = []
+        for bounds, checks in groups.items():
+            mask_area = get_union([get_bounds(check.rect) for check in checks])
+            # Pixel bounds relative to the mask area.
+            rects = [
+                (check, (
+                    top - mask_area[0], bottom - mask_area[0],
+                    left - mask_area[2], right - mask_area[2]))
+                for check, (top, bottom, left, right) in (
+                    (check, get_bounds(check.rect)) for check in checks)]
+            masks.append((bounds, mask_area, rects))
+        layout = (area, masks)
+        self._layouts[(height, width)] = layout
+        return layout
+
+    def get_means(self, img: Union[Frame, Image]) -> Dict[RegionCheck, float]:
+        """Return the mean mask value (0 to 255) of every check."""
+        img = as_image(img)
+        area, masks = self._get_layout(img.shape[0], img.shape[1])
+        if area is not None:
+            hsv = cv2.cvtColor(
+                img[area[0]:area[1], area[2]:area[3]], cv2.COLOR_BGR2HSV)
+
+        means = {}
+        for (lower, upper), (top, bottom, left, right), rects in masks:
+            if is_value_range(lower, upper):
+                mask = get_value_mask(
+                    img[top:bottom, left:right], lower[2], upper[2])
+            else:
+                mask = cv2.inRange(hsv[
+                    top - area[0]:bottom - area[0],
+                    left - area[2]:right - area[2]], lower, upper)
+            if len(rects) == 1:
+                # Counting is much faster than np.mean and gives the same
+                # value, since mask pixels are either 0 or 255.
+                means[rects[0][0]] = (
+                    255 * cv2.countNonZero(mask) / mask.size
+                    if mask.size > 0 else float('nan'))
+                continue
+            integral = cv2.integral(mask, sdepth=cv2.CV_32S)
+            for check, (r_top, r_bottom, r_left, r_right) in rects:
+                total = (
+                    integral[r_bottom, r_right] - integral[r_top, r_right]
+                    - integral[r_bottom, r_left] + integral[r_top, r_left])
+                size = (r_bottom - r_top) * (r_right - r_left)
+                # An empty rectangle never matches, as in
+                # check_rect_HSV_match.
+                means[check] = (
+                    float(total) / size if size > 0 else float('nan'))
+        return means
+
+    def get_results(self, img: Union[Frame, Image]) -> Dict[RegionCheck, bool]:
+        """Return whether each check passes."""
+        return {
+            check: mean > check.mean_value_threshold
+            for check, mean in self.get_means(img).items()}
+
+    def get_states(self, img: Union[Frame, Image]) -> List[str]:
+        """Return every state whose checks all pass, in order of priority."""
+        results = self.get_results(img)
+        return [
+            state for state, checks in self.states
+            if all(results[check] for check in checks)]
+
+    def detect(self, img: Union[Frame, Image]) -> Optional[str]:
+        """Return the highest priority state shown, or None."""
+        states = self.get_states(img)
+        return states[0] if len(states) > 0 else None
@@ -14,15 +14,24 @@ Specific use cases can inherit from this class and add specific functionality.
 import logging
 import sys
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Tuple, TypeVar, Iterable, Optional
+from typing import (
+    Any, Callable, Dict, List, Tuple, TypeVar, Iterable, Optional, Sequence,
+    Union)
 
 import cv2
-import pytesseract
 import serial
 import threading
 import discord
 
+from automaxlair.image_processing import (
+    Frame, as_frame, as_image, crop, get_HSV_mask_mean)
+from automaxlair.ocr import (
+    OCRCache, create_ocr_backend, get_stacked_segmentation_mode,
+    split_stacked_words, stack_images)
+
 Image = TypeVar('cv2 image')
 Rectangle = Tuple[Tuple[float, float], Tuple[float, float]]
 
@@ -46,6 +55,17 @@ class SwitchController:
         self.tesseract_language = self.phrases['TESSERACT_LANG_NAME']
         self.lang = self.phrases['DATA_LANG_NAME']
         self.enable_debug_logs = config['advanced']['ENABLE_DEBUG_LOGS']
+        self.ocr = create_ocr_backend(
+            config['advanced'].get('OCR_BACKEND', 'auto'),
+            config.get('TESSERACT_PATH'))
+        self.logger.info(f'Reading text with the {self.ocr.name} OCR backend.')
+        # Worker threads used to read several regions of an image at once.
+        self.ocr_pool = ThreadPoolExecutor(
+            max_workers=max(1, config['advanced'].get('OCR_WORKERS', 4)))
+        # Text read from images that look like ones read before is reused.
+        self.ocr_cache = OCRCache(
+            config['advanced'].get('OCR_CACHE_SIZE', 256),
+            config['advanced'].get('OCR_CACHE_TOLERANCE', 2))
 
         self.webhook_id = config['discord']['WEBHOOK_ID']
         self.webhook_token = config['discord']['WEBHOOK_TOKEN']
@@ -82,6 +102,12 @@ class SwitchController:
         self.cap = VideoCaptureHelper(
             vid_index, (1920, 1080), log_name, vid_scale)
 
+        # Time of the most recent button push, used to avoid making
+        # decisions based on frames captured before it.
+        self.last_button_time = 0.0
+        # Time spent in and saved by calls to wait_until, by name.
+        self.wait_stats: Dict[str, Dict[str, float]] = {}
+
         self.lock = threading.Lock()
         self.exit_flag = threading.Event()
         self.stage = 'initialize'
@@ -91,6 +117,8 @@ class SwitchController:
         """On destruction, release the serial port and video capture."""
         self.cap.release()
         self.com.close()
+        self.ocr_pool.shutdown()
+        self.ocr.close()
         cv2.destroyAllWindows()
 
     def _button_control_task(self):
@@ -156,12 +184,13 @@ class SwitchController:
 
     def outline_region(
         self,
-        image: Image,
+        image: Union[Frame, Image],
         rect: Rectangle,
         bgr: Tuple[int, int, int] = (255, 255, 255),
         thickness: int = 1
     ) -> None:
         """Draw a rectangle around a detection area for debug purposes."""
+        image = as_image(image)
         h, w = image.shape[:2]
         top_left = (round(rect[0][0] * w) - 1, round(rect[0][1] * h) - 1)
         bottom_right = (round(rect[1][0] * w) + 1, round(rect[1][1] * h) + 1)
@@ -169,7 +198,7 @@ class SwitchController:
 
     def outline_regions(
         self,
-        image: Image,
+        image: Union[Frame, Image],
         rects: Iterable[Rectangle],
         bgr: Tuple[int, int, int] = (255, 255, 255),
         thickness: int = 1
@@ -178,84 +207,239 @@ class SwitchController:
         for rect in rects:
             self.outline_region(image, rect, bgr, thickness)
 
-    def get_frame(self, resize: bool = False) -> Image:
+    def get_frame(self, resize: bool = False) -> Frame:
         """Get an image of the current Switch output. This method will usually
         be expanded upon by inheriting classes.
-        """
 
-        return self.cap.read(resize=resize)
+        The frame is the most recent one captured after the last button
+        push. Checks made on the same Frame share their processing.
+        """
 
-    def get_image_slice(self, img: Image, section: Rectangle) -> Image:
+        frame = self.cap.wait_for_frame_after(self.last_button_time)
+        if resize:
+            frame = Frame(
+                cv2.resize(frame.image, self.cap.display_resolution),
+                frame.timestamp, frame.index)
+        return frame
+
+    def get_image_slice(
+        self, img: Union[Frame, Image], section: Rectangle
+    ) -> Image:
         """Return the portion of the input image defined by the input
         rectangle. Note the coordinates range from (0, 0) at the top left
         corner to (1, 1) at the bottom right corner.
         """
 
-        h, w = img.shape[:2]
-        img = img[round(section[0][1] * h):round(section[1][1] * h),
-                  round(section[0][0] * w):round(section[1][0] * w)]
-        return img
+        return crop(as_image(img), section)
 
     def read_text(
         self,
-        img: Image,
+        img: Union[Frame, Image],
         section: Rectangle = ((0, 0), (1, 1)),
         threshold: bool = True,
         invert: bool = False,
-        segmentation_mode: str = '--psm 11'
+        segmentation_mode: str = '--psm 11',
+        release_lock: bool = True
     ) -> str:
         """Read text from a section (default entirety) of an image using
         Tesseract.
+
+        Callers that don't hold the lock, such as background tasks, must set
+        `release_lock` to False.
         """
 
-        # Process image according to instructions
-        if threshold:
-            img = cv2.inRange(cv2.cvtColor(
-                img, cv2.COLOR_BGR2HSV), (0, 0, 160), (180, 15, 255))
-        if invert:
-            img = cv2.bitwise_not(img)
-        img = self.get_image_slice(img, section)
+        # Crop the section, then process it according to instructions.
+        frame = as_frame(img)
+        img = frame.get_text_region(section, threshold, invert)
 
-        # Then, read text using Tesseract.
+        # Then, read text using Tesseract unless the same image was read
+        # before.
         # Note that we need to check for the main thread exiting here.
         if self.exit_flag.is_set():
             sys.exit()
-        # We release the lock so that the display thread can continue while
-        # Tesseract processes the image.
-        self.lock.release()
-        text = pytesseract.image_to_string(
-            img, lang=self.tesseract_language, config=segmentation_mode
-        ).replace('\n', '').strip()
-        self.log(f'Read text from screen: {text}', 'DEBUG')
-        self.lock.acquire()
+        text, cache_key = self.ocr_cache.lookup(
+            img, self.tesseract_language, segmentation_mode)
+        if text is not None:
+            latency, source = 0.0, 'cache'
+        else:
+            # We release the lock so that the display thread can continue
+            # while Tesseract processes the image.
+            if release_lock:
+                self.lock.release()
+            try:
+                text, latency = self.ocr.image_to_string_timed(
+                    img, self.tesseract_language, segmentation_mode)
+            finally:
+                if release_lock:
+                    self.lock.acquire()
+            self.ocr_cache.store(cache_key, text)
+            source = self.ocr.name
+        text = text.replace('\n', '').strip()
+        self.log(
+            f'Read text from screen: {text} (frame {frame.index}, '
+            f'{latency * 1000:.1f} ms, {source})', 'DEBUG')
 
         # Finally, return the OCRed text.
         return text
 
+    def read_texts(
+        self,
+        img: Union[Frame, Image],
+        regions: Sequence[Tuple[Rectangle, Dict[str, Any]]],
+        stack: bool = False,
+        release_lock: bool = True
+    ) -> List[str]:
+        """Read text from several sections of an image at once.
+
+        Each region is a rectangle and a dict of keyword arguments accepted
+        by `read_text` (threshold, invert, and segmentation_mode). The
+        sections are read in parallel by the OCR worker threads, so the
+        batch takes about as long as its slowest section. The texts are
+        returned in the same order as the regions.
+
+        If `stack` is True, sections with the same segmentation mode are
+        stacked into one image and read with a single OCR call. Sections
+        whose text can't be separated from the rest of the stack are read
+        individually afterwards.
+
+        As in `read_text`, callers that don't hold the lock must set
+        `release_lock` to False.
+        """
+
+        # Process the images before the lock is released.
+        frame = as_frame(img)
+        jobs = []
+        for section, options in regions:
+            options = dict(options)
+            segmentation_mode = options.pop('segmentation_mode', '--psm 11')
+            jobs.append((frame.get_text_region(
+                section, options.get('threshold', True),
+                options.get('invert', False)), segmentation_mode))
+
+        if self.exit_flag.is_set():
+            sys.exit()
+        # Only read the sections that aren't cached.
+        results = [None] * len(jobs)
+        cache_keys = {}
+        for i, (job_img, segmentation_mode) in enumerate(jobs):
+            text, cache_key = self.ocr_cache.lookup(
+                job_img, self.tesseract_language, segmentation_mode)
+            if text is None:
+                cache_keys[i] = cache_key
+            else:
+                results[i] = (text, 0.0, 'cache')
+        if release_lock:
+            self.lock.release()
+        try:
+            start_time = time.perf_counter()
+            read_results, call_times = self._run_ocr_jobs(
+                [jobs[i] for i in cache_keys], stack)
+            batch_time = time.perf_counter() - start_time
+        finally:
+            if release_lock:
+                self.lock.acquire()
+        for (i, cache_key), (text, latency) in zip(
+            cache_keys.items(), read_results
+        ):
+            self.ocr_cache.store(cache_key, text)
+            results[i] = (text, latency, self.ocr.name)
+
+        texts = []
+        for text, latency, source in results:
+            text = text.replace('\n', '').strip()
+            self.log(
+                f'Read text from screen: {text} (frame {frame.index}, '
+                f'{latency * 1000:.1f} ms, {source})', 'DEBUG')
+            texts.append(text)
+        self.log(
+            f'Read {len(texts)} regions with {len(call_times)} OCR calls and '
+            f'{len(texts) - len(cache_keys)} cached results in '
+            f'{batch_time * 1000:.1f} ms ({sum(call_times) * 1000:.1f} ms of '
+            'OCR).', 'DEBUG')
+        return texts
+
+    def _run_ocr_jobs(
+        self,
+        jobs: Sequence[Tuple[Image, str]],
+        stack: bool
+    ) -> Tuple[List[Tuple[str, float]], List[float]]:
+        """OCR processed images on the worker threads. Return the text read
+        from each image along with the latency of the call that read it, and
+        the latency of every call made.
+        """
+
+        def read_individually(i):
+            return self.ocr_pool.submit(
+                self.ocr.image_to_string_timed, jobs[i][0],
+                self.tesseract_language, jobs[i][1])
+
+        # Group the images that can be stacked and read together.
+        groups = {}
+        for i, (job_img, segmentation_mode) in enumerate(jobs):
+            stacked_mode = None
+            if stack and job_img.size > 0:
+                stacked_mode = get_stacked_segmentation_mode(
+                    segmentation_mode)
+            if stacked_mode is None:
+                groups[(i,)] = [i]
+            else:
+                groups.setdefault(
+                    (stacked_mode, job_img.ndim), []).append(i)
+
+        pending = []
+        for key, indices in groups.items():
+            if len(indices) == 1:
+                pending.append((indices, None, read_individually(indices[0])))
+            else:
+                stacked_img, bands = stack_images(
+                    [jobs[i][0] for i in indices])
+                pending.append((indices, bands, self.ocr_pool.submit(
+                    self.ocr.image_to_data_timed, stacked_img,
+                    self.tesseract_language, key[0])))
+
+        results = [None] * len(jobs)
+        call_times = []
+        retries = []
+        for indices, bands, future in pending:
+            result, latency = future.result()
+            call_times.append(latency)
+            if bands is None:
+                results[indices[0]] = (result, latency)
+                continue
+            for i, text in zip(indices, split_stacked_words(result, bands)):
+                if text is None:
+                    retries.append((i, read_individually(i)))
+                else:
+                    results[i] = (text, latency)
+        for i, future in retries:
+            results[i] = future.result()
+            call_times.append(results[i][1])
+        return results, call_times
+
     def check_rect_HSV_match(
         self,
         rect: Rectangle,
         lower_threshold: Tuple[int, int, int],
         upper_threshold: Tuple[int, int, int],
         mean_value_threshold: float,
-        img: Image = None,
+        img: Union[Frame, Image] = None,
         already_HSV: bool = False
     ) -> bool:
         """Check a specified section of the screen for values within a certain
         HSV range.
         """
 
-        # Fetch, convert, crop, and threshold image so the feature of interest
+        # Fetch, crop, convert, and threshold image so the feature of interest
         # is white (value 255) and everything else appears black (0)
         if img is None:
             img = self.get_frame()
-        if not already_HSV:
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        h, w = img.shape[:2]
-        cropped_area = img[round(rect[0][1] * h):round(rect[1][1] * h),
-                           round(rect[0][0] * w):round(rect[1][0] * w)]
-        measured_value = cv2.inRange(
-            cropped_area, lower_threshold, upper_threshold).mean()
+        if already_HSV:
+            measured_value = get_HSV_mask_mean(
+                as_image(img), rect, lower_threshold, upper_threshold,
+                already_HSV=True)
+        else:
+            measured_value = as_frame(img).get_HSV_mask_mean(
+                rect, lower_threshold, upper_threshold)
 
         # Return True if the mean value is above the supplied threshold
         return measured_value > mean_value_threshold
@@ -305,6 +489,7 @@ class SwitchController:
             self.com.write(char)
             hold_ticks = bytes([round(hold_time * 12.5)])
             self.com.write(hold_ticks)
+            self.last_button_time = time.time()
             char_echo = self.com.read()
             hold_echo = self.com.read()
             # Check whether the microcontroller successfully echoed back the
@@ -328,6 +513,75 @@ class SwitchController:
         # subsequent command will attempt to release the lock.
         self.lock.acquire()
 
+    def wait_until(
+        self,
+        predicate: Callable[[Frame], bool],
+        timeout: float,  # Seconds
+        poll_interval: float = 0.1,  # Seconds
+        name: str = 'condition',
+        confirmations: int = 1
+    ) -> bool:
+        """Wait until a predicate is true of the Switch output, or until the
+        timeout passes. Return whether the predicate was met.
+
+        The predicate is checked on a new frame every poll interval and must
+        pass on `confirmations` consecutive frames. The lock is released
+        while sleeping between checks, as it is in push_button. The timeout
+        should be the fixed delay that the wait replaces, so the worst case
+        is no slower than before.
+        """
+
+        start_time = time.time()
+        deadline = start_time + timeout
+        passes = 0
+        while True:
+            if self.exit_flag.is_set():
+                sys.exit()
+            if predicate(self.get_frame()):
+                passes += 1
+                if passes >= confirmations:
+                    break
+            else:
+                passes = 0
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            self.lock.release()
+            try:
+                time.sleep(min(poll_interval, remaining))
+            finally:
+                self.lock.acquire()
+        met = passes >= confirmations
+
+        waited = time.time() - start_time
+        saved = max(0.0, timeout - waited)
+        stats = self.wait_stats.setdefault(
+            name, {'count': 0, 'timeouts': 0, 'waited': 0.0, 'saved': 0.0})
+        stats['count'] += 1
+        stats['timeouts'] += 0 if met else 1
+        stats['waited'] += waited
+        stats['saved'] += saved
+        if met:
+            self.log(
+                f'Waited {waited:.2f} s of {timeout:.2f} s for {name} '
+                f'({saved:.2f} s saved).', 'DEBUG')
+        else:
+            self.log(
+                f'Timed out after {waited:.2f} s waiting for {name}.',
+                'DEBUG')
+        return met
+
+    def get_wait_stats(self) -> Dict[str, Dict[str, float]]:
+        """Return the number of waits, timeouts, and the total time waited
+        and saved by calls to wait_until, by name.
+        """
+
+        return {name: dict(stats) for name, stats in self.wait_stats.items()}
+
+    def reset_wait_stats(self) -> None:
+        """Clear the statistics kept by wait_until."""
+        self.wait_stats = {}
+
     def push_buttons(self, *commands: Tuple[str, float]) -> None:
         """Send a sequence of messages to the microcontroller telling it to
         press buttons on the Switch.
@@ -355,7 +609,7 @@ class SwitchController:
 
         # Expand the image with blank space for writing results
         frame = cv2.copyMakeBorder(
-            image, 0, 0, 0, 250, cv2.BORDER_CONSTANT
+            as_image(image), 0, 0, 0, 250, cv2.BORDER_CONSTANT
         )
         width = frame.shape[1]
 
@@ -465,9 +719,14 @@ class SwitchController:
 
 
 class VideoCaptureHelper:
-    """A wrapper for an OpenCV VideoCapture object that assists in
-    restarting the video stream in the event of an error and resizing the video
-    when necessary.
+    """A wrapper for an OpenCV VideoCapture object that reads frames on a
+    background thread, restarts the video stream in the event of an error,
+    and resizes the video when necessary.
+
+    The grabber thread continuously drains the video device into a small
+    ring buffer of timestamped frames, so frames are never stale and callers
+    never wait on the device. Frames in the buffer are shared between
+    callers and must not be modified.
     """
 
     def __init__(
@@ -475,7 +734,8 @@ class VideoCaptureHelper:
         video_index: int,
         base_resolution: Tuple[int, int],
         log_name: str,
-        display_scale: float = 1.0
+        display_scale: float = 1.0,
+        buffer_size: int = 4
     ) -> None:
         self.video_index = video_index
         self.base_resolution = base_resolution
@@ -485,9 +745,20 @@ class VideoCaptureHelper:
             round(base_resolution[0] * display_scale),
             round(base_resolution[1] * display_scale)
         )
-        self.last_image = None
+        self.frames = deque(maxlen=buffer_size)
+        # Capture times of recent frames, used to measure the frame rate.
+        self.frame_times = deque(maxlen=60)
+        # Number of frames successfully read and reads that failed so far.
+        self.frame_count = 0
+        self.dropped_frames = 0
+        self.frame_condition = threading.Condition()
+        self.stop_event = threading.Event()
         self.init_video_capture()
 
+        self.grabber_thread = threading.Thread(
+            target=self._grab_frames, daemon=True)
+        self.grabber_thread.start()
+
     def init_video_capture(self) -> None:
         """Initialize the OpenCV VideoCapture object."""
         self.cap = cv2.VideoCapture(self.video_index)
@@ -503,32 +774,92 @@ class VideoCaptureHelper:
         self.failed_count = 0
         self.logger.info('Connected to the video stream.')
 
-    def read(self, resize: bool = False) -> Image:
-        """Fetch a frame from the VideoCapture object."""
-        ret, img = self.cap.read()
-
-        # Try to handle a dropped frame gracefully. Note that multiple dropped
-        # frames may cause the program to appear to freeze.
-        if ret:
-            self.last_image = img
-            self.failed_count = 0  # Clear count on consecutive failed frames
-        else:
-            self.logger.warning('Failed to read a frame from VideoCapture.')
-            img = self.last_image
+    def _grab_frames(self) -> None:
+        """Loop run by the grabber thread that reads every frame from the
+        device into the ring buffer.
+        """
 
-            self.failed_count = self.failed_count + 1
-            # If failed for too long, reiniitalize video capture connection
-            if self.failed_count == 10:
+        while not self.stop_event.is_set():
+            ret, img = self.cap.read()
+            timestamp = time.time()
+            if ret:
+                with self.frame_condition:
+                    self.frame_count += 1
+                    self.frames.append(
+                        Frame(img, timestamp, self.frame_count))
+                    self.frame_times.append(timestamp)
+                    self.frame_condition.notify_all()
+                self.failed_count = 0  # Clear count on consecutive failures
+                continue
+
+            # Try to handle a dropped frame gracefully. Note that multiple
+            # dropped frames may cause the program to appear to freeze.
+            if self.stop_event.is_set():
+                break
+            self.logger.warning('Failed to read a frame from VideoCapture.')
+            self.dropped_frames += 1
+            self.failed_count += 1
+            # If failed for too long, reinitialize video capture connection
+            if self.failed_count >= 10:
                 self.logger.warning(
                     'Too many failed frames. Reinitializing VideoCapture.')
-                self.release()
-                self.init_video_capture()
+                self.cap.release()
+                try:
+                    self.init_video_capture()
+                except RuntimeError:
+                    time.sleep(1)
+            else:
+                time.sleep(0.01)
+
+    def latest(self, timeout: float = 5) -> Frame:
+        """Return the most recent frame, waiting for the first frame if none
+        have been read yet.
+        """
+
+        with self.frame_condition:
+            if len(self.frames) == 0 and not self.frame_condition.wait_for(
+                lambda: len(self.frames) > 0, timeout
+            ):
+                raise RuntimeError('No frames received from VideoCapture.')
+            return self.frames[-1]
+
+    def wait_for_frame_after(self, t: float, timeout: float = 1) -> Frame:
+        """Return the most recent frame, waiting if necessary for a frame
+        captured after time t (as given by time.time()). If no such frame
+        arrives within the timeout, the most recent frame is returned.
+        """
 
+        with self.frame_condition:
+            if not self.frame_condition.wait_for(
+                lambda: len(self.frames) > 0 and self.frames[-1].timestamp > t,
+                timeout
+            ):
+                self.logger.warning(
+                    f'No new frame was received within {timeout} s.')
+        return self.latest()
+
+    def get_fps(self) -> float:
+        """Return the frame rate measured over the most recent frames."""
+        with self.frame_condition:
+            if len(self.frame_times) < 2:
+                return 0.0
+            elapsed = self.frame_times[-1] - self.frame_times[0]
+            return (len(self.frame_times) - 1) / max(elapsed, 1e-6)
+
+    def read(self, resize: bool = False) -> Image:
+        """Return the most recent frame as an image."""
+        img = self.latest().image
         if resize:
             img = cv2.resize(img, self.display_resolution)
 
         return img
 
     def release(self):
-        """Release the OpenCV VideoCapture object."""
+        """Stop the grabber thread and release the OpenCV VideoCapture
+        object.
+        """
+
+        self.stop_event.set()
+        if threading.current_thread() is not self.grabber_thread:
+            self.grabber_thread.join(timeout=1)
         self.cap.release()
@@ -0,0 +1,112 @@
+"""Benchmark identifying the type icons on the path screen with a blob search
+and stacked coarse matching against matching every template against the
+whole slice, as identify_path_pokemon used to do.
+
+Pass screenshots of the path screen (at any stage) to benchmark them;
+otherwise synthetic path screens are drawn from the type icon templates.
+Both versions are checked to give the same types and locations. The number
+of icons the blob search fell back to searching the whole slice for, and the
+mean time to read a stage of four paths, are printed.
+
+    python scripts/benchmark_path_icons.py [screenshot ...]
+"""
+
+import pickle
+import sys
+import time
+from os.path import abspath, dirname, join
+
+base_dir = dirname(dirname(abspath(__file__)))
+sys.path.insert(1, base_dir)
+
+import cv2
+import numpy as np
+
+from automaxlair.image_processing import crop
+from automaxlair.path_icons import (
+    MIN_LOCAL_MARGIN, MIN_LOCAL_SCORE, PathIconMatcher, threshold_icons)
+
+# Rectangles used by DAController.
+PATHS_4_RECTS = (
+    ((0.1, 0), (0.28, 1)),
+    ((0.28, 0), (0.5, 1)),
+    ((0.5, 0), (0.75, 1)),
+    ((0.75, 0), (1, 1)),
+)
+TYPE_ICON_PATH = join(base_dir, 'data', 'type_icons.pickle')
+NUM_SYNTHETIC = 10
+
+
+def draw_path_screen(type_icons, rng):
+    """Draw a frame with a random type icon on a coloured disc in each slice,
+    white paths between them, and some white specks.
+    """
+
+    frame = rng.integers(0, 90, (1080, 1920, 3), dtype=np.uint8)
+    for (x1, __), (x2, __) in PATHS_4_RECTS:
+        icon = list(type_icons.values())[rng.integers(len(type_icons))]
+        x = int(rng.integers(x1 * 1920 + 30, x2 * 1920 - 90))
+        y = int(rng.integers(150, 850))
+        cv2.circle(
+            frame, (x + 20, y + 20), 34,
+            tuple(int(c) for c in rng.integers(60, 200, 3)), -1)
+        frame[y:y + icon.shape[0], x:x + icon.shape[1]][icon > 0] = 255
+        cv2.line(frame, (x + 20, y + 70), (x + 20, y + 160), (255,) * 3, 3)
+    for __ in range(30):
+        x, y = int(rng.integers(1920)), int(rng.integers(1080))
+        frame[y:y + 2, x:x + 2] = 255
+    return frame
+
+
+def main():
+    with open(TYPE_ICON_PATH, 'rb') as file:
+        type_icons = pickle.load(file)
+    matcher = PathIconMatcher(type_icons)
+
+    if len(sys.argv) > 1:
+        frames = [cv2.imread(path) for path in sys.argv[1:]]
+    else:
+        rng = np.random.default_rng(0)
+        frames = [
+            draw_path_screen(type_icons, rng) for __ in range(NUM_SYNTHETIC)]
+
+    exhaustive_times = []
+    fast_times = []
+    mismatches = 0
+    fallbacks = 0
+    for frame in frames:
+        slices = [crop(frame, rect) for rect in PATHS_4_RECTS]
+        for img in slices:
+            __, score, __, runner_up = matcher.match_locally(
+                threshold_icons(img), matcher.get_templates(img.shape[0]))
+            if (
+                score < MIN_LOCAL_SCORE
+                or score - runner_up < MIN_LOCAL_MARGIN
+            ):
+                fallbacks += 1
+        start_time = time.perf_counter()
+        exhaustive = [matcher.identify(img, exhaustive=True) for img in slices]
+        exhaustive_times.append(time.perf_counter() - start_time)
+        start_time = time.perf_counter()
+        fast = [matcher.identify(img) for img in slices]
+        fast_times.append(time.perf_counter() - start_time)
+        for (old_type, (old_score, old_loc)), (type_id, (score, loc)) in zip(
+            exhaustive, fast
+        ):
+            if (old_type, old_loc) != (type_id, loc) or (
+                abs(old_score - score) > 1e-4
+            ):
+                mismatches += 1
+                print(f'Exhaustive: {old_type} {old_score:.3f} {old_loc}, '
+                      f'blob search: {type_id} {score:.3f} {loc}')
+
+    print(f'{len(frames) * len(PATHS_4_RECTS) - mismatches}/'
+          f'{len(frames) * len(PATHS_4_RECTS)} icons identified the same way.')
+    print(f'{fallbacks} icons were searched for in the whole slice.')
+    print(f'Exhaustive search: {np.mean(exhaustive_times) * 1000:.1f} ms '
+          'per stage')
+    print(f'Blob search:       {np.mean(fast_times) * 1000:.1f} ms per stage')
+
+
+if __name__ == '__main__':
+    main()
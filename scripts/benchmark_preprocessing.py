@@ -0,0 +1,87 @@
+"""Benchmark cropping regions before processing them against processing the
+whole frame first, as the detection methods used to do.
+
+Both versions are checked to give identical results on a random frame, and
+the mean time per call is printed for a few representative regions.
+"""
+
+import sys
+import timeit
+from os.path import abspath, dirname
+
+base_dir = dirname(dirname(abspath(__file__)))
+sys.path.insert(1, base_dir)
+
+import cv2
+import numpy as np
+
+from automaxlair.image_processing import (
+    TEXT_LOWER_HSV, TEXT_UPPER_HSV, get_HSV_mask_mean, preprocess_text_region)
+
+REGIONS = {
+    'den_text_rect': ((0.27, 0.80), (0.72, 0.92)),
+    'battle_text_rect': ((0.05, 0.805), (0.95, 0.95)),
+    'menu_rect_1': ((0.84, 0.685), (0.91, 0.695)),
+    'item_rect_1': ((0.549, 0.11), (0.745, 0.16)),
+    'ball_num_rect': ((0.915, 0.63), (0.95, 0.68)),
+}
+NUM_CALLS = 200
+
+
+def slice_full_frame(img, rect):
+    h, w = img.shape[:2]
+    return img[round(rect[0][1] * h):round(rect[1][1] * h),
+               round(rect[0][0] * w):round(rect[1][0] * w)]
+
+
+def preprocess_full_frame(img, rect, threshold=True, invert=False):
+    if threshold:
+        img = cv2.inRange(
+            cv2.cvtColor(img, cv2.COLOR_BGR2HSV), TEXT_LOWER_HSV,
+            TEXT_UPPER_HSV)
+    if invert:
+        img = cv2.bitwise_not(img)
+    return slice_full_frame(img, rect)
+
+
+def HSV_mask_mean_full_frame(img, rect, lower, upper):
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    return cv2.inRange(slice_full_frame(img, rect), lower, upper).mean()
+
+
+def time_per_call(func):
+    return timeit.timeit(func, number=NUM_CALLS) / NUM_CALLS * 1e6
+
+
+def main():
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    lower, upper = (0, 0, 0), (180, 60, 255)
+
+    print(f'{"region":<18}{"operation":<14}{"full frame":>14}{"ROI first":>14}')
+    for name, rect in REGIONS.items():
+        for threshold, invert in ((True, False), (True, True), (False, True)):
+            assert np.array_equal(
+                preprocess_full_frame(frame, rect, threshold, invert),
+                preprocess_text_region(frame, rect, threshold, invert))
+        assert HSV_mask_mean_full_frame(frame, rect, lower, upper) == (
+            get_HSV_mask_mean(frame, rect, lower, upper))
+
+        old_text = time_per_call(
+            lambda: preprocess_full_frame(frame, rect, invert=True))
+        new_text = time_per_call(
+            lambda: preprocess_text_region(frame, rect, invert=True))
+        old_HSV = time_per_call(
+            lambda: HSV_mask_mean_full_frame(frame, rect, lower, upper))
+        new_HSV = time_per_call(
+            lambda: get_HSV_mask_mean(frame, rect, lower, upper))
+        print(
+            f'{name:<18}{"read_text":<14}{old_text:>11.0f} us'
+            f'{new_text:>11.0f} us')
+        print(
+            f'{name:<18}{"HSV match":<14}{old_HSV:>11.0f} us'
+            f'{new_HSV:>11.0f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Benchmark detecting battle and den states with a StateDetector against
+running each check_rect_HSV_match call separately.
+
+Pass screenshots to benchmark them; otherwise synthetic frames are drawn for
+every state, along with frames whose means are just below the thresholds.
+Both versions are checked to compute the same mean for every check and to
+detect the same states, and the mean time per poll is printed.
+
+    python scripts/benchmark_state_detection.py [screenshot ...]
+"""
+
+import sys
+import timeit
+from os.path import abspath, dirname
+
+base_dir = dirname(dirname(abspath(__file__)))
+sys.path.insert(1, base_dir)
+
+import cv2
+import numpy as np
+
+from automaxlair.image_processing import Frame, get_pixel_bounds
+from automaxlair.state_detection import RegionCheck, StateDetector
+
+# Rectangles used by DAController.
+MENU_RECT_1 = ((0.84, 0.685), (0.91, 0.695))
+MENU_RECT_2 = ((0.92, 0.69), (0.98, 0.75))
+MENU_RECT_3 = ((0.82, 0.85), (0.98, 0.88))
+MENU_RECT_4 = ((0.82, 0.93), (0.98, 0.96))
+BATTLE_TEXT_RECT = ((0.05, 0.805), (0.95, 0.95))
+DEN_TEXT_RECT = ((0.27, 0.80), (0.72, 0.92))
+FULL_RECT = ((0, 0), (1, 1))
+
+BLACK_SCREEN = RegionCheck(FULL_RECT, (0, 0, 0), (180, 255, 10), 250)
+MENU_OPEN = RegionCheck(MENU_RECT_1, (0, 0, 0), (180, 10, 10), 240)
+BATTLE_DETECTOR = StateDetector((
+    ('LOSS', (BLACK_SCREEN,)),
+    ('FIGHT', (MENU_OPEN, RegionCheck(
+        MENU_RECT_2, (170, 120, 0), (180, 255, 255), 20))),
+    ('CHEER', (MENU_OPEN, RegionCheck(
+        MENU_RECT_2, (95, 220, 120), (105, 255, 255), 20))),
+    ('CATCH', (
+        RegionCheck(MENU_RECT_3, (0, 0, 0), (180, 5, 10), 180),
+        RegionCheck(MENU_RECT_4, (0, 0, 250), (180, 5, 255), 20))),
+    ('text', (RegionCheck(
+        BATTLE_TEXT_RECT, (0, 0, 0), (180, 60, 255), 240),)),
+))
+DEN_DETECTOR = StateDetector((
+    ('battle', (BLACK_SCREEN,)),
+    ('text', (RegionCheck(DEN_TEXT_RECT, (0, 0, 0), (180, 55, 255), 220),)),
+))
+NUM_POLLS = 200
+
+
+def check(frame, rect, lower, upper, threshold):
+    return frame.get_HSV_mask_mean(rect, lower, upper) > threshold
+
+
+def old_battle_state(img):
+    """The checks made by read_in_battle_state before StateDetector, without
+    the black screen debounce or OCR.
+    """
+
+    frame = Frame(img)
+    if check(frame, FULL_RECT, (0, 0, 0), (180, 255, 10), 250):
+        return 'LOSS'
+    if check(frame, MENU_RECT_1, (0, 0, 0), (180, 10, 10), 240):
+        if check(frame, MENU_RECT_2, (170, 120, 0), (180, 255, 255), 20):
+            return 'FIGHT'
+        elif check(frame, MENU_RECT_2, (95, 220, 120), (105, 255, 255), 20):
+            return 'CHEER'
+    if check(frame, MENU_RECT_3, (0, 0, 0), (180, 5, 10), 180) and check(
+        frame, MENU_RECT_4, (0, 0, 250), (180, 5, 255), 20
+    ):
+        return 'CATCH'
+    if check(frame, BATTLE_TEXT_RECT, (0, 0, 0), (180, 60, 255), 240):
+        return 'text'
+    return None
+
+
+def old_den_state(img):
+    """The checks made by read_in_den_state before StateDetector."""
+    frame = Frame(img)
+    if check(frame, FULL_RECT, (0, 0, 0), (180, 255, 10), 250):
+        return 'battle'
+    if check(frame, DEN_TEXT_RECT, (0, 0, 0), (180, 55, 255), 220):
+        return 'text'
+    return None
+
+
+def fill(img, rect, bgr):
+    top, bottom, left, right = get_pixel_bounds(rect, *img.shape[:2])
+    img[top:bottom, left:right] = bgr
+
+
+def draw_text_box(img, rect):
+    fill(img, rect, (250, 250, 250))
+    top, bottom, left, right = get_pixel_bounds(rect, *img.shape[:2])
+    cv2.putText(
+        img, 'What will you do?', (left + 20, (top + bottom) // 2),
+        cv2.FONT_HERSHEY_SIMPLEX, 1.5, (30, 30, 30), 3)
+
+
+def make_frames():
+    rng = np.random.default_rng(0)
+
+    def background():
+        # Saturated noise that doesn't pass any of the checks.
+        hsv = np.stack((
+            rng.integers(0, 180, (1080, 1920)),
+            rng.integers(150, 256, (1080, 1920)),
+            rng.integers(120, 256, (1080, 1920))), axis=-1).astype(np.uint8)
+        return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+    frames = {}
+    frames['LOSS'] = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    for state, colour in (('FIGHT', (20, 0, 200)), ('CHEER', (200, 160, 0))):
+        img = background()
+        fill(img, MENU_RECT_1, (0, 0, 0))
+        fill(img, MENU_RECT_2, colour)
+        frames[state] = img
+    img = background()
+    fill(img, MENU_RECT_3, (0, 0, 0))
+    fill(img, MENU_RECT_4, (255, 255, 255))
+    frames['CATCH'] = img
+    img = background()
+    draw_text_box(img, BATTLE_TEXT_RECT)
+    frames['text'] = img
+    frames[None] = background()
+
+    # A fade to black with a bright logo covering just over 2% of the frame,
+    # and a menu whose thin first rectangle is only partly black.
+    img = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    img[500:580, 700:1250] = 255
+    frames['logo'] = img
+    img = background()
+    fill(img, MENU_RECT_1, (0, 0, 0))
+    top, bottom, left, right = get_pixel_bounds(MENU_RECT_1, 1080, 1920)
+    img[top:bottom, left:left + (right - left) // 16] = 255
+    fill(img, MENU_RECT_2, (20, 0, 200))
+    frames['thin'] = img
+    return frames
+
+
+def load_frames(paths):
+    frames = {}
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            raise FileNotFoundError(f'Could not read {path}.')
+        frames[path] = img
+    return frames
+
+
+def time_per_poll(func):
+    return timeit.timeit(func, number=NUM_POLLS) / NUM_POLLS * 1e6
+
+
+def check_means(detector, img):
+    """Assert that the detector computes the same mean as
+    Frame.get_HSV_mask_mean for every check.
+    """
+
+    frame = Frame(img)
+    for region_check, mean in detector.get_means(img).items():
+        expected = frame.get_HSV_mask_mean(
+            region_check.rect, region_check.lower_threshold,
+            region_check.upper_threshold)
+        assert mean == expected, (region_check, mean, expected)
+
+
+def main():
+    if len(sys.argv) > 1:
+        frames = load_frames(sys.argv[1:])
+    else:
+        frames = make_frames()
+    print(f'{"frame":<8}{"old state":<11}{"new state":<11}'
+          f'{"old":>10}{"new":>10}')
+    for detector_name, old_func, detector in (
+        ('battle', old_battle_state, BATTLE_DETECTOR),
+        ('den', old_den_state, DEN_DETECTOR)
+    ):
+        print(f'{detector_name} detection')
+        for name, img in frames.items():
+            check_means(detector, img)
+            old_state = old_func(img)
+            new_state = detector.detect(Frame(img))
+            assert old_state == new_state, (name, old_state, new_state)
+            old_time = time_per_poll(lambda: old_func(img))
+            new_time = time_per_poll(lambda: detector.detect(Frame(img)))
+            print(
+                f'{str(name):<8}{str(old_state):<11}{str(new_state):<11}'
+                f'{old_time:>7.0f} us{new_time:>7.0f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,6 @@
+import build_move_policy
+import build_path_tree
+import export_binary_data
 import package_pokemon
 import score_pokemon
 import time
@@ -12,3 +15,18 @@ if __name__ == '__main__':
     score_pokemon.main()
     end = time.time()
     print(f'score_pokemon took {end - start}')
+
+    start = time.time()
+    build_path_tree.main()
+    end = time.time()
+    print(f'build_path_tree took {end - start}')
+
+    start = time.time()
+    export_binary_data.main()
+    end = time.time()
+    print(f'export_binary_data took {end - start}')
+
+    start = time.time()
+    build_move_policy.main()
+    end = time.time()
+    print(f'build_move_policy took {end - start}')
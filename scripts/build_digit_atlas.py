@@ -0,0 +1,115 @@
+"""Build the glyph atlas used to read numbers (stats and Poke Ball counts)
+without Tesseract, and check how well it reads a set of labelled screenshots.
+
+The screenshots are listed in a CSV file with one line per number:
+`image path,region,text`, where region is one of the names in REGIONS and
+text is the number shown in that region. Image paths are relative to the
+CSV file. The screenshots should be unannotated captures of the summary and
+bag screens at the resolution the bot will run at.
+
+    python scripts/build_digit_atlas.py samples.csv
+    python scripts/build_digit_atlas.py samples.csv --evaluate
+
+The first command writes data/digit_atlas.npz. The second reads every
+sample with the existing atlas and prints the accuracy, the confidence of
+the least certain correct reading and of the most certain incorrect one (to
+choose DIGIT_MATCH_THRESHOLD), and the time per reading.
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+from os.path import abspath, dirname
+
+base_dir = dirname(dirname(abspath(__file__)))
+sys.path.insert(1, base_dir)
+
+import cv2
+
+from automaxlair.digit_recognition import DigitRecognizer, build_atlas
+from automaxlair.image_processing import Frame
+
+# Same rectangles as in DAController.
+REGIONS = {
+    'attack_stat': ((0.33, 0.29), (0.37, 0.33)),
+    'speed_stat': ((0.22, 0.54), (0.26, 0.58)),
+    'ball_num': ((0.915, 0.63), (0.95, 0.68)),
+}
+ATLAS_PATH = os.path.join(base_dir, 'data', 'digit_atlas.npz')
+
+
+def load_samples(csv_path):
+    """Return the region of each labelled screenshot and its text."""
+    samples = []
+    frames = {}
+    with open(csv_path, newline='', encoding='utf8') as file:
+        for image_path, region, text in csv.reader(file):
+            image_path = os.path.join(dirname(abspath(csv_path)), image_path)
+            if image_path not in frames:
+                img = cv2.imread(image_path)
+                if img is None:
+                    raise FileNotFoundError(f'Could not read {image_path}.')
+                frames[image_path] = Frame(img)
+            samples.append(
+                (frames[image_path].get_gray(REGIONS[region]), text.strip()))
+    return samples
+
+
+def build(samples, atlas_path):
+    recognizer, counts = build_atlas(samples)
+    recognizer.save(atlas_path)
+    print(f'Saved templates of {len(counts)} characters to {atlas_path}.')
+    for character, count in sorted(counts.items()):
+        print(f'  {character}: {count} glyphs')
+    used = sum(counts.values())
+    total = sum(len(text) for __, text in samples)
+    if used < total:
+        print(
+            f'{total - used} glyphs were skipped because their sample could '
+            'not be split into the right number of glyphs.')
+
+
+def evaluate(samples, atlas_path):
+    recognizer = DigitRecognizer.load(atlas_path)
+    correct_scores = []
+    incorrect_scores = []
+    start_time = time.perf_counter()
+    for img, text in samples:
+        read_text, confidence = recognizer.read(img)
+        if read_text == text:
+            correct_scores.append(confidence)
+        else:
+            incorrect_scores.append(confidence)
+            print(f'Read {read_text!r} instead of {text!r} '
+                  f'(confidence {confidence:.2f})')
+    run_time = (time.perf_counter() - start_time) / len(samples)
+    print(f'{len(correct_scores)}/{len(samples)} samples read correctly, '
+          f'{run_time * 1000:.2f} ms per sample.')
+    if correct_scores:
+        print(f'Lowest confidence of a correct reading: '
+              f'{min(correct_scores):.2f}')
+    if incorrect_scores:
+        print(f'Highest confidence of an incorrect reading: '
+              f'{max(incorrect_scores):.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('samples', help='CSV file of labelled screenshots')
+    parser.add_argument(
+        '--evaluate', action='store_true',
+        help='read the samples with the existing atlas instead of building it')
+    parser.add_argument('--atlas', default=ATLAS_PATH, help='atlas path')
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    if args.evaluate:
+        evaluate(samples, args.atlas)
+    else:
+        build(samples, args.atlas)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Build the move policy table. Scores every move of each rental Pokemon
+against every boss and rental Pokemon, with and without Dynamax, so that the
+bot can look up its move decisions during battles instead of computing them.
+"""
+
+import copy
+import logging
+import multiprocessing as mp
+import os
+import sys
+import time
+
+from os.path import dirname, abspath
+
+import jsonpickle
+import numpy as np
+
+# We need to import some things from the parent directory.
+base_dir = dirname(dirname(abspath(__file__)))
+sys.path.insert(1, base_dir)
+
+# Needs to be lower than path insert.
+from automaxlair import matchup_scoring  # noqa: E402
+from automaxlair.binary_data import hash_source_file  # noqa: E402
+from automaxlair.move_policy import save_move_policy  # noqa: E402
+
+LOG_NAME = 'buildMovePolicy'
+MAX_NUM_THREADS = mp.cpu_count() - 1
+RENTAL_PATH = os.path.join(base_dir, 'data', 'rental_pokemon.json')
+BOSS_PATH = os.path.join(base_dir, 'data', 'boss_pokemon.json')
+MAX_MOVES = 4
+
+
+def compute_move_scores(attacker_id):
+    """Return the score of each move of a rental Pokemon against all boss and
+    rental Pokemon, as an array with shape (defender, dynamax, move).
+    """
+
+    attacker = copy.copy(rental_pokemon[attacker_id])
+    scores = np.full((len(defenders), 2, MAX_MOVES), np.nan)
+    for j, defender in enumerate(defenders):
+        for k, dynamax in enumerate((False, True)):
+            attacker.dynamax = dynamax
+            for move_index in range(len(attacker.moves)):
+                scores[j, k, move_index] = (
+                    matchup_scoring.calculate_move_score(
+                        attacker, move_index, defender, teammates))
+    logging.getLogger(LOG_NAME).info(
+        'Finished computing moves for %s', attacker_id)
+    return scores
+
+
+def worker_init():
+    """Load the Pokemon data used by every call to compute_move_scores."""
+    global rental_pokemon, defenders, teammates
+    with open(RENTAL_PATH, 'r', encoding='utf8') as file:
+        rental_pokemon = jsonpickle.decode(file.read())
+    with open(BOSS_PATH, 'r', encoding='utf8') as file:
+        boss_pokemon = jsonpickle.decode(file.read())
+    defenders = list(boss_pokemon.values()) + list(rental_pokemon.values())
+    teammates = matchup_scoring.TeammateAggregates(rental_pokemon)
+
+
+def main():
+    logging.basicConfig(
+        format='%(asctime)s | %(name)s | %(levelname)s: %(message)s',
+        level=logging.INFO)
+
+    with open(RENTAL_PATH, 'r', encoding='utf8') as file:
+        rental_pokemon = jsonpickle.decode(file.read())
+    with open(BOSS_PATH, 'r', encoding='utf8') as file:
+        boss_pokemon = jsonpickle.decode(file.read())
+    attacker_names = list(rental_pokemon)
+    defender_names = list(boss_pokemon) + list(rental_pokemon)
+
+    with mp.Pool(max(1, MAX_NUM_THREADS), worker_init) as pool:
+        scores = np.stack(pool.map(compute_move_scores, attacker_names))
+
+    save_move_policy(
+        os.path.join(base_dir, 'data', 'move_policy.npz'), attacker_names,
+        defender_names, scores,
+        [hash_source_file(RENTAL_PATH), hash_source_file(BOSS_PATH)])
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    main()
+    logging.getLogger(LOG_NAME).info(
+        f'Finished building the move policy in '
+        f'{time.time() - start_time:.0f} s.')
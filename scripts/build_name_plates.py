@@ -0,0 +1,122 @@
+"""Add the name plates of rental Pokemon to the name plate file used to
+identify opponents during battles, and check how well the file identifies a
+set of labelled screenshots.
+
+The screenshots are listed in a CSV file with one line per screenshot:
+`image path,name_id`, where name_id is the rental Pokemon fought in the
+screenshot. Image paths are relative to the CSV file. The screenshots should
+be unannotated captures of the battle menu (with "Fight" selected) at the
+resolution the bot will run at, taken with the game in the given language.
+
+    python scripts/build_name_plates.py samples.csv --lang en
+    python scripts/build_name_plates.py samples.csv --lang en --evaluate
+
+The first command adds the plates of names that aren't in
+data/name_plates.npz yet. If LEARN_NAME_PLATES is enabled, the bot also adds
+plates by itself whenever it has to identify an opponent from its summary. The second command identifies
+every sample and prints the accuracy, the scores of correct and incorrect
+matches (to choose NAME_PLATE_MATCH_THRESHOLD), and the time per match.
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+from os.path import abspath, dirname
+
+base_dir = dirname(dirname(abspath(__file__)))
+sys.path.insert(1, base_dir)
+
+import cv2
+import jsonpickle
+
+from automaxlair.image_processing import Frame
+from automaxlair.name_plate_index import (
+    load_name_plates, save_name_plates)
+
+# Same rectangle as in DAController.
+NAME_PLATE_RECT = ((0.03, 0.025), (0.25, 0.075))
+NAME_PLATE_PATH = os.path.join(base_dir, 'data', 'name_plates.npz')
+RENTAL_PATH = os.path.join(base_dir, 'data', 'rental_pokemon.json')
+
+
+def load_samples(csv_path, lang):
+    """Return the text mask of the name region of each labelled screenshot
+    and the name of the Pokemon in it.
+    """
+
+    with open(RENTAL_PATH, 'r', encoding='utf8') as file:
+        rental_pokemon = jsonpickle.decode(file.read())
+    samples = []
+    with open(csv_path, newline='', encoding='utf8') as file:
+        for image_path, name_id in csv.reader(file):
+            image_path = os.path.join(dirname(abspath(csv_path)), image_path)
+            img = cv2.imread(image_path)
+            if img is None:
+                raise FileNotFoundError(f'Could not read {image_path}.')
+            samples.append((
+                Frame(img).get_text_region(NAME_PLATE_RECT),
+                rental_pokemon[name_id.strip()].names[lang]))
+    return samples
+
+
+def build(samples, index, file_path):
+    num_plates = len(index)
+    for mask, name in samples:
+        if name not in index and cv2.countNonZero(mask) > 0:
+            index.add(name, mask)
+    save_name_plates(file_path, index)
+    print(f'Added {len(index) - num_plates} name plates to {file_path} '
+          f'({len(index)} name plates in {index.lang}).')
+
+
+def evaluate(samples, index):
+    correct_scores = []
+    incorrect_scores = []
+    margins = []
+    start_time = time.perf_counter()
+    for mask, name in samples:
+        matched_name, score, runner_up = index.match(mask)
+        if matched_name == name:
+            correct_scores.append(score)
+            margins.append(score - runner_up)
+        else:
+            incorrect_scores.append(score)
+            print(f'Matched {matched_name} instead of {name} '
+                  f'(score {score:.2f})')
+    run_time = (time.perf_counter() - start_time) / len(samples)
+    print(f'{len(correct_scores)}/{len(samples)} samples matched correctly, '
+          f'{run_time * 1000:.2f} ms per sample.')
+    if correct_scores:
+        print(f'Lowest score of a correct match: {min(correct_scores):.2f} '
+              f'(smallest margin {min(margins):.2f})')
+    if incorrect_scores:
+        print(f'Highest score of an incorrect match: '
+              f'{max(incorrect_scores):.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('samples', help='CSV file of labelled screenshots')
+    parser.add_argument(
+        '--lang', default='en',
+        help='language of the game, as in DATA_LANG_NAME (default en)')
+    parser.add_argument(
+        '--evaluate', action='store_true',
+        help='match the samples against the existing name plates instead '
+        'of adding them')
+    parser.add_argument(
+        '--plates', default=NAME_PLATE_PATH, help='name plate file path')
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples, args.lang)
+    index = load_name_plates(args.plates, args.lang)
+    if args.evaluate:
+        evaluate(samples, index)
+    else:
+        build(samples, index, args.plates)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ to update store all path possiblities that might arise while returning
 simple score values.
 """
 
+import multiprocessing as mp
 import sys
 from os.path import abspath, dirname, join
 
@@ -12,32 +13,49 @@ base_dir = dirname(dirname(abspath(__file__)))
 sys.path.insert(1, base_dir)
 
 import jsonpickle
-from automaxlair.path_tree import PathTree
+import numpy as np
 
+from automaxlair import matchup_scoring
+from automaxlair.path_tree import PathTree, calculate_path_scores
 
-def argmax(pairs):
-    """Function to return the argmax of a set of pairs"""
-    return max(pairs, key=lambda x: x[1])[0]
+MAX_NUM_THREADS = mp.cpu_count() - 1
 
 
-def argmax_index(values):
-    """Function to take advantage of argmax so you can use one list"""
-    return argmax(enumerate(values))
+def worker_init():
+    """Load the Pokemon used by every call to compute_path_scores."""
+    global rental_pokemon, boss_pokemon, teammates
+    with open(join(base_dir, 'data', 'rental_pokemon.json'), 'r', encoding='utf8') as file:
+        rental_pokemon = jsonpickle.decode(file.read())
+    with open(join(base_dir, 'data', 'boss_pokemon.json'), 'r', encoding='utf8') as file:
+        boss_pokemon = jsonpickle.decode(file.read())
+    teammates = matchup_scoring.TeammateAggregates(rental_pokemon)
 
 
-if __name__ == "__main__":
+def compute_path_scores(boss_name):
+    """Score every path against a single boss. Called by the process pool."""
+    boss = boss_pokemon[boss_name]
+    boss_matchups = [
+        matchup_scoring.evaluate_matchup(rental, boss, teammates)
+        for rental in rental_pokemon.values()]
+    print(f'Calculated path scores for {boss_name}')
+    return calculate_path_scores(
+        boss_matchups, [rental.type_ids for rental in rental_pokemon.values()])
 
-    with open(join(base_dir, 'data', 'rental_pokemon.json'), 'r', encoding='utf8') as file:
-        rental_pokemon = jsonpickle.decode(file.read())
 
+def main():
     with open(join(base_dir, 'data', 'boss_pokemon.json'), 'r', encoding='utf8') as file:
-        boss_pokemon = jsonpickle.decode(file.read())
+        boss_names = list(jsonpickle.decode(file.read()))
+
+    with mp.Pool(max(1, MAX_NUM_THREADS), worker_init) as pool:
+        scores = np.stack(pool.map(compute_path_scores, boss_names))
+    tree = PathTree(boss_names, scores)
+    tree.save(join(base_dir, 'data', 'path_tree.npz'))
+    return tree
+
 
-    tree = PathTree(rental_pokemon=rental_pokemon, boss_pokemon=boss_pokemon)
+if __name__ == "__main__":
 
-    # save the tree to pickle
-    with open(join(base_dir, 'data', 'path_tree.json'), 'w', encoding='utf8') as file:
-        file.write(jsonpickle.encode(tree, indent=4))
+    tree = main()
 
     legendary = 'articuno'
 
@@ -51,14 +69,10 @@ if __name__ == "__main__":
         ['fire', 'rock', 'fire']
     ]
 
-    path_scores = []
-
-    for test_path in test_paths:
-        path_scores.append(tree.score_path(legendary, test_path))
+    best_idx, best_path, path_scores = tree.get_best_path(
+        legendary, test_paths)
 
     print(path_scores)
 
-    best_idx = argmax_index(path_scores)
-
     print(
-        f"Best path found to be {test_paths[best_idx]} with score {path_scores[best_idx]} for {legendary}")
+        f"Best path found to be {best_path} with score {path_scores[best_idx]} for {legendary}")
@@ -0,0 +1,53 @@
+"""Export the precalculated Pokemon data to the compact binary format.
+
+The jsonpickle files remain the source of truth. This script flattens them
+into `data/pokemon_data.npz`, which is loaded instead of the jsonpickle files
+when it is up to date (see automaxlair/binary_data.py). Run this script
+whenever the data files are regenerated.
+"""
+
+import os
+import sys
+import time
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, base_dir)
+
+import jsonpickle
+
+from automaxlair.binary_data import BinaryDataWriter, hash_source_file
+
+SOURCE_FILES = (
+    'boss_pokemon.json', 'rental_pokemon.json', 'boss_matchup_LUT.json',
+    'rental_matchup_LUT.json', 'rental_pokemon_scores.json')
+
+
+def main():
+    start_time = time.time()
+    source_paths = [
+        os.path.join(base_dir, 'data', file_name)
+        for file_name in SOURCE_FILES]
+    data = []
+    for path in source_paths:
+        with open(path, 'r', encoding='utf8') as file:
+            data.append(jsonpickle.decode(file.read()))
+    (
+        boss_pokemon, rental_pokemon, boss_matchups, rental_matchups,
+        rental_scores
+    ) = data
+
+    writer = BinaryDataWriter()
+    writer.add_pokemon('boss', boss_pokemon)
+    writer.add_pokemon('rental', rental_pokemon)
+    writer.add_matchups('boss_matchups', boss_matchups)
+    writer.add_matchups('rental_matchups', rental_matchups)
+    writer.add_scores('rental_scores', rental_scores)
+    writer.save(
+        os.path.join(base_dir, 'data', 'pokemon_data.npz'),
+        [hash_source_file(path) for path in source_paths])
+
+    print(f'Exported binary data in {time.time() - start_time:.2f} s.')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 
 import sys
 import jsonpickle
+import numpy as np
 
 # We need to import some class definitions from the parent directory.
 from os.path import dirname, abspath
@@ -84,6 +85,45 @@ def main():
     matchup_scoring.print_matchup_summary(
         rental_pokemon['tsareena'], rental_pokemon['azumarill'], rental_pokemon
     )
+    print('________________________________________')
+
+    # Check the vectorized damage kernel against the scalar reference. Any
+    # difference fails the script.
+    all_pokemon = list(rental_pokemon.values()) + list(boss_pokemon.values())
+    batch = matchup_scoring.PokemonBatch(all_pokemon)
+    for multiple_targets in (False, True):
+        damage = matchup_scoring.calculate_damage_batch(
+            batch, batch, multiple_targets)
+        vectorized = []
+        scalar = []
+        for i, attacker in enumerate(all_pokemon):
+            for j in range(len(attacker.moves)):
+                for k, defender in enumerate(all_pokemon):
+                    vectorized.append(damage[i, j, k])
+                    scalar.append(matchup_scoring.calculate_damage(
+                        attacker, j, defender, multiple_targets))
+        np.testing.assert_allclose(
+            vectorized, scalar, rtol=1e-9, atol=0,
+            err_msg='Vectorized damage differs from calculate_damage '
+            f'(multiple targets: {multiple_targets})')
+        print(
+            f'Vectorized damage matches calculate_damage for {len(scalar)} '
+            f'combinations (multiple targets: {multiple_targets}).')
+
+    # Test the teammate aggregates against the scalar averages.
+    teammates = matchup_scoring.TeammateAggregates(rental_pokemon)
+    groudon = {'groudon': boss_pokemon['groudon']}
+    dealt = matchup_scoring.calculate_average_damage(rental_pokemon, groudon)
+    received = matchup_scoring.calculate_average_damage(
+        groudon, rental_pokemon)
+    print(
+        'Average teammate damage against Groudon: '
+        f'{teammates.get_damage_dealt(groudon["groudon"])} (aggregate), '
+        f'{dealt} (scalar)')
+    print(
+        'Average damage of Groudon against teammates: '
+        f'{teammates.get_damage_received(groudon["groudon"])} (aggregate), '
+        f'{received} (scalar)')
 
 
 if __name__ == '__main__':
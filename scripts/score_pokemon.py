@@ -44,23 +44,12 @@ def compute_scores(attacker):
 
     attacker_id = attacker.name_id
 
-    # Load a separate dictionary for each process because elements get popped
-    # and re-added during the matchup scoring process.
-    with open(
-        base_dir + '/data/rental_pokemon.json', 'r', encoding='utf8'
-    ) as file:
-        rental_pokemon = jsonpickle.decode(file.read())
-    with open(
-        base_dir + '/data/boss_pokemon.json', 'r', encoding='utf8'
-    ) as file:
-        boss_pokemon = jsonpickle.decode(file.read())
-
     # First iterate through all boss Pokemon and score the interactions.
     boss_matchups = {}
     for defender_id in tuple(boss_pokemon):
         defender = boss_pokemon[defender_id]
         score = matchup_scoring.evaluate_matchup(
-            attacker, defender, rental_pokemon
+            attacker, defender, teammates
         )
         boss_matchups[defender_id] = score
         logger.debug(
@@ -73,7 +62,7 @@ def compute_scores(attacker):
     for defender_id in tuple(rental_pokemon):
         defender = rental_pokemon[defender_id]
         score = matchup_scoring.evaluate_matchup(
-            attacker, defender, rental_pokemon
+            attacker, defender, teammates
         )
         rental_matchups[defender_id] = score
         # We sum the attacker's score which will later be normalized.
@@ -93,7 +82,7 @@ def compute_scores(attacker):
 
 def worker_init(q):
     """Basic function that initializes the thread workers to know where to send
-    logs to.
+    logs to and loads the Pokemon data used by every call to compute_scores.
     Parameters:
         q (multiprocessing.Queue): The queue object used for  multiprocessing.
     """
@@ -104,6 +93,20 @@ def worker_init(q):
     logger.setLevel(logging.DEBUG if ENABLE_DEBUG_LOGS else logging.INFO)
     logger.addHandler(qh)
 
+    # Load the Pokemon once per process. The teammate aggregates cache the
+    # contributions of the whole rental pool against each defender, so they
+    # are shared by all attackers scored in this process.
+    global rental_pokemon, boss_pokemon, teammates
+    with open(
+        base_dir + '/data/rental_pokemon.json', 'r', encoding='utf8'
+    ) as file:
+        rental_pokemon = jsonpickle.decode(file.read())
+    with open(
+        base_dir + '/data/boss_pokemon.json', 'r', encoding='utf8'
+    ) as file:
+        boss_pokemon = jsonpickle.decode(file.read())
+    teammates = matchup_scoring.TeammateAggregates(rental_pokemon)
+
 
 def main():
     """Main function that loads the Pokemon data files, uses a multiprocessing